@@ -1,59 +1,66 @@
-from langchain.chat_models import ChatOpenAI
-from langchain.embeddings import HuggingFaceEmbeddings
+import time
+
+_import_start = time.perf_counter()
+
 from langchain.vectorstores import CrateDB
 from langchain.chains import RetrievalQA
 from langchain.prompts import PromptTemplate
-from langchain.cache import CrateDBCache, CrateDBSemanticCache
-from langchain.globals import set_llm_cache
 from opentelemetry import trace, metrics
-from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter
-from opentelemetry.sdk.trace import TracerProvider
-from opentelemetry.sdk.trace.export import BatchSpanProcessor
-from opentelemetry.instrumentation.langchain import LangchainInstrumentor
-from opentelemetry.sdk.metrics import MeterProvider
-from opentelemetry.sdk.metrics.export import PeriodicExportingMetricReader
-from opentelemetry.exporter.prometheus import PrometheusMetricReader
+from prometheus_client import start_http_server
+import asyncio
 import logging
 import logging_loki
-import time
 import socket
 import os
 from dotenv import load_dotenv
 from app.config import config
+from app.concurrency import run_sync
+from app.chatbot.backend import prompt_version
+from app.resources import ResourceRegistry
+from app.embeddings.context import embedding_context
+from app.llms.gateway import LLMGateway
+from app.monitoring.metrics import MetricsManager, setup_prometheus, setup_tracing
+from app.monitoring.interactions import InteractionWriter
 
 # Load environment variables
 load_dotenv()
 
-# Set up Loki handler
-loki_handler = logging_loki.LokiHandler(
-    url=config.observability.loki_url,
-    tags={
-        "service": "rag-assistant-bootstrap",
-        "host": socket.gethostname()
-    },
-    version="1",
-)
-
-# Configure logging
-logging.basicConfig(
-    level=config.observability.log_level,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
 logger = logging.getLogger(__name__)
-logger.addHandler(loki_handler)
-
-# Set up tracing (goes to Tempo)
-tracer_provider = TracerProvider()
-otlp_exporter = OTLPSpanExporter(
-    endpoint=config.observability.tempo_endpoint,
-    insecure=True
-)
-tracer_provider.add_span_processor(BatchSpanProcessor(otlp_exporter))
-trace.set_tracer_provider(tracer_provider)
-LangchainInstrumentor().instrument()
 
-# Set up metrics (goes to Prometheus)
-metrics.set_meter_provider(MeterProvider())
+_metrics_server_started = False
+
+def setup_observability():
+    """Set up logging (Loki), tracing (Tempo) and metrics (Prometheus); safe to call again."""
+    global _metrics_server_started
+    # Set up Loki handler
+    if not any(isinstance(handler, logging_loki.LokiHandler) for handler in logger.handlers):
+        loki_handler = logging_loki.LokiHandler(
+            url=config.observability.loki_url,
+            tags={
+                "service": "rag-assistant-bootstrap",
+                "host": socket.gethostname()
+            },
+            version="1",
+        )
+        
+        # Configure logging
+        logging.basicConfig(
+            level=config.observability.log_level,
+            format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+        )
+        logger.addHandler(loki_handler)
+    
+    # Set up tracing (goes to Tempo)
+    setup_tracing(config.observability.tempo_endpoint)
+    
+    # Set up metrics; the app port's /metrics already serves them, see main.py
+    setup_prometheus()
+    if (not _metrics_server_started
+            and config.observability.prometheus_port != config.server.port):
+        start_http_server(config.observability.prometheus_port)
+        _metrics_server_started = True
+
+# Instruments bind to the meter provider once setup_observability runs
 meter = metrics.get_meter(__name__)
 
 # Create metrics
@@ -81,134 +88,167 @@ error_counter = meter.create_counter(
 
 token_usage = meter.create_counter(
     name="langchain_token_usage_total",
-    description="Total number of tokens used",
-    attributes={"type": "total"}
+    description="Total number of tokens used"
 )
 
-# Initialize embeddings
-embeddings = HuggingFaceEmbeddings(
-    model_endpoint=config.embeddings.endpoint
+embeddings_per_request = meter.create_histogram(
+    name="langchain_embeddings_per_request",
+    description="Number of embeddings computed per request",
 )
 
-# Initialize standard cache (exact matches)
-standard_cache = CrateDBCache(
-    connection_string=config.vector_store.connection_string,
-    table_name=config.vector_store.cache_table
-)
+metrics_manager = MetricsManager()
+
+# Shared CrateDB connection pool and embeddings client (both lazy)
+resources = ResourceRegistry(config, metrics_manager)
 
-# Initialize semantic cache (similar queries)
-semantic_cache = CrateDBSemanticCache(
-    connection_string=config.vector_store.connection_string,
-    table_name=config.vector_store.semantic_cache_table,
-    embedding=embeddings,
-    score_threshold=config.vector_store.semantic_cache_threshold
+# Interactions are buffered and written in bulk off the request path
+interaction_writer = InteractionWriter(
+    config.interactions,
+    resources.execute,
+    metrics_manager
 )
 
-# Set the standard cache as default
-set_llm_cache(standard_cache)
+def _timed(name, factory):
+    """Build a component and record its initialization time."""
+    start_time = time.perf_counter()
+    try:
+        return factory()
+    finally:
+        metrics_manager.record_component_init(name, time.perf_counter() - start_time)
 
-def initialize_llm():
-    """Initialize LLM based on configuration."""
-    if config.llm.type.lower() == "openai":
-        return ChatOpenAI(
-            model=config.llm.openai_model,
-            openai_api_key=config.llm.openai_api_key,
-            temperature=config.llm.temperature
+class Components:
+    """Caches, LLM, vector store and retrieval chain, built on first use."""
+    
+    def __init__(self):
+        embeddings = resources.embeddings
+        
+        # Same cache tables, L1 tier and corpus invalidation as main.py
+        self.gateway = _timed("llm_gateway", lambda: LLMGateway(config, resources, metrics_manager))
+        self.standard_cache = self.gateway.standard_cache
+        self.semantic_cache = self.gateway.semantic_cache
+        self.llm = self.gateway.llm
+        
+        # Connect to CrateDB for vector storage
+        self.vectorstore = _timed("vector_store", lambda: CrateDB(
+            connection=resources.engine,
+            embeddings=embeddings,
+            table_name="documents"
+        ))
+        
+        # Create a retrieval chain
+        self.qa_chain = RetrievalQA.from_chain_type(
+            llm=self.llm.primary,
+            chain_type="stuff",
+            retriever=self.vectorstore.as_retriever(),
+            return_source_documents=True
         )
-    else:  # default to ollama
-        return Ollama(
-            base_url=config.llm.ollama_base_url,
-            model=config.llm.ollama_model,
-            temperature=config.llm.temperature
+        # Cache key part, like ChatbotBackend.prompt_version for main.py's prompt
+        self.prompt_version = prompt_version(
+            self.qa_chain.combine_documents_chain.llm_chain.prompt, config.llm
         )
 
-# Initialize components
-llm = initialize_llm()
-
-# Connect to CrateDB for vector storage
-vectorstore = CrateDB(
-    connection_string=config.vector_store.connection_string,
-    embeddings=embeddings,
-    table_name="documents"
-)
+_components = None
+_components_lock = asyncio.Lock()
 
-# Create a retrieval chain
-qa_chain = RetrievalQA.from_chain_type(
-    llm=llm,
-    chain_type="stuff",
-    retriever=vectorstore.as_retriever(),
-    return_source_documents=True
-)
+async def get_components() -> Components:
+    """Build components on first use, off the event loop."""
+    global _components
+    if _components is None:
+        async with _components_lock:
+            if _components is None:
+                await run_sync(setup_observability)
+                _components = await run_sync(_timed, "components", Components)
+    return _components
 
 async def process_query(query: str):
     start_time = time.time()
     tracer = trace.get_tracer(__name__)
+    embedding_ctx = None
+    components = await get_components()
+    embeddings = resources.embeddings
     
     try:
-        with tracer.start_as_current_span("process_query") as span:
+        with tracer.start_as_current_span("process_query") as span, \
+                embedding_context() as embedding_ctx:
             span.set_attribute("query", query)
             
             # First check standard cache (exact matches)
             with tracer.start_span("standard_cache_lookup") as cache_span:
-                cached_result = standard_cache.lookup(query)
+                cached_result = await run_sync(
+                    components.standard_cache.lookup, query, components.prompt_version
+                )
                 if cached_result:
                     logger.info(f"Standard cache hit for query: {query}")
                     process_time = time.time() - start_time
-                    store_interaction(query, cached_result, process_time, cache_type="standard")
+                    await store_interaction(
+                        query, cached_result, process_time, "standard", components.prompt_version
+                    )
                     return cached_result
 
+            # Embed once; semantic lookup, vector search and cache write reuse it
+            with tracer.start_span("embed_query") as embed_span:
+                embedding = await embeddings.aembed_query(query)
+
             # Then check semantic cache (similar queries)
             with tracer.start_span("semantic_cache_lookup") as cache_span:
-                cached_result = semantic_cache.lookup(query)
+                cached_result = await run_sync(
+                    components.semantic_cache.lookup, query, components.prompt_version
+                )
                 if cached_result:
                     logger.info(f"Semantic cache hit for query: {query}")
                     process_time = time.time() - start_time
-                    store_interaction(query, cached_result, process_time, cache_type="semantic")
+                    await store_interaction(
+                        query, cached_result, process_time, "semantic", components.prompt_version
+                    )
                     return cached_result
 
             # If no cache hit, proceed with normal processing
             llm_requests.add(1)
             
+            # Cached answers are stamped with the version retrieval saw
+            corpus_version = await run_sync(resources.corpus.current)
             with tracer.start_span("qa_chain") as qa_span:
-                result = qa_chain({"query": query})
-                answer = result["result"]
+                documents = await run_sync(
+                    components.vectorstore.similarity_search_by_vector,
+                    embedding,
+                    k=config.vector_store.retrieval_k
+                )
+                answer = await components.qa_chain.combine_documents_chain.arun(
+                    input_documents=documents, question=query
+                )
             
             process_time = time.time() - start_time
             llm_response_time.record(process_time)
             
             # Store in both caches
             with tracer.start_span("cache_store") as cache_span:
-                standard_cache.update(query, answer)
-                semantic_cache.update(query, answer)
+                await run_sync(
+                    components.standard_cache.update, query, components.prompt_version, answer,
+                    corpus_version=corpus_version
+                )
+                await run_sync(
+                    components.semantic_cache.update, query, components.prompt_version, answer,
+                    corpus_version=corpus_version
+                )
             
-            store_interaction(query, answer, process_time, cache_type="none")
+            await store_interaction(query, answer, process_time, "none", components.prompt_version)
             return answer
             
     except Exception as e:
         error_counter.add(1)
         logger.error(f"Error processing query: {str(e)}")
         raise
-
-def store_interaction(query, result, process_time, cache_type="none"):
-    """Store interaction details in CrateDB"""
-    try:
-        with trace.get_tracer(__name__).start_span("store_interaction") as span:
-            vectorstore.client.execute("""
-                INSERT INTO interactions (
-                    query, 
-                    response, 
-                    process_time,
-                    cache_type,
-                    timestamp
-                ) VALUES (?, ?, ?, ?, ?)
-            """, (
-                query,
-                str(result),
-                process_time,
-                cache_type,
-                time.time()
-            ))
-            logger.info(f"Stored interaction with cache_type: {cache_type}")
-    except Exception as e:
-        logger.error(f"Error storing interaction: {str(e)}")
-        error_counter.add(1)
\ No newline at end of file
+    finally:
+        if embedding_ctx is not None:
+            embeddings_per_request.record(embedding_ctx.computed)
+
+async def store_interaction(query, result, process_time, cache_type="none", prompt_version=None):
+    """Queue interaction details for a batched write to CrateDB"""
+    with trace.get_tracer(__name__).start_span("store_interaction") as span:
+        if not await interaction_writer.record(
+            query, result, process_time, cache_type, prompt_version=prompt_version
+        ):
+            logger.warning(f"Interaction log queue full, dropped interaction with cache_type: {cache_type}")
+
+IMPORT_SECONDS = time.perf_counter() - _import_start
+metrics_manager.record_component_init("import", IMPORT_SECONDS)
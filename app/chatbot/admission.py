@@ -0,0 +1,224 @@
+"""Admission control for /query: bounded, prioritized lanes that shed load early."""
+import asyncio
+import heapq
+import itertools
+import math
+import time
+from typing import List, Optional, Tuple
+
+# Fast lane priorities: cache lookups are served before retrievals for misses
+LOOKUP_PRIORITY = 0
+RETRIEVAL_PRIORITY = 1
+# LLM lane priorities: batch items and cache warming wait behind /query generations
+GENERATION_PRIORITY = 0
+BACKGROUND_PRIORITY = 1
+# Slot releases needed before queue waits are estimated from service times
+MIN_SERVICE_SAMPLES = 5
+SERVICE_TIME_DECAY = 0.98
+
+
+class Overloaded(Exception):
+    """A request was shed; ``status_code`` is 429 (queue full) or 503 (too slow)."""
+
+    def __init__(self, lane: str, reason: str, retry_after: int):
+        self.lane = lane
+        self.reason = reason
+        self.retry_after = retry_after
+        self.status_code = 429 if reason == "queue_full" else 503
+        super().__init__(f"The {lane} lane is overloaded ({reason}), retry in {retry_after}s")
+
+
+class Lane:
+    """At most ``max_concurrency`` holders and ``max_queue`` prioritized waiters.
+
+    A request that would wait longer than ``deadline`` seconds, judged by
+    the recent average time a slot is held, is rejected on arrival instead
+    of timing out in the queue; one that still waits past the deadline is
+    rejected then. Lower priority values are served first, FIFO within a
+    priority. Background waiters (``shed=False``) are never rejected and do
+    not count against ``max_queue`` or the estimated wait of others.
+    """
+
+    def __init__(self, name: str, max_concurrency: int, max_queue: int, deadline: float,
+                 metrics=None):
+        self.name = name
+        self.max_concurrency = max(max_concurrency, 1)
+        self.max_queue = max_queue
+        self.deadline = deadline
+        self.metrics = metrics
+        self.active = 0
+        self.queued = 0
+        self.background = 0
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._order = itertools.count()
+        # Decayed slot-seconds held and slots released, for the average service time
+        self._busy = 0.0
+        self._released = 0.0
+        self._samples = 0
+        self._changed_at = time.monotonic()
+
+    def locked(self) -> bool:
+        return self.active >= self.max_concurrency
+
+    def slot(self, priority: int = 0, precheck: Optional["Lane"] = None,
+             shed: bool = True) -> "LaneSlot":
+        return LaneSlot(self, priority, precheck, shed)
+
+    @property
+    def service_time(self) -> Optional[float]:
+        if self._samples < MIN_SERVICE_SAMPLES or not self._released:
+            return None
+        return self._busy / self._released
+
+    def estimated_wait(self, ahead: int) -> float:
+        """Seconds until a request behind ``ahead`` waiters gets a slot."""
+        service_time = self.service_time
+        if service_time is None:
+            return 0.0
+        return (ahead + 1) * service_time / self.max_concurrency
+
+    def retry_after(self) -> int:
+        return max(1, math.ceil(self.estimated_wait(self.queued)))
+
+    def check(self) -> None:
+        """Raise Overloaded if a new request would be shed right now."""
+        if not self.locked():
+            return
+        if self.queued >= self.max_queue:
+            self._shed("queue_full")
+        if self.estimated_wait(self.queued) > self.deadline:
+            self._shed("deadline")
+
+    def _shed(self, reason: str) -> None:
+        if self.metrics:
+            self.metrics.record_admission_shed(self.name, reason)
+        raise Overloaded(self.name, reason, self.retry_after())
+
+    def _account(self, delta: int) -> None:
+        now = time.monotonic()
+        self._busy += self.active * (now - self._changed_at)
+        self._changed_at = now
+        self.active += delta
+        if self.metrics:
+            self.metrics.update_admission_lane(self.name, in_flight=delta)
+
+    async def acquire(self, priority: int = 0, shed: bool = True) -> None:
+        if not self.locked() and not self.queued and not self.background:
+            self._account(1)
+            return
+        if not shed:
+            await self._wait_in_background(priority)
+            return
+        self.check()
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._order), future))
+        self.queued += 1
+        if self.metrics:
+            self.metrics.update_admission_lane(self.name, queued=1)
+        start_time = time.perf_counter()
+        try:
+            await asyncio.wait_for(future, self.deadline)
+        except asyncio.TimeoutError:
+            if not future.done() or future.cancelled():
+                self._shed("timeout")
+        except BaseException:
+            # Cancelled after being handed a slot: pass it on
+            if future.done() and not future.cancelled():
+                self.release()
+            raise
+        finally:
+            self.queued -= 1
+            if self.metrics:
+                self.metrics.update_admission_lane(self.name, queued=-1)
+                self.metrics.record_admission_wait(self.name, time.perf_counter() - start_time)
+
+    async def _wait_in_background(self, priority: int) -> None:
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._order), future))
+        self.background += 1
+        try:
+            await future
+        except BaseException:
+            if future.done() and not future.cancelled():
+                self.release()
+            raise
+        finally:
+            self.background -= 1
+
+    def release(self) -> None:
+        self._busy *= SERVICE_TIME_DECAY
+        self._released = self._released * SERVICE_TIME_DECAY + 1
+        self._samples += 1
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                # Hand the slot over; the holder count stays the same
+                future.set_result(None)
+                return
+        self._account(-1)
+
+
+class LaneSlot:
+    """``async with`` view of a lane at one priority, usable like a semaphore.
+
+    With ``precheck``, entering first checks that lane would admit the
+    request, so work that will be shed later is not started. Without
+    ``shed``, entering waits for a slot however long it takes.
+    """
+
+    def __init__(self, lane: Lane, priority: int = 0, precheck: Optional[Lane] = None,
+                 shed: bool = True):
+        self.lane = lane
+        self.priority = priority
+        self.precheck = precheck
+        self.shed = shed
+
+    def locked(self) -> bool:
+        return self.lane.locked()
+
+    async def __aenter__(self) -> None:
+        if self.precheck is not None:
+            self.precheck.check()
+        await self.lane.acquire(self.priority, self.shed)
+
+    async def __aexit__(self, *exc_info) -> None:
+        self.lane.release()
+
+
+class AdmissionController:
+    """Fast lane for cache lookups and retrieval, LLM lane for generations.
+
+    Cache hits only ever use the fast lane, where lookups are served ahead
+    of retrievals, so they stay fast while the LLM lane is saturated.
+    Batch and warming generations share the LLM lane behind /query's and
+    wait instead of being shed.
+    """
+
+    def __init__(self, config, metrics=None):
+        self.fast = Lane(
+            "fast", config.max_concurrency, config.max_queued, config.queue_deadline_seconds,
+            metrics
+        )
+        self.llm = Lane(
+            "llm", config.max_generations, config.max_queued_generations,
+            config.generation_deadline_seconds, metrics
+        )
+        self.lookups = self.fast.slot(LOOKUP_PRIORITY)
+        self.retrievals = self.fast.slot(RETRIEVAL_PRIORITY, precheck=self.llm)
+        self.generations = self.llm.slot(GENERATION_PRIORITY)
+        self.background_generations = self.llm.slot(BACKGROUND_PRIORITY, shed=False)
+
+    def stats(self) -> dict:
+        return {
+            lane.name: {
+                "in_flight": lane.active,
+                "queued": lane.queued,
+                "background_queued": lane.background,
+                "max_concurrency": lane.max_concurrency,
+                "max_queue": lane.max_queue,
+                "service_seconds": (
+                    round(lane.service_time, 4) if lane.service_time is not None else None
+                ),
+            }
+            for lane in (self.fast, self.llm)
+        }
@@ -1,22 +1,69 @@
 """Chatbot backend handling request processing and response generation."""
-from typing import Dict, Any
+import asyncio
+import hashlib
+import json
+import logging
+import time
+from collections import deque
+from contextlib import nullcontext
+from typing import Dict, Any, AsyncIterator, Callable, List, Optional, Tuple
 from langchain.chains import RetrievalQA
 from langchain.prompts import PromptTemplate
+from langchain.prompts.base import StringPromptValue
+from langchain.schema import Document, LLMResult
 from opentelemetry import trace
+from ..concurrency import Limits, run_sync
+from .admission import AdmissionController
+from .coalescing import QueryCoalescer
+from .packing import ContextPacker, PackedContext, estimate_tokens
 from ..data.processor import DataProcessor
+from ..data.retrieval_cache import RetrievalCache
+from ..embeddings.context import current_embedding_context, embedding_context
+from ..llms.pool import LLMPool
+from ..monitoring.metrics import MetricsManager, stage
+
+logger = logging.getLogger(__name__)
+
+def prompt_version(prompt: PromptTemplate, llm_config) -> str:
+    """Hash of a QA prompt and model, part of every answer cache key.
+    
+    Answers cached under another template or model stop matching.
+    """
+    rendered = prompt.format(context="{context}", question="{question}")
+    fingerprint = json.dumps([rendered, llm_config.model, llm_config.temperature])
+    return hashlib.sha256(fingerprint.encode("utf-8")).hexdigest()[:16]
 
 class ChatbotBackend:
-    def __init__(self, config, llm, data_processor: DataProcessor):
+    def __init__(
+        self,
+        config,
+        llm,
+        data_processor: DataProcessor,
+        metrics: Optional[MetricsManager] = None,
+        standard_cache=None,
+        semantic_cache=None,
+        retrieval_cache: Optional[RetrievalCache] = None,
+        admission: Optional[AdmissionController] = None
+    ):
         self.config = config
         self.llm = llm
         self.data_processor = data_processor
+        self.metrics = metrics
+        self.standard_cache = standard_cache
+        self.semantic_cache = semantic_cache
+        self.retrieval_cache = retrieval_cache
+        self.admission = admission
+        self.coalescer = QueryCoalescer(config.coalescing, metrics)
+        self.context_packer = ContextPacker(
+            config.context, config.llm.model, config.vector_store.retrieval_k
+        )
         self.tracer = trace.get_tracer(__name__)
         
-        # Initialize QA chain
+        # Initialize QA chain; it only renders prompts, calls go through self.llm
         self.qa_chain = RetrievalQA.from_chain_type(
-            llm=self.llm,
+            llm=llm.primary if isinstance(llm, LLMPool) else llm,
             chain_type="stuff",
-            retriever=self.data_processor.vector_store.as_retriever(),
+            retriever=self.data_processor.retrieval_store.as_retriever(),
             return_source_documents=True
         )
         
@@ -32,27 +79,523 @@ class ChatbotBackend:
             Answer: """,
             input_variables=["context", "question"]
         )
+        self.prompt_version = self._prompt_version()
+    
+    def _prompt_version(self) -> str:
+        prompt = self.qa_chain.combine_documents_chain.llm_chain.prompt
+        return prompt_version(prompt, self.config.llm)
+    
+    async def _embed(self, query: str) -> List[float]:
+        """Embed the query, reusing the vector if this request already has it."""
+        embedding_ctx = current_embedding_context()
+        if embedding_ctx is not None:
+            embedding = embedding_ctx.get(query)
+            if embedding is not None:
+                return embedding
+        with stage("embed", self.metrics):
+            return await self.data_processor.embeddings.aembed_query(query)
+    
+    async def _embed_many(self, queries: List[str]) -> None:
+        """Embed queries the request has not seen yet in one batched call."""
+        embedding_ctx = current_embedding_context()
+        missing = [query for query in dict.fromkeys(queries) if query not in embedding_ctx.vectors]
+        if not missing:
+            return
+        with stage("embed", self.metrics) as span:
+            span.set_attribute("queries", len(missing))
+            vectors = await run_sync(self.data_processor.embeddings.embed_documents, missing)
+        for query, vector in zip(missing, vectors):
+            embedding_ctx.put(query, vector)
+    
+    def _lookup_many(self, cache, queries: List[str]) -> List[Optional[str]]:
+        lookup_many = getattr(cache, "lookup_many", None)
+        if lookup_many is not None:
+            return lookup_many(queries, self.prompt_version)
+        return [cache.lookup(query, self.prompt_version) for query in queries]
+    
+    async def _lookup_cached_answers(self, queries: List[str]) -> Dict[str, Tuple[str, str]]:
+        """Check the standard then the semantic cache for many queries at once.
+        
+        Each cache is probed in bulk, both its L1 tier and CrateDB.
+        """
+        hits: Dict[str, Tuple[str, str]] = {}
+        for cache, cache_type in ((self.standard_cache, "standard"), (self.semantic_cache, "semantic")):
+            pending = [query for query in queries if query not in hits]
+            if cache is None or not pending:
+                continue
+            with stage(f"{cache_type}_cache_lookup", self.metrics) as span:
+                span.set_attribute("queries", len(pending))
+                answers = await run_sync(self._lookup_many, cache, pending)
+            for query, answer in zip(pending, answers):
+                if answer:
+                    hits[query] = (answer, cache_type)
+        return hits
+    
+    async def _cached_answer(self, query: str) -> Tuple[Optional[str], str]:
+        """Check the standard then the semantic cache for an answer."""
+        if self.standard_cache is not None:
+            with stage("standard_cache_lookup", self.metrics):
+                cached = await run_sync(self.standard_cache.lookup, query, self.prompt_version)
+            if cached:
+                return cached, "standard"
+        if self.semantic_cache is not None:
+            # Embed as its own stage; the semantic lookup reuses the vector
+            await self._embed(query)
+            with stage("semantic_cache_lookup", self.metrics):
+                cached = await run_sync(self.semantic_cache.lookup, query, self.prompt_version)
+            if cached:
+                return cached, "semantic"
+        return None, "none"
+    
+    async def _retrieve(self, query: str) -> List[Document]:
+        """Embed the query once, search by vector and pack the results."""
+        embedding = await self._embed(query)
+        k = max(self.config.context.fetch_k, self.config.vector_store.retrieval_k)
+        results = None
+        if self.retrieval_cache is not None:
+            corpus_version = await self._corpus_version()
+            with stage("retrieval_cache_lookup", self.metrics) as span:
+                results = await run_sync(self.retrieval_cache.lookup, query, embedding, k)
+                span.set_attribute("hit", results is not None)
+        if results is None:
+            with stage("retrieval", self.metrics) as span:
+                start_time = time.perf_counter()
+                results = await self.data_processor.asearch_with_scores_by_vector(embedding, k=k)
+                span.set_attribute("documents", len(results))
+            if self.metrics:
+                self.metrics.record_vector_search(time.perf_counter() - start_time)
+            if self.retrieval_cache is not None:
+                await run_sync(
+                    self.retrieval_cache.update, query, embedding, k, results,
+                    corpus_version=corpus_version
+                )
+        return await self._pack_context(embedding, [doc for doc, _ in results])
+    
+    async def _pack_context(self, embedding: List[float], documents: List[Document]) -> List[Document]:
+        """Drop near-duplicate chunks and fit the rest into the token budget."""
+        with stage("context_packing", self.metrics) as span:
+            if self.config.context.mmr_enabled:
+                # Embedding the candidates for MMR is a blocking HTTP call
+                packed: PackedContext = await run_sync(
+                    self.context_packer.pack,
+                    documents,
+                    embedding,
+                    self.data_processor.embeddings.embed_documents
+                )
+            else:
+                packed = self.context_packer.pack(documents)
+            span.set_attribute("candidates", packed.candidates)
+            span.set_attribute("documents", len(packed.documents))
+            span.set_attribute("duplicates", packed.duplicates)
+            span.set_attribute("trimmed", packed.trimmed)
+            span.set_attribute("tokens.retrieved", packed.retrieved_tokens)
+            span.set_attribute("tokens.packed", packed.packed_tokens)
+            span.set_attribute("tokens.budget", packed.budget)
+        if self.metrics:
+            self.metrics.record_context_packing(packed)
+        return packed.documents
+    
+    async def _generate(self, prompt: str) -> str:
+        """Run the LLM on a rendered prompt, recording latency and tokens."""
+        with stage("llm_generation", self.metrics) as span:
+            start_time = time.perf_counter()
+            result = await self.llm.agenerate_prompt([StringPromptValue(text=prompt)])
+            answer = result.generations[0][0].text
+            prompt_tokens, completion_tokens = self._token_usage(result, prompt, answer)
+            span.set_attribute("tokens.prompt", prompt_tokens)
+            span.set_attribute("tokens.completion", completion_tokens)
+        if self.metrics:
+            self.metrics.record_llm_request(
+                time.perf_counter() - start_time, prompt_tokens, completion_tokens
+            )
+        return answer
+    
+    @staticmethod
+    def _token_usage(result: Optional[LLMResult], prompt: str, answer: str) -> Tuple[int, int]:
+        """Reported (OpenAI, Ollama) or estimated prompt and completion tokens."""
+        usage = {}
+        if result is not None:
+            usage = dict((result.llm_output or {}).get("token_usage") or {})
+            info = result.generations[0][0].generation_info or {}
+            usage.setdefault("prompt_tokens", info.get("prompt_eval_count"))
+            usage.setdefault("completion_tokens", info.get("eval_count"))
+        return (
+            usage.get("prompt_tokens") or estimate_tokens(prompt),
+            usage.get("completion_tokens") or estimate_tokens(answer)
+        )
+    
+    async def _corpus_version(self) -> int:
+        """Corpus version an answer retrieved from now on is computed under."""
+        corpus = self.data_processor.resources.corpus
+        version = corpus.cached()
+        return version if version is not None else await run_sync(corpus.current)
+    
+    async def _store_answer(
+        self,
+        query: str,
+        answer: str,
+        corpus_version: Optional[int] = None
+    ) -> None:
+        """Write a generated answer to both caches.
+        
+        ``corpus_version`` is read before retrieval, so an answer built from
+        documents that ingestion has changed meanwhile is stored as stale.
+        """
+        with stage("cache_write", self.metrics):
+            for cache in (self.standard_cache, self.semantic_cache):
+                if cache is not None:
+                    await run_sync(
+                        cache.update, query, self.prompt_version, answer,
+                        corpus_version=corpus_version
+                    )
+    
+    def _build_prompt(self, query: str, documents: List[Document]) -> str:
+        """Render the QA chain's "stuff" prompt for the given documents."""
+        combine_chain = self.qa_chain.combine_documents_chain
+        inputs = combine_chain._get_inputs(documents, question=query)
+        return combine_chain.llm_chain.prompt.format(**inputs)
+    
+    def _record_embeddings(self, span, embedding_ctx) -> None:
+        span.set_attribute("embeddings.computed", embedding_ctx.computed)
+        if self.metrics:
+            self.metrics.record_request_embeddings(embedding_ctx.computed)
+    
+    @staticmethod
+    def _format_response(answer: str, documents: List[Document], cache_type: str) -> Dict[str, Any]:
+        return {
+            "answer": answer,
+            "sources": [doc.page_content for doc in documents],
+            "metadata": [doc.metadata for doc in documents],
+            "cache_type": cache_type
+        }
     
     async def process_input(self, query: str) -> Dict[str, Any]:
         """Process user input and generate response."""
-        with self.tracer.start_as_current_span("process_input") as span:
+        with self.tracer.start_as_current_span("process_input") as span, \
+                embedding_context() as embedding_ctx:
             span.set_attribute("query", query)
-            
-            # Get response from QA chain
-            result = self.qa_chain({"query": query})
-            
-            # Format response
-            response = {
-                "answer": result["result"],
-                "sources": [doc.page_content for doc in result["source_documents"]],
-                "metadata": [doc.metadata for doc in result["source_documents"]]
-            }
-            
-            return response
+            try:
+                if self.admission is None:
+                    return await self._answer(query)
+                # In-process exact hits skip the lanes (and the thread pool) entirely
+                peek = getattr(self.standard_cache, "peek", None)
+                answer = peek(query, self.prompt_version) if peek is not None else None
+                if answer:
+                    span.set_attribute("cache_hit", "standard")
+                    return self._format_response(answer, [], "standard")
+                return await self._answer(
+                    query,
+                    self.admission.lookups,
+                    self.admission.generations,
+                    self.admission.retrievals
+                )
+            finally:
+                self._record_embeddings(span, embedding_ctx)
+    
+    async def _answer(
+        self,
+        query: str,
+        search_limit: Optional[asyncio.Semaphore] = None,
+        generation_limit: Optional[asyncio.Semaphore] = None,
+        retrieval_limit: Optional[asyncio.Semaphore] = None,
+        cache_checked: bool = False
+    ) -> Dict[str, Any]:
+        """Answer from the caches, or run (or join) the full pipeline.
+        
+        ``retrieval_limit`` bounds retrieval for misses and defaults to
+        ``search_limit``, which bounds the cache lookups. With
+        ``cache_checked`` the caller already missed both caches.
+        """
+        span = trace.get_current_span()
+        if not cache_checked:
+            async with search_limit or nullcontext():
+                answer, cache_type = await self._cached_answer(query)
+            if answer is not None:
+                span.set_attribute("cache_hit", cache_type)
+                return self._format_response(answer, [], cache_type)
+        
+        # Identical (or near-duplicate) in-flight queries share one run
+        embedding = None
+        if self.config.coalescing.semantic_enabled:
+            embedding = await self._embed(query)
+        response, coalesced = await self.coalescer.run(
+            query,
+            lambda: self._generate_answer(query, retrieval_limit or search_limit, generation_limit),
+            embedding
+        )
+        if coalesced:
+            span.set_attribute("coalesced", True)
+            response = dict(response, cache_type="coalesced")
+        return response
+    
+    async def _generate_answer(
+        self,
+        query: str,
+        search_limit: Optional[asyncio.Semaphore] = None,
+        generation_limit: Optional[asyncio.Semaphore] = None
+    ) -> Dict[str, Any]:
+        """Retrieve, generate and cache an answer for a cache miss."""
+        corpus_version = await self._corpus_version()
+        async with search_limit or nullcontext():
+            documents = await self._retrieve(query)
+        
+        # Render the QA chain's prompt and generate without blocking the event loop
+        with stage("prompt_build", self.metrics):
+            prompt = self._build_prompt(query, documents)
+        contended = generation_limit is not None and generation_limit.locked()
+        async with generation_limit or nullcontext():
+            if contended:
+                # Batch items answered while this one waited may now match
+                answer, cache_type = await self._cached_answer(query)
+                if answer is not None:
+                    return self._format_response(answer, [], cache_type)
+            answer = await self._generate(prompt)
+        
+        await self._store_answer(query, answer, corpus_version)
+        return self._format_response(answer, documents, "none")
+    
+    async def process_batch(self, queries: List[str]) -> AsyncIterator[Dict[str, Any]]:
+        """Answer many queries, yielding one result per query in input order.
+        
+        Queries are handled in chunks of ``batch.chunk_size``: each chunk is
+        embedded in one batched call and checked against both cache tiers
+        in bulk, then the remaining queries run the normal pipeline
+        with at most ``batch.max_concurrency`` cache lookups and vector
+        searches and ``batch.max_generations`` LLM calls in flight; with
+        admission control the LLM calls also take background slots of the
+        LLM lane. A failing query yields an ``error`` item instead of
+        failing the batch.
+        """
+        batch_config = self.config.batch
+        search_limit = asyncio.Semaphore(batch_config.max_concurrency)
+        generation_limit = self._background_limit(
+            asyncio.Semaphore(batch_config.max_generations)
+        )
+        span = self.tracer.start_span("process_batch")
+        span.set_attribute("queries", len(queries))
+        pending = deque()
+        try:
+            with embedding_context() as embedding_ctx:
+                try:
+                    for start in range(0, len(queries), batch_config.chunk_size):
+                        chunk = queries[start:start + batch_config.chunk_size]
+                        # Stage spans and item tasks nest under process_batch;
+                        # the span is never current across a yield
+                        with trace.use_span(span):
+                            hits, cache_checked = {}, False
+                            try:
+                                await self._embed_many(chunk)
+                                hits = await self._lookup_cached_answers(chunk)
+                                cache_checked = True
+                            except Exception:
+                                # Items fall back to the per-query path
+                                span.set_attribute("bulk_lookup_failed", True)
+                            for offset, query in enumerate(chunk):
+                                pending.append(asyncio.create_task(self._batch_item(
+                                    start + offset, query, hits.get(query),
+                                    search_limit, generation_limit, cache_checked
+                                )))
+                        # Keep about one chunk queued ahead of the consumer
+                        while len(pending) > batch_config.chunk_size:
+                            yield await pending.popleft()
+                    while pending:
+                        yield await pending.popleft()
+                finally:
+                    for task in pending:
+                        task.cancel()
+                    self._record_embeddings(span, embedding_ctx)
+        finally:
+            span.end()
+    
+    async def _batch_item(
+        self,
+        index: int,
+        query: str,
+        cached: Optional[Tuple[str, str]],
+        search_limit: asyncio.Semaphore,
+        generation_limit: asyncio.Semaphore,
+        cache_checked: bool = False
+    ) -> Dict[str, Any]:
+        """Answer one query of a batch, turning failures into an error item."""
+        start_time = time.perf_counter()
+        try:
+            if cached is not None:
+                answer, cache_type = cached
+                response = self._format_response(answer, [], cache_type)
+            else:
+                response = await self._answer(
+                    query, search_limit, generation_limit, cache_checked=cache_checked
+                )
+        except Exception as e:
+            if self.metrics:
+                self.metrics.record_error()
+            return {"index": index, "query": query, "error": str(e)}
+        return dict(
+            response,
+            index=index,
+            query=query,
+            process_time=time.perf_counter() - start_time
+        )
+    
+    def _background_limit(self, generation_limit=None):
+        """Add a background slot of the admission LLM lane to a batch's own limit.
+        
+        Batch and warming generations then count against the global bound,
+        served after interactive ones, and wait rather than being shed.
+        """
+        if self.admission is None:
+            return generation_limit
+        if generation_limit is None:
+            return self.admission.background_generations
+        return Limits(generation_limit, self.admission.background_generations)
+    
+    async def warm_batch(
+        self,
+        queries: List[str],
+        logged_answers: Dict[str, str],
+        allow_generation: Callable[[], bool],
+        search_limit: Optional[asyncio.Semaphore] = None,
+        generation_limit: Optional[asyncio.Semaphore] = None
+    ) -> List[str]:
+        """Make sure each query is answered from the caches, without a client waiting.
+        
+        Returns one outcome per query: ``cached`` (a CrateDB hit, now also
+        in L1), ``logged`` (a logged answer still valid for the corpus was
+        stored), ``generated`` (the LLM was called), ``skipped`` (no
+        generation budget left) or ``failed``.
+        """
+        with self.tracer.start_as_current_span("warm_batch") as span, \
+                embedding_context() as embedding_ctx:
+            span.set_attribute("queries", len(queries))
+            try:
+                await self._embed_many(queries)
+                generation_limit = self._background_limit(generation_limit)
+                return await asyncio.gather(*(
+                    self._warm_query(
+                        query, logged_answers.get(query), allow_generation,
+                        search_limit, generation_limit
+                    )
+                    for query in queries
+                ))
+            finally:
+                self._record_embeddings(span, embedding_ctx)
+    
+    async def _warm_query(
+        self,
+        query: str,
+        logged_answer: Optional[str],
+        allow_generation: Callable[[], bool],
+        search_limit: Optional[asyncio.Semaphore],
+        generation_limit: Optional[asyncio.Semaphore]
+    ) -> str:
+        try:
+            async with search_limit or nullcontext():
+                answer, _ = await self._cached_answer(query)
+            if answer is not None:
+                return "cached"
+            if logged_answer:
+                await self._store_answer(query, logged_answer)
+                return "logged"
+            if not allow_generation():
+                return "skipped"
+            response = await self._generate_answer(query, search_limit, generation_limit)
+            return "generated" if response["cache_type"] == "none" else "cached"
+        except Exception as e:
+            logger.warning(f"Warming the cache for {query!r} failed: {e}")
+            return "failed"
+    
+    async def stream_input(self, query: str) -> AsyncIterator[Dict[str, Any]]:
+        """Process user input, yielding sources and then answer tokens.
+        
+        Yields ``{"event": ..., "data": ...}`` dicts: one ``sources`` event
+        once retrieval finishes, ``token`` events as the LLM generates and a
+        final ``done`` event with the full answer. Cache hits are delivered
+        as a single token. With admission control, the lookups, retrieval
+        and generation take the same lanes as ``process_input``; the LLM
+        slot is taken before the first event, so ``Overloaded`` is raised
+        before anything is streamed.
+        """
+        admission = self.admission
+        span = self.tracer.start_span("stream_input")
+        span.set_attribute("query", query)
+        try:
+            with embedding_context() as embedding_ctx:
+                try:
+                    # Stage spans nest under stream_input; the span is only
+                    # made current around awaits, never across a yield
+                    with trace.use_span(span):
+                        async with admission.lookups if admission else nullcontext():
+                            answer, cache_type = await self._cached_answer(query)
+                    if answer is not None:
+                        span.set_attribute("cache_hit", cache_type)
+                        yield {"event": "sources", "data": {"sources": [], "metadata": []}}
+                        yield {"event": "token", "data": {"token": answer}}
+                        yield {"event": "done", "data": {"answer": answer, "cache_type": cache_type}}
+                        return
+                    
+                    with trace.use_span(span):
+                        corpus_version = await self._corpus_version()
+                        async with admission.retrievals if admission else nullcontext():
+                            documents = await self._retrieve(query)
+                        with stage("prompt_build", self.metrics):
+                            prompt = self._build_prompt(query, documents)
+                    
+                    tokens = []
+                    async with admission.generations if admission else nullcontext():
+                        yield {
+                            "event": "sources",
+                            "data": {
+                                "sources": [doc.page_content for doc in documents],
+                                "metadata": [doc.metadata for doc in documents]
+                            }
+                        }
+                        generation = self.tracer.start_span(
+                            "llm_generation",
+                            context=trace.set_span_in_context(span),
+                            attributes={"pipeline": "query"}
+                        )
+                        start_time = time.perf_counter()
+                        success = False
+                        try:
+                            async for chunk in self.llm.astream(prompt):
+                                # LLMs stream strings, chat models stream message chunks
+                                token = chunk if isinstance(chunk, str) else chunk.content
+                                if token:
+                                    if not tokens:
+                                        generation.add_event("first_token")
+                                    tokens.append(token)
+                                    yield {"event": "token", "data": {"token": token}}
+                            success = True
+                        finally:
+                            duration = time.perf_counter() - start_time
+                            generation.end()
+                            if self.metrics:
+                                self.metrics.record_stage(
+                                    "llm_generation", duration, success=success
+                                )
+                    
+                    answer = "".join(tokens)
+                    if self.metrics:
+                        self.metrics.record_llm_request(
+                            duration, *self._token_usage(None, prompt, answer)
+                        )
+                    # An empty generation is not worth serving again
+                    if answer:
+                        with trace.use_span(span):
+                            await self._store_answer(query, answer, corpus_version)
+                    yield {"event": "done", "data": {"answer": answer, "cache_type": cache_type}}
+                finally:
+                    self._record_embeddings(span, embedding_ctx)
+        finally:
+            span.end()
     
     def update_prompt(self, new_template: str) -> None:
-        """Update the prompt template."""
+        """Render prompts with a new template; answers cached under the old one stop matching."""
         self.prompt_template = PromptTemplate(
             template=new_template,
             input_variables=["context", "question"]
         )
+        self.qa_chain.combine_documents_chain.llm_chain.prompt = self.prompt_template
+        self.prompt_version = self._prompt_version()
+        # Answers shared by the coalescer were generated with the old prompt
+        self.coalescer.forget_finished()
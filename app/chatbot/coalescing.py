@@ -0,0 +1,112 @@
+"""Single-flight coalescing of identical or near-duplicate in-flight queries."""
+import asyncio
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+
+@dataclass
+class _Flight:
+    key: str
+    task: asyncio.Future
+    vector: Optional[np.ndarray] = None
+    finished_at: Optional[float] = None
+
+
+class QueryCoalescer:
+    """Shares one pipeline execution between concurrent callers.
+
+    Callers are matched on the normalized query and, when enabled, on
+    cosine similarity of the query embedding. Completed results stay
+    joinable for ``window_seconds`` to cover the gap before the answer
+    lands in the caches.
+    """
+
+    def __init__(self, config, metrics=None):
+        self.config = config
+        self.metrics = metrics
+        self._flights: Dict[str, _Flight] = {}
+
+    @staticmethod
+    def normalize(query: str) -> str:
+        """Case- and whitespace-insensitive coalescing key."""
+        return " ".join(query.lower().split())
+
+    async def run(
+        self,
+        query: str,
+        func: Callable[[], Awaitable[Any]],
+        embedding: Optional[List[float]] = None
+    ) -> Tuple[Any, bool]:
+        """Run ``func`` unless an equivalent query is already in flight.
+        
+        Returns the result and whether it came from another caller's run.
+        """
+        if not self.config.enabled:
+            return await func(), False
+
+        self._prune()
+        key = self.normalize(query)
+        vector = None
+        if embedding is not None and self.config.semantic_enabled:
+            vector = np.asarray(embedding, dtype=np.float32)
+            norm = np.linalg.norm(vector)
+            vector = vector / norm if norm else vector
+
+        flight = self._flights.get(key)
+        kind = "exact"
+        if flight is None and vector is not None:
+            flight = self._find_similar(vector)
+            kind = "semantic"
+        if flight is not None:
+            if self.metrics:
+                self.metrics.record_coalesced_request(kind)
+            return await asyncio.shield(flight.task), True
+
+        # Run as its own task so a cancelled leader does not fail followers
+        flight = _Flight(key=key, task=asyncio.ensure_future(func()), vector=vector)
+        self._flights[key] = flight
+        flight.task.add_done_callback(lambda task: self._finish(flight))
+        return await asyncio.shield(flight.task), False
+
+    def _find_similar(self, vector: np.ndarray) -> Optional[_Flight]:
+        candidates = [
+            flight for flight in self._flights.values()
+            if flight.vector is not None and flight.vector.shape == vector.shape
+        ]
+        if not candidates:
+            return None
+        scores = np.stack([flight.vector for flight in candidates]) @ vector
+        best = int(np.argmax(scores))
+        if scores[best] >= self.config.semantic_threshold:
+            return candidates[best]
+        return None
+
+    def _finish(self, flight: _Flight) -> None:
+        failed = flight.task.cancelled() or flight.task.exception() is not None
+        if failed or self.config.window_seconds <= 0:
+            self._discard(flight)
+        else:
+            flight.finished_at = time.monotonic()
+
+    def _discard(self, flight: _Flight) -> None:
+        if self._flights.get(flight.key) is flight:
+            del self._flights[flight.key]
+
+    def _prune(self) -> None:
+        cutoff = time.monotonic() - self.config.window_seconds
+        for flight in list(self._flights.values()):
+            if flight.finished_at is not None and flight.finished_at < cutoff:
+                self._discard(flight)
+
+    def forget_finished(self) -> None:
+        """Drop finished results still inside the sharing window."""
+        for flight in list(self._flights.values()):
+            if flight.finished_at is not None:
+                self._discard(flight)
+
+    @property
+    def in_flight(self) -> int:
+        return sum(1 for flight in self._flights.values() if not flight.task.done())
@@ -0,0 +1,183 @@
+"""Token-budgeted packing of retrieved chunks into the "stuff" prompt."""
+import re
+from dataclasses import dataclass
+from typing import Callable, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+from langchain.schema import Document
+from langchain.vectorstores.utils import maximal_marginal_relevance
+
+# Context windows by model name prefix; the longest matching prefix wins
+MODEL_CONTEXT_WINDOWS = {
+    "gpt-4o": 128000,
+    "gpt-4-turbo": 128000,
+    "gpt-4-32k": 32768,
+    "gpt-4": 8192,
+    "gpt-3.5-turbo": 16385,
+    "llama3": 8192,
+    "llama2": 4096,
+    "mistral": 8192,
+    "mixtral": 32768,
+    "phi3": 4096,
+}
+DEFAULT_CONTEXT_WINDOW = 4096
+
+# Shared boundary text shorter than this is not treated as chunk overlap
+MIN_OVERLAP_CHARS = 64
+# Leftover budget below this is not worth a truncated chunk
+MIN_TRUNCATED_TOKENS = 32
+SHINGLE_SIZE = 3
+
+_WORD = re.compile(r"\w+")
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count for backends that do not report usage (~4 chars/token)."""
+    return (len(text) + 3) // 4
+
+
+def context_window(model: str) -> int:
+    """Context window of a model, by name prefix (e.g. ``llama2:13b``)."""
+    name = model.lower().rsplit("/", 1)[-1]
+    for prefix in sorted(MODEL_CONTEXT_WINDOWS, key=len, reverse=True):
+        if name.startswith(prefix):
+            return MODEL_CONTEXT_WINDOWS[prefix]
+    return DEFAULT_CONTEXT_WINDOW
+
+
+def shingles(text: str) -> Set[Tuple[str, ...]]:
+    words = _WORD.findall(text.lower())
+    if len(words) < SHINGLE_SIZE:
+        return {tuple(words)}
+    return {tuple(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+
+
+def trim_overlap(text: str, other: str) -> str:
+    """Drop the part of ``text`` that repeats the start or end of ``other``.
+
+    Neighbouring chunks from the splitter share ``chunk_overlap`` characters
+    at their boundary; only the first copy needs to be in the prompt.
+    """
+    # text continues other: other's tail is text's head
+    position = other.rfind(text[:MIN_OVERLAP_CHARS])
+    if position >= 0 and text.startswith(other[position:]):
+        text = text[len(other) - position:].lstrip()
+    # text precedes other: text's tail is other's head
+    if len(text) >= MIN_OVERLAP_CHARS:
+        position = text.rfind(other[:MIN_OVERLAP_CHARS])
+        if position >= 0 and other.startswith(text[position:]):
+            text = text[:position].rstrip()
+    return text
+
+
+def truncate(text: str, max_tokens: int) -> str:
+    """Cut text to about ``max_tokens`` tokens at a word boundary."""
+    cut = text[:max_tokens * 4]
+    if len(cut) < len(text) and " " in cut:
+        cut = cut.rsplit(" ", 1)[0]
+    return cut.rstrip()
+
+
+@dataclass
+class PackedContext:
+    """Chunks chosen for one prompt and what packing removed."""
+    documents: List[Document]
+    budget: int
+    candidates: int = 0
+    duplicates: int = 0
+    trimmed: int = 0
+    over_budget: int = 0
+    retrieved_tokens: int = 0
+    packed_tokens: int = 0
+
+
+class ContextPacker:
+    """Chooses which retrieved chunks go into the prompt.
+
+    Candidates that are near-duplicates of a better-ranked chunk (word
+    shingle containment) are dropped, optionally the rest are reordered by
+    maximal marginal relevance, and chunks are then added in order until
+    ``max_documents`` or the token budget is reached. Text overlapping an
+    already packed chunk is trimmed and the last chunk may be truncated.
+    """
+
+    def __init__(self, config, model: str, max_documents: int):
+        self.config = config
+        self.max_documents = max_documents
+        self.budget = config.token_budget or max(
+            context_window(model) - config.reserved_tokens, 0
+        )
+
+    def pack(
+        self,
+        documents: Sequence[Document],
+        query_vector: Optional[List[float]] = None,
+        embed_documents: Optional[Callable[[List[str]], List[List[float]]]] = None
+    ) -> PackedContext:
+        result = PackedContext(documents=[], budget=self.budget, candidates=len(documents))
+        result.retrieved_tokens = sum(estimate_tokens(doc.page_content) for doc in documents)
+
+        candidates = self.deduplicate(documents)
+        result.duplicates = len(documents) - len(candidates)
+        if self.config.mmr_enabled and query_vector is not None and embed_documents \
+                and len(candidates) > 1:
+            candidates = self.rerank(
+                query_vector, candidates, embed_documents([doc.page_content for doc in candidates])
+            )
+
+        remaining = self.budget
+        for doc in candidates:
+            if len(result.documents) >= self.max_documents or remaining <= 0:
+                result.over_budget += 1
+                continue
+            text = doc.page_content
+            for packed in result.documents:
+                text = trim_overlap(text, packed.page_content)
+            if not text:
+                result.duplicates += 1
+                continue
+            tokens = estimate_tokens(text)
+            if tokens > remaining:
+                if remaining < MIN_TRUNCATED_TOKENS:
+                    result.over_budget += 1
+                    continue
+                text = truncate(text, remaining)
+                tokens = estimate_tokens(text)
+            if text != doc.page_content:
+                result.trimmed += 1
+                doc = Document(page_content=text, metadata=dict(doc.metadata))
+            result.documents.append(doc)
+            result.packed_tokens += tokens
+            remaining -= tokens
+        return result
+
+    def deduplicate(self, documents: Sequence[Document]) -> List[Document]:
+        """Keep each chunk unless a better-ranked one already covers it."""
+        kept: List[Document] = []
+        kept_shingles: List[Set[Tuple[str, ...]]] = []
+        for doc in documents:
+            doc_shingles = shingles(doc.page_content)
+            if any(
+                len(doc_shingles & other) >= self.config.dedupe_threshold
+                * min(len(doc_shingles), len(other))
+                for other in kept_shingles
+            ):
+                continue
+            kept.append(doc)
+            kept_shingles.append(doc_shingles)
+        return kept
+
+    def rerank(
+        self,
+        query_vector: List[float],
+        documents: List[Document],
+        vectors: List[List[float]]
+    ) -> List[Document]:
+        """Order chunks by maximal marginal relevance to the query."""
+        order = maximal_marginal_relevance(
+            np.array(query_vector, dtype=np.float32),
+            vectors,
+            lambda_mult=self.config.mmr_lambda,
+            k=len(documents)
+        )
+        return [documents[i] for i in order]
@@ -0,0 +1,192 @@
+"""Pre-populates the LLM caches with popular queries from the interactions log."""
+import asyncio
+import logging
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from ..concurrency import RateLimiter, run_sync
+
+logger = logging.getLogger(__name__)
+
+STRATEGIES = ("frequent", "expensive")
+
+# Most requested queries in the lookback window
+FREQUENT_QUERY = (
+    "SELECT query, COUNT(*) FROM {table} WHERE timestamp > ? "
+    "GROUP BY query HAVING COUNT(*) >= ? ORDER BY 2 DESC LIMIT ?"
+)
+# Queries that were slowest to answer when they missed every cache
+EXPENSIVE_QUERY = (
+    "SELECT query, AVG(process_time) FROM {table} WHERE timestamp > ? AND cache_type = 'none' "
+    "GROUP BY query HAVING COUNT(*) >= ? ORDER BY 2 DESC LIMIT ?"
+)
+
+
+@dataclass
+class WarmingRun:
+    """Progress of one cache warming run."""
+    strategy: str
+    top_n: int
+    id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    status: str = "pending"
+    queries_selected: int = 0
+    # Outcomes per query, see ChatbotBackend.warm_batch
+    cached: int = 0
+    logged: int = 0
+    generated: int = 0
+    skipped: int = 0
+    failed: int = 0
+    error: Optional[str] = None
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        elapsed = 0.0
+        if self.started_at is not None:
+            elapsed = (self.finished_at or time.time()) - self.started_at
+        return {
+            "run_id": self.id,
+            "status": self.status,
+            "strategy": self.strategy,
+            "top_n": self.top_n,
+            "queries_selected": self.queries_selected,
+            "cached": self.cached,
+            "logged": self.logged,
+            "generated": self.generated,
+            "skipped": self.skipped,
+            "failed": self.failed,
+            "error": self.error,
+            "elapsed_seconds": round(elapsed, 3),
+        }
+
+
+class CacheWarmer:
+    """Warms the caches with the top queries of the interactions log.
+
+    Queries are taken by request count (``frequent``) or by average
+    uncached latency (``expensive``) and handled ``batch_size`` at a time.
+    A query already in CrateDB is only promoted to the L1 tier; a logged
+    answer newer than the last corpus change and logged under the current
+    prompt version is stored without calling the LLM; anything else is generated, at most ``max_generations`` per run
+    and ``generations_per_second`` at a time. One run at a time.
+    """
+
+    def __init__(
+        self,
+        config,
+        fetch_all: Callable[[str, Sequence[Any]], List[tuple]],
+        corpus,
+        metrics=None,
+        table_name: str = "interactions"
+    ):
+        self.config = config
+        self.fetch_all = fetch_all
+        self.corpus = corpus
+        self.metrics = metrics
+        self.table_name = table_name
+        self.last_run: Optional[WarmingRun] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def submit(self, chatbot, strategy: Optional[str] = None,
+               top_n: Optional[int] = None) -> WarmingRun:
+        """Start a run in the background; fails if one is already running."""
+        if self.running:
+            raise RuntimeError("A cache warming run is already in progress")
+        strategy = (strategy or self.config.strategy).lower()
+        if strategy not in STRATEGIES:
+            raise ValueError(f"Unknown warming strategy {strategy!r}, use one of {STRATEGIES}")
+        run = WarmingRun(strategy=strategy, top_n=top_n or self.config.top_n)
+        self.last_run = run
+        self._task = asyncio.create_task(self._run(chatbot, run))
+        return run
+
+    async def _run(self, chatbot, run: WarmingRun) -> None:
+        run.status = "running"
+        run.started_at = time.time()
+        try:
+            await self.warm(chatbot, run)
+            run.status = "completed"
+        except asyncio.CancelledError:
+            run.status = "cancelled"
+            raise
+        except Exception as e:
+            run.status = "failed"
+            run.error = str(e)
+            logger.error(f"Cache warming run {run.id} failed: {e}")
+        finally:
+            run.finished_at = time.time()
+            logger.info(f"Cache warming run finished: {run.to_dict()}")
+
+    async def warm(self, chatbot, run: WarmingRun) -> WarmingRun:
+        """Select the top queries and warm the caches with them."""
+        queries = await run_sync(self.select_queries, run.strategy, run.top_n)
+        run.queries_selected = len(queries)
+        logged = {}
+        if self.config.reuse_logged and queries:
+            logged = await run_sync(self.logged_answers, queries, chatbot.prompt_version)
+
+        budget = self.config.max_generations
+
+        def allow_generation() -> bool:
+            nonlocal budget
+            if budget <= 0:
+                return False
+            budget -= 1
+            return True
+
+        search_limit = asyncio.Semaphore(self.config.max_concurrency)
+        generation_limit = RateLimiter(
+            self.config.generations_per_second, self.config.generation_concurrency
+        )
+        for start in range(0, len(queries), self.config.batch_size):
+            batch = queries[start:start + self.config.batch_size]
+            outcomes = await chatbot.warm_batch(
+                batch, logged, allow_generation, search_limit, generation_limit
+            )
+            for outcome in outcomes:
+                setattr(run, outcome, getattr(run, outcome) + 1)
+                if self.metrics:
+                    self.metrics.record_cache_warming(outcome)
+        return run
+
+    def select_queries(self, strategy: str, top_n: int) -> List[str]:
+        """Top queries of the lookback window, best first."""
+        sql = FREQUENT_QUERY if strategy == "frequent" else EXPENSIVE_QUERY
+        since = time.time() - self.config.lookback_hours * 3600
+        rows = self.fetch_all(
+            sql.format(table=self.table_name), (since, self.config.min_requests, top_n)
+        )
+        return [query for query, _ in rows if query]
+
+    def logged_answers(self, queries: List[str], prompt_version: str) -> Dict[str, str]:
+        """Latest logged answer per query, if logged after the last corpus change.
+
+        Answers logged under another prompt version, or before versions were
+        logged, were produced by another template or model and are left out.
+        """
+        answers: Dict[str, str] = {}
+        since = self.corpus.changed_at()
+        for start in range(0, len(queries), self.config.batch_size):
+            batch = queries[start:start + self.config.batch_size]
+            placeholders = ", ".join("?" for _ in batch)
+            for query, response in self.fetch_all(
+                f"SELECT query, response FROM {self.table_name} "
+                f"WHERE query IN ({placeholders}) AND timestamp > ? AND prompt_version = ? "
+                f"ORDER BY timestamp DESC",
+                [*batch, since, prompt_version]
+            ):
+                if response and query not in answers:
+                    answers[query] = response
+        return answers
+
+    async def shutdown(self) -> None:
+        """Cancel a running warming run."""
+        if self.running:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
@@ -0,0 +1,111 @@
+"""Bounded thread pool for running blocking components off the event loop."""
+import asyncio
+import contextvars
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+from .monitoring.profiling import profiled
+
+_executor: Optional[ThreadPoolExecutor] = None
+
+
+def get_executor(max_workers: Optional[int] = None) -> ThreadPoolExecutor:
+    """Return the shared executor, creating it on first use."""
+    global _executor
+    if _executor is None:
+        if max_workers is None:
+            from app.config import config
+            max_workers = config.server.executor_workers
+        _executor = ThreadPoolExecutor(
+            max_workers=max_workers,
+            thread_name_prefix="blocking"
+        )
+    return _executor
+
+
+def install_executor(loop: Optional[asyncio.AbstractEventLoop] = None) -> None:
+    """Make the shared executor the loop default.
+
+    LangChain falls back to ``loop.run_in_executor(None, ...)`` for
+    retrievers and LLMs without native async support, so installing the
+    bounded pool as the default keeps those fallbacks bounded as well.
+    """
+    loop = loop or asyncio.get_running_loop()
+    loop.set_default_executor(get_executor())
+
+
+async def run_sync(func: Callable[..., Any], *args, **kwargs) -> Any:
+    """Run a blocking callable in the shared executor and await its result.
+
+    The caller's context variables are copied into the worker thread, and
+    the call is profiled there when the caller is being profiled.
+    """
+    loop = asyncio.get_running_loop()
+    ctx = contextvars.copy_context()
+    call = functools.partial(ctx.run, profiled(func), *args, **kwargs)
+    return await loop.run_in_executor(get_executor(), call)
+
+
+class RateLimiter:
+    """Allows ``rate`` entries per second with at most ``concurrency`` inside.
+
+    Usable wherever a section is bounded by an ``asyncio.Semaphore``
+    (``async with`` and ``locked()``).
+    """
+
+    def __init__(self, rate: float, concurrency: int = 1):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._semaphore = asyncio.Semaphore(max(concurrency, 1))
+        self._next_at = 0.0
+
+    def locked(self) -> bool:
+        return self._semaphore.locked() or asyncio.get_running_loop().time() < self._next_at
+
+    async def __aenter__(self) -> None:
+        await self._semaphore.acquire()
+        now = asyncio.get_running_loop().time()
+        delay = self._next_at - now
+        self._next_at = max(now, self._next_at) + self.interval
+        if delay > 0:
+            try:
+                await asyncio.sleep(delay)
+            except BaseException:
+                self._semaphore.release()
+                raise
+
+    async def __aexit__(self, *exc_info) -> None:
+        self._semaphore.release()
+
+
+class Limits:
+    """Several semaphore-like limits entered in order, usable like one."""
+
+    def __init__(self, *limits):
+        self.limits = limits
+
+    def locked(self) -> bool:
+        return any(limit.locked() for limit in self.limits)
+
+    async def __aenter__(self) -> None:
+        entered = []
+        try:
+            for limit in self.limits:
+                await limit.__aenter__()
+                entered.append(limit)
+        except BaseException:
+            for limit in reversed(entered):
+                await limit.__aexit__(None, None, None)
+            raise
+
+    async def __aexit__(self, *exc_info) -> None:
+        for limit in reversed(self.limits):
+            await limit.__aexit__(*exc_info)
+
+
+def shutdown_executor(wait: bool = True) -> None:
+    """Shut down the shared executor."""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=wait)
+        _executor = None
@@ -1,7 +1,7 @@
 """Configuration management for the LangChain application."""
 import os
-from dataclasses import dataclass
-from typing import Optional
+from dataclasses import dataclass, field
+from typing import List, Optional
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -20,6 +20,34 @@ class LLMConfig:
     # Ollama specific
     ollama_base_url: str = os.getenv("OLLAMA_BASE_URL", "http://ollama.ai-stack:11434")
     ollama_model: str = os.getenv("OLLAMA_MODEL", "llama2")
+    # Comma-separated Ollama replicas to load balance over; defaults to OLLAMA_BASE_URL
+    ollama_base_urls: str = os.getenv("OLLAMA_BASE_URLS", "")
+    
+    @property
+    def model(self) -> str:
+        """Name of the model the configured provider serves."""
+        return self.openai_model if self.type.lower() == "openai" else self.ollama_model
+    
+    @property
+    def ollama_urls(self) -> List[str]:
+        urls = [url.strip() for url in self.ollama_base_urls.split(",") if url.strip()]
+        return urls or [self.ollama_base_url]
+
+@dataclass
+class LLMPoolConfig:
+    """Routing, hedging and failover across LLM backends."""
+    # Concurrent calls per backend; more wait for a slot
+    max_concurrency: int = int(os.getenv("LLM_BACKEND_MAX_CONCURRENCY", "4"))
+    # Backends tried per call, counting hedges and failovers
+    max_attempts: int = int(os.getenv("LLM_MAX_ATTEMPTS", "2"))
+    # Hedge calls slower than this percentile of the backend's recent
+    # latencies (0 disables), once it has enough samples
+    hedge_percentile: float = float(os.getenv("LLM_HEDGE_PERCENTILE", "95"))
+    hedge_min_samples: int = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+    # Consecutive errors before a backend is skipped until a health check passes
+    unhealthy_after_failures: int = int(os.getenv("LLM_UNHEALTHY_AFTER_FAILURES", "3"))
+    health_check_interval: float = float(os.getenv("LLM_HEALTH_CHECK_INTERVAL", "10"))
+    health_check_timeout: float = float(os.getenv("LLM_HEALTH_CHECK_TIMEOUT", "2"))
 
 @dataclass
 class VectorStoreConfig:
@@ -28,11 +56,57 @@ class VectorStoreConfig:
         "CRATEDB_CONNECTION_STRING", 
         "crate://ai-cratedb.ai-stack:4200"
     )
-    cache_table: str = os.getenv("CACHE_TABLE_NAME", "llm_cache")
-    semantic_cache_table: str = os.getenv("SEMANTIC_CACHE_TABLE_NAME", "semantic_cache")
+    cache_table: str = os.getenv("CACHE_TABLE_NAME", "llm_cache_entries")
+    semantic_cache_table: str = os.getenv("SEMANTIC_CACHE_TABLE_NAME", "semantic_cache_entries")
     semantic_cache_threshold: float = float(
         os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.8")
     )
+    retrieval_k: int = int(os.getenv("RETRIEVAL_K", "4"))
+    # Shared SQLAlchemy connection pool
+    pool_size: int = int(os.getenv("CRATEDB_POOL_SIZE", "10"))
+    max_overflow: int = int(os.getenv("CRATEDB_MAX_OVERFLOW", "20"))
+    pool_timeout: float = float(os.getenv("CRATEDB_POOL_TIMEOUT", "30"))
+    pool_recycle: int = int(os.getenv("CRATEDB_POOL_RECYCLE", "1800"))
+
+@dataclass
+class RetrieverConfig:
+    """Which index answers retrieval queries."""
+    # "cratedb" searches the documents table, "ann" the local in-process index
+    type: str = os.getenv("RETRIEVER_TYPE", "cratedb")
+    ann_index_path: str = os.getenv("ANN_INDEX_PATH", "./data/ann_index")
+    # Inverted lists (k-means centroids) and lists scored per query
+    ann_nlist: int = int(os.getenv("ANN_NLIST", "256"))
+    ann_nprobe: int = int(os.getenv("ANN_NPROBE", "8"))
+    # Build from the documents table when the index directory is empty
+    ann_build_on_start: bool = os.getenv("ANN_BUILD_ON_START", "true").lower() == "true"
+    # "float16" or "int8" search a compact copy first and rescore the best
+    # k * ANN_RESCORE_FACTOR candidates with the float32 vectors
+    ann_vector_dtype: str = os.getenv("ANN_VECTOR_DTYPE", "float32")
+    ann_rescore_factor: int = int(os.getenv("ANN_RESCORE_FACTOR", "4"))
+    # In-process cache of search results, dropped whenever ingestion changes the corpus
+    cache_enabled: bool = os.getenv("RETRIEVAL_CACHE_ENABLED", "true").lower() == "true"
+    cache_max_entries: int = int(os.getenv("RETRIEVAL_CACHE_MAX_ENTRIES", "10000"))
+    cache_ttl_seconds: float = float(os.getenv("RETRIEVAL_CACHE_TTL_SECONDS", "3600"))
+    # Paraphrases reuse results above this query similarity; 0 matches exact queries only
+    cache_similarity_threshold: float = float(
+        os.getenv("RETRIEVAL_CACHE_SIMILARITY_THRESHOLD", "0.95")
+    )
+
+@dataclass
+class ContextConfig:
+    """Packing of retrieved chunks into the prompt."""
+    # Candidates retrieved before packing (at least RETRIEVAL_K, which caps
+    # the chunks that end up in the prompt)
+    fetch_k: int = int(os.getenv("CONTEXT_FETCH_K", "8"))
+    # Tokens of retrieved text per prompt; 0 derives it from the model's
+    # context window minus CONTEXT_RESERVED_TOKENS
+    token_budget: int = int(os.getenv("CONTEXT_TOKEN_BUDGET", "0"))
+    reserved_tokens: int = int(os.getenv("CONTEXT_RESERVED_TOKENS", "1024"))
+    # Share of a chunk's word shingles found in a better-ranked chunk to drop it
+    dedupe_threshold: float = float(os.getenv("CONTEXT_DEDUPE_THRESHOLD", "0.8"))
+    # Maximal marginal relevance reordering; embeds the candidates per query
+    mmr_enabled: bool = os.getenv("CONTEXT_MMR_ENABLED", "false").lower() == "true"
+    mmr_lambda: float = float(os.getenv("CONTEXT_MMR_LAMBDA", "0.5"))
 
 @dataclass
 class ObservabilityConfig:
@@ -55,14 +129,154 @@ class EmbeddingsConfig:
         "SENTENCE_TRANSFORMERS_ENDPOINT",
         "http://sentence-transformers.ai-stack:8080"
     )
+    embed_path: str = os.getenv("EMBEDDINGS_PATH", "/embed")
+    # Micro-batching: requests are merged until either limit is reached
+    max_batch_size: int = int(os.getenv("EMBEDDINGS_MAX_BATCH_SIZE", "32"))
+    max_wait_ms: float = float(os.getenv("EMBEDDINGS_MAX_WAIT_MS", "5"))
+    # Concurrent HTTP requests (and pooled connections) to the endpoint
+    max_concurrency: int = int(os.getenv("EMBEDDINGS_MAX_CONCURRENCY", "4"))
+    timeout: float = float(os.getenv("EMBEDDINGS_TIMEOUT", "30"))
+
+@dataclass
+class CacheConfig:
+    """LLM cache settings: the in-process L1 tier and CrateDB table lifecycle."""
+    l1_enabled: bool = os.getenv("CACHE_L1_ENABLED", "true").lower() == "true"
+    l1_max_entries: int = int(os.getenv("CACHE_L1_MAX_ENTRIES", "10000"))
+    l1_semantic_max_entries: int = int(os.getenv("CACHE_L1_SEMANTIC_MAX_ENTRIES", "2048"))
+    l1_ttl_seconds: float = float(os.getenv("CACHE_L1_TTL_SECONDS", "300"))
+    # CrateDB tier lifecycle; the caps are enforced by each compaction
+    max_entries: int = int(os.getenv("CACHE_MAX_ENTRIES", "50000"))
+    semantic_max_entries: int = int(os.getenv("CACHE_SEMANTIC_MAX_ENTRIES", "10000"))
+    # 0 keeps entries until evicted or invalidated by ingestion
+    ttl_seconds: float = float(os.getenv("CACHE_TTL_SECONDS", "86400"))
+    # "lru" evicts the least recently hit entries, "lfu" the least hit
+    eviction_policy: str = os.getenv("CACHE_EVICTION_POLICY", "lru")
+    compaction_interval_seconds: float = float(os.getenv("CACHE_COMPACTION_INTERVAL", "300"))
+
+@dataclass
+class IngestionConfig:
+    """Directory ingestion configuration settings."""
+    file_glob: str = os.getenv("INGEST_FILE_GLOB", "**/*.txt")
+    chunk_size: int = int(os.getenv("INGEST_CHUNK_SIZE", "1000"))
+    chunk_overlap: int = int(os.getenv("INGEST_CHUNK_OVERLAP", "200"))
+    # Processes loading and splitting files; 1 splits in the calling thread
+    workers: int = int(os.getenv("INGEST_WORKERS", str(os.cpu_count() or 1)))
+    # Chunks embedded and inserted per round-trip
+    chunk_batch_size: int = int(os.getenv("INGEST_CHUNK_BATCH_SIZE", "256"))
+    # Finished jobs kept for the status endpoint
+    max_job_history: int = int(os.getenv("INGEST_MAX_JOB_HISTORY", "100"))
+
+@dataclass
+class InteractionLogConfig:
+    """Batched interaction log writer settings."""
+    queue_size: int = int(os.getenv("INTERACTION_LOG_QUEUE_SIZE", "10000"))
+    batch_size: int = int(os.getenv("INTERACTION_LOG_BATCH_SIZE", "500"))
+    flush_interval_seconds: float = float(os.getenv("INTERACTION_LOG_FLUSH_INTERVAL", "1.0"))
+    # "drop" discards records when the queue is full, "block" waits
+    overflow_policy: str = os.getenv("INTERACTION_LOG_OVERFLOW_POLICY", "drop")
+
+@dataclass
+class CoalescingConfig:
+    """Single-flight coalescing of concurrent identical queries."""
+    enabled: bool = os.getenv("COALESCING_ENABLED", "true").lower() == "true"
+    # Also join in-flight queries whose embeddings are near-duplicates
+    semantic_enabled: bool = os.getenv("COALESCING_SEMANTIC_ENABLED", "false").lower() == "true"
+    semantic_threshold: float = float(os.getenv("COALESCING_SEMANTIC_THRESHOLD", "0.95"))
+    # How long a finished result can still be joined
+    window_seconds: float = float(os.getenv("COALESCING_WINDOW_SECONDS", "2.0"))
+
+@dataclass
+class BatchConfig:
+    """/query/batch settings."""
+    max_queries: int = int(os.getenv("QUERY_BATCH_MAX_QUERIES", "10000"))
+    # Queries embedded and bulk-checked against the caches together
+    chunk_size: int = int(os.getenv("QUERY_BATCH_CHUNK_SIZE", "256"))
+    # Per batch: cache lookups and vector searches, and LLM calls, in flight
+    max_concurrency: int = int(os.getenv("QUERY_BATCH_MAX_CONCURRENCY", "16"))
+    max_generations: int = int(os.getenv("QUERY_BATCH_MAX_GENERATIONS", "4"))
+    # Larger batches are streamed as NDJSON unless the request says otherwise
+    stream_threshold: int = int(os.getenv("QUERY_BATCH_STREAM_THRESHOLD", "500"))
+
+@dataclass
+class AdmissionConfig:
+    """Admission control for /query."""
+    enabled: bool = os.getenv("ADMISSION_ENABLED", "true").lower() == "true"
+    # Fast lane: cache lookups, then retrieval for misses
+    max_concurrency: int = int(os.getenv("ADMISSION_MAX_CONCURRENCY", "64"))
+    max_queued: int = int(os.getenv("ADMISSION_MAX_QUEUED", "512"))
+    queue_deadline_seconds: float = float(os.getenv("ADMISSION_QUEUE_DEADLINE", "2"))
+    # LLM lane: generations for cache misses
+    max_generations: int = int(os.getenv("ADMISSION_MAX_GENERATIONS", "8"))
+    max_queued_generations: int = int(os.getenv("ADMISSION_MAX_QUEUED_GENERATIONS", "32"))
+    generation_deadline_seconds: float = float(
+        os.getenv("ADMISSION_GENERATION_DEADLINE", "10")
+    )
+
+@dataclass
+class WarmingConfig:
+    """Cache warming from the interactions log."""
+    on_startup: bool = os.getenv("WARMING_ON_STARTUP", "false").lower() == "true"
+    # "frequent" (most requested) or "expensive" (slowest uncached answers)
+    strategy: str = os.getenv("WARMING_STRATEGY", "frequent")
+    top_n: int = int(os.getenv("WARMING_TOP_N", "200"))
+    lookback_hours: float = float(os.getenv("WARMING_LOOKBACK_HOURS", "168"))
+    min_requests: int = int(os.getenv("WARMING_MIN_REQUESTS", "2"))
+    batch_size: int = int(os.getenv("WARMING_BATCH_SIZE", "32"))
+    # Cache lookups and vector searches in flight
+    max_concurrency: int = int(os.getenv("WARMING_MAX_CONCURRENCY", "4"))
+    # LLM calls per run, and how fast and how many at once they are made
+    max_generations: int = int(os.getenv("WARMING_MAX_GENERATIONS", "50"))
+    generations_per_second: float = float(os.getenv("WARMING_GENERATIONS_PER_SECOND", "0.5"))
+    generation_concurrency: int = int(os.getenv("WARMING_GENERATION_CONCURRENCY", "1"))
+    # Store logged answers newer than the last corpus change instead of regenerating them
+    reuse_logged: bool = os.getenv("WARMING_REUSE_LOGGED", "true").lower() == "true"
+
+@dataclass
+class ProfilingConfig:
+    """cProfile/tracemalloc profiling of /query and ingestion jobs."""
+    # Allows the X-Profile request header and arming profiles with POST /profiles
+    enabled: bool = os.getenv("PROFILING_ENABLED", "false").lower() == "true"
+    # Share of /query requests and ingestion jobs profiled without being asked
+    sample_rate: float = float(os.getenv("PROFILING_SAMPLE_RATE", "0"))
+    # Where .prof (and .tracemalloc) files are written; empty keeps reports in memory only
+    output_dir: str = os.getenv("PROFILING_OUTPUT_DIR", "./data/profiles")
+    # Reports kept, with their files; older ones are deleted
+    max_profiles: int = int(os.getenv("PROFILING_MAX_PROFILES", "50"))
+    top_functions: int = int(os.getenv("PROFILING_TOP_FUNCTIONS", "30"))
+    # Allocation snapshots for ingestion profiles, with this many frames per allocation
+    tracemalloc: bool = os.getenv("PROFILING_TRACEMALLOC", "false").lower() == "true"
+    tracemalloc_frames: int = int(os.getenv("PROFILING_TRACEMALLOC_FRAMES", "5"))
+
+@dataclass
+class ServerConfig:
+    """Request handling configuration settings."""
+    port: int = int(os.getenv("PORT", "8000"))
+    # Upper bound on threads used to run blocking (sync) components
+    executor_workers: int = int(os.getenv("EXECUTOR_MAX_WORKERS", "32"))
+    # Delay between attempts to start components whose dependency is down
+    startup_retry_seconds: float = float(os.getenv("STARTUP_RETRY_SECONDS", "5"))
+    # Bearer token for admin routes (/profiles); they are refused while unset
+    admin_token: str = os.getenv("ADMIN_TOKEN", "")
 
 @dataclass
 class Config:
     """Main application configuration."""
-    llm: LLMConfig = LLMConfig()
-    vector_store: VectorStoreConfig = VectorStoreConfig()
-    observability: ObservabilityConfig = ObservabilityConfig()
-    embeddings: EmbeddingsConfig = EmbeddingsConfig()
+    llm: LLMConfig = field(default_factory=LLMConfig)
+    llm_pool: LLMPoolConfig = field(default_factory=LLMPoolConfig)
+    vector_store: VectorStoreConfig = field(default_factory=VectorStoreConfig)
+    retriever: RetrieverConfig = field(default_factory=RetrieverConfig)
+    context: ContextConfig = field(default_factory=ContextConfig)
+    observability: ObservabilityConfig = field(default_factory=ObservabilityConfig)
+    embeddings: EmbeddingsConfig = field(default_factory=EmbeddingsConfig)
+    server: ServerConfig = field(default_factory=ServerConfig)
+    ingestion: IngestionConfig = field(default_factory=IngestionConfig)
+    cache: CacheConfig = field(default_factory=CacheConfig)
+    interactions: InteractionLogConfig = field(default_factory=InteractionLogConfig)
+    coalescing: CoalescingConfig = field(default_factory=CoalescingConfig)
+    batch: BatchConfig = field(default_factory=BatchConfig)
+    warming: WarmingConfig = field(default_factory=WarmingConfig)
+    admission: AdmissionConfig = field(default_factory=AdmissionConfig)
+    profiling: ProfilingConfig = field(default_factory=ProfilingConfig)
 
 # Create a global config instance
 config = Config()
@@ -0,0 +1,643 @@
+"""In-process approximate nearest neighbour (IVF) index over memory-mapped vectors.
+
+Vectors are appended to a raw float32 file that every process maps
+read-only, so the page cache is shared between workers and a restart does
+not have to re-read CrateDB. Rows are partitioned by k-means centroids
+(an inverted file); a search scores only the ``nprobe`` closest lists.
+Deletes are tombstones; ``build`` rewrites the index compactly.
+
+Worker processes share the directory: writers take turns on a lock file
+and start from the latest committed state, and small files are replaced
+atomically, so readers in other processes always see a consistent index.
+
+Optionally a float16 or int8 copy of the vectors serves the first pass
+and only the best ``k * rescore_factor`` candidates are rescored with the
+float32 rows, so searches touch a half or a quarter of the pages.
+
+Build or rebuild from the documents table with::
+
+    python -m app.data.ann_index
+
+or convert an existing index to another vector type in place with::
+
+    python -m app.data.ann_index --quantize int8
+"""
+import argparse
+import fcntl
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain.schema import Document
+from langchain.schema.vectorstore import VectorStore
+
+logger = logging.getLogger(__name__)
+
+VECTORS_FILE = "vectors.f32"
+# First-pass copies of the vectors by type; int8 rows have a float32 scale each
+QUANTIZED_FILES = {"float16": "vectors.f16", "int8": "vectors.i8"}
+SCALES_FILE = "scales.f32"
+VECTOR_DTYPES = ("float32", "float16", "int8")
+DOCUMENTS_FILE = "documents.jsonl"
+CENTROIDS_FILE = "centroids.npy"
+ASSIGNMENTS_FILE = "assignments.npy"
+DELETED_FILE = "deleted.npy"
+STATE_FILE = "index.json"
+# Writers of any process hold the first, a build the second
+WRITE_LOCK_FILE = "write.lock"
+BUILD_LOCK_FILE = "build.lock"
+
+# Train centroids once there are this many rows per list, retrain when
+# the index has doubled since the last training
+MIN_ROWS_PER_LIST = 39
+KMEANS_ITERATIONS = 10
+KMEANS_SAMPLE_PER_LIST = 256
+ASSIGN_CHUNK_ROWS = 65536
+# How often readers check whether another process changed the index
+REFRESH_INTERVAL_SECONDS = 1.0
+
+# Rows of the langchain CrateDB embedding table read by ``build_from_table``
+DOCUMENTS_QUERY = (
+    "SELECT custom_id, document, cmetadata, embedding FROM {table} "
+    "ORDER BY custom_id LIMIT ? OFFSET ?"
+)
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    """Scale rows to unit length so a dot product is cosine similarity."""
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def quantize(vectors: np.ndarray, dtype: str) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """Return ``(codes, scales)``; int8 rows are scaled by their largest component."""
+    if dtype == "float16":
+        return vectors.astype(np.float16), None
+    scales = np.abs(vectors).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.round(vectors / scales[:, None]).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+def approximate_scores(codes: np.ndarray, scales: Optional[np.ndarray], query: np.ndarray,
+                       rows: Optional[np.ndarray] = None) -> np.ndarray:
+    """Dot products of ``query`` with quantized rows (all rows if ``rows`` is None)."""
+    if rows is not None:
+        scores = codes[rows].astype(np.float32) @ query
+        return scores * scales[rows] if scales is not None else scores
+    scores = np.empty(len(codes), dtype=np.float32)
+    for start in range(0, len(codes), ASSIGN_CHUNK_ROWS):
+        chunk = np.asarray(codes[start:start + ASSIGN_CHUNK_ROWS], dtype=np.float32)
+        scores[start:start + len(chunk)] = chunk @ query
+    return scores * scales if scales is not None else scores
+
+
+@dataclass
+class _Snapshot:
+    """Immutable view of the index that searches read without locking."""
+    vectors: np.ndarray
+    deleted: np.ndarray
+    centroids: Optional[np.ndarray] = None
+    assignments: Optional[np.ndarray] = None
+    lists: Optional[List[np.ndarray]] = None
+    # Quantized first-pass copy of ``vectors`` and its int8 scales
+    codes: Optional[np.ndarray] = None
+    scales: Optional[np.ndarray] = None
+
+
+class ANNIndex(VectorStore):
+    """IVF index persisted in a directory, usable as a LangChain vector store."""
+
+    def __init__(self, path: str, embedding=None, nlist: int = 256, nprobe: int = 8,
+                 vector_dtype: str = "float32", rescore_factor: int = 4):
+        if vector_dtype not in VECTOR_DTYPES:
+            raise ValueError(f"Unknown vector type {vector_dtype!r}, use one of {VECTOR_DTYPES}")
+        self.path = path
+        self._embedding = embedding
+        self.nlist = nlist
+        self.nprobe = nprobe
+        # Type new indexes are built with; an existing index keeps its own until converted
+        self.vector_dtype = vector_dtype
+        self.rescore_factor = max(rescore_factor, 1)
+        self._stored_dtype = vector_dtype
+        self._lock = threading.Lock()
+        self._rows: Dict[str, int] = {}
+        self._documents: List[Tuple[str, str, dict]] = []
+        self._dim: Optional[int] = None
+        self._trained_count = 0
+        self._generation = uuid.uuid4().hex
+        # Commits of this generation so far, to tell whether another process wrote
+        self._revision = 0
+        self._documents_offset = 0
+        self._state_mtime = 0
+        self._next_refresh = 0.0
+        self._snapshot = _Snapshot(np.zeros((0, 0), dtype=np.float32), np.zeros(0, dtype=bool))
+        os.makedirs(path, exist_ok=True)
+        self._load()
+        if len(self._documents) and self._stored_dtype != vector_dtype:
+            logger.warning(
+                f"ANN index stores {self._stored_dtype} vectors, not {vector_dtype}; convert it "
+                f"with python -m app.data.ann_index --quantize {vector_dtype}"
+            )
+
+    @classmethod
+    def open(cls, config, embedding=None) -> "ANNIndex":
+        """Open (or create) the index configured in ``RetrieverConfig``."""
+        return cls(
+            config.ann_index_path, embedding, config.ann_nlist, config.ann_nprobe,
+            config.ann_vector_dtype, config.ann_rescore_factor
+        )
+
+    @property
+    def embeddings(self):
+        return self._embedding
+
+    def __len__(self) -> int:
+        return len(self._documents) - int(self._snapshot.deleted.sum())
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    # Persistence
+
+    def _map_vectors(self, count: int) -> np.ndarray:
+        if not count:
+            return np.zeros((0, self._dim or 0), dtype=np.float32)
+        return np.memmap(
+            self._file(VECTORS_FILE), dtype=np.float32, mode="r", shape=(count, self._dim)
+        )
+
+    def _map_codes(self, count: int, dtype: str) -> Tuple[Optional[np.ndarray], Optional[np.ndarray]]:
+        if dtype == "float32":
+            return None, None
+        if not count:
+            return np.zeros((0, self._dim or 0), dtype=dtype), (
+                np.zeros(0, dtype=np.float32) if dtype == "int8" else None
+            )
+        codes = np.memmap(
+            self._file(QUANTIZED_FILES[dtype]), dtype=dtype, mode="r", shape=(count, self._dim)
+        )
+        scales = None
+        if dtype == "int8":
+            scales = np.memmap(self._file(SCALES_FILE), dtype=np.float32, mode="r", shape=(count,))
+        return codes, scales
+
+    def _read_state(self) -> Optional[dict]:
+        try:
+            self._state_mtime = os.stat(self._file(STATE_FILE)).st_mtime_ns
+            with open(self._file(STATE_FILE)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def _load(self, state: Optional[dict] = None) -> None:
+        """Read the committed state; rows appended after the last commit are ignored."""
+        state = state or self._read_state()
+        if state is None:
+            return
+        count = state["count"]
+        if state["generation"] != self._generation:
+            self._documents, self._rows, self._documents_offset = [], {}, 0
+        with open(self._file(DOCUMENTS_FILE), "rb") as f:
+            f.seek(self._documents_offset)
+            while len(self._documents) < count:
+                line = f.readline()
+                record = json.loads(line)
+                self._rows[record["id"]] = len(self._documents)
+                self._documents.append((record["id"], record["text"], record["metadata"]))
+                self._documents_offset += len(line)
+        self._dim = state["dim"]
+        self._generation = state["generation"]
+        self._revision = state.get("revision", 0)
+        self._trained_count = state["trained_count"]
+        self._stored_dtype = state.get("vector_dtype", "float32")
+        snapshot = _Snapshot(self._map_vectors(count), np.load(self._file(DELETED_FILE))[:count])
+        snapshot.codes, snapshot.scales = self._map_codes(count, self._stored_dtype)
+        if state["trained_count"]:
+            snapshot.centroids = np.load(self._file(CENTROIDS_FILE))
+            snapshot.assignments = np.load(self._file(ASSIGNMENTS_FILE))[:count]
+            snapshot.lists = self._build_lists(snapshot.assignments, len(snapshot.centroids))
+        self._snapshot = snapshot
+
+    def _save_array(self, name: str, array: np.ndarray) -> None:
+        tmp_path = self._file(name + ".tmp")
+        with open(tmp_path, "wb") as f:
+            np.save(f, array)
+        os.replace(tmp_path, self._file(name))
+
+    def _commit(self, snapshot: _Snapshot) -> None:
+        """Write the small index files; the state file is replaced last.
+
+        Every file is written aside and renamed into place, so a reader
+        never loads a half-written array.
+        """
+        self._save_array(DELETED_FILE, snapshot.deleted)
+        if snapshot.centroids is not None:
+            self._save_array(CENTROIDS_FILE, snapshot.centroids)
+            self._save_array(ASSIGNMENTS_FILE, snapshot.assignments)
+        self._revision += 1
+        state = {
+            "count": len(snapshot.deleted),
+            "dim": self._dim,
+            "generation": self._generation,
+            "revision": self._revision,
+            "trained_count": self._trained_count,
+            "vector_dtype": self._stored_dtype,
+        }
+        tmp_path = self._file(STATE_FILE + ".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self._file(STATE_FILE))
+        self._state_mtime = os.stat(self._file(STATE_FILE)).st_mtime_ns
+        self._snapshot = snapshot
+
+    def refresh(self, force: bool = False) -> None:
+        """Pick up rows another process committed since the last check."""
+        now = time.monotonic()
+        if now < self._next_refresh and not force:
+            return
+        self._next_refresh = now + REFRESH_INTERVAL_SECONDS
+        try:
+            mtime = os.stat(self._file(STATE_FILE)).st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime != self._state_mtime:
+            with self._lock:
+                self._load()
+
+    def _reset(self) -> None:
+        """Forget every row, starting a new generation."""
+        self._rows, self._documents, self._documents_offset = {}, [], 0
+        self._trained_count = 0
+        self._generation = uuid.uuid4().hex
+        self._revision = 0
+        self._snapshot = _Snapshot(
+            np.zeros((0, self._dim or 0), dtype=np.float32), np.zeros(0, dtype=bool)
+        )
+
+    def _truncate(self) -> None:
+        """Cut off rows a writer appended but never committed, e.g. before it crashed."""
+        count = len(self._snapshot.deleted)
+        values = count * (self._dim or 0)
+        sizes = {DOCUMENTS_FILE: self._documents_offset, VECTORS_FILE: values * 4}
+        if self._stored_dtype in QUANTIZED_FILES:
+            sizes[QUANTIZED_FILES[self._stored_dtype]] = values * np.dtype(self._stored_dtype).itemsize
+        if self._stored_dtype == "int8":
+            sizes[SCALES_FILE] = count * 4
+        for name, size in sizes.items():
+            if os.path.exists(self._file(name)) and os.path.getsize(self._file(name)) > size:
+                os.truncate(self._file(name), size)
+
+    @contextmanager
+    def _file_lock(self, name: str) -> Iterator[None]:
+        """Exclusive lock shared with every process using the index directory."""
+        with open(self._file(name), "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            yield
+
+    @contextmanager
+    def _writing(self) -> Iterator[None]:
+        """Serialize writers across threads and processes.
+
+        Inside, the in-memory state is the latest committed one, whichever
+        process committed it, so appended rows start where the files end.
+        """
+        with self._lock, self._file_lock(WRITE_LOCK_FILE):
+            state = self._read_state()
+            if state is None:
+                self._reset()
+            elif (state["generation"], state.get("revision", 0)) != (self._generation, self._revision):
+                self._load(state)
+            self._truncate()
+            try:
+                yield
+            except BaseException:
+                # Drop uncommitted changes; the committed state is reloaded in full
+                self._reset()
+                self._load()
+                raise
+
+    # Clustering
+
+    @staticmethod
+    def _build_lists(assignments: np.ndarray, nlist: int) -> List[np.ndarray]:
+        order = np.argsort(assignments, kind="stable")
+        bounds = np.searchsorted(assignments[order], np.arange(nlist + 1))
+        return [order[bounds[i]:bounds[i + 1]] for i in range(nlist)]
+
+    @staticmethod
+    def _assign(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+        assignments = np.empty(len(vectors), dtype=np.int32)
+        for start in range(0, len(vectors), ASSIGN_CHUNK_ROWS):
+            chunk = np.asarray(vectors[start:start + ASSIGN_CHUNK_ROWS])
+            assignments[start:start + len(chunk)] = np.argmax(chunk @ centroids.T, axis=1)
+        return assignments
+
+    def _train(self, vectors: np.ndarray) -> np.ndarray:
+        """Spherical k-means on a sample of the rows."""
+        rng = np.random.default_rng(0)
+        nlist = min(self.nlist, max(1, len(vectors) // MIN_ROWS_PER_LIST))
+        sample_size = min(len(vectors), nlist * KMEANS_SAMPLE_PER_LIST)
+        sample = np.asarray(vectors[np.sort(rng.choice(len(vectors), sample_size, replace=False))])
+        centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+        for _ in range(KMEANS_ITERATIONS):
+            assignments = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignments, sample)
+            empty = np.bincount(assignments, minlength=nlist) == 0
+            # Reseed empty lists with random rows
+            sums[empty] = sample[rng.choice(len(sample), int(empty.sum()))]
+            centroids = normalize(sums)
+        return centroids
+
+    def _needs_training(self, count: int) -> bool:
+        if count < MIN_ROWS_PER_LIST * min(self.nlist, 8):
+            return False
+        return not self._trained_count or count >= 2 * self._trained_count
+
+    # Writes
+
+    def add_embeddings(
+        self,
+        texts: List[str],
+        embeddings: List[List[float]],
+        metadatas: Optional[List[dict]] = None,
+        ids: Optional[List[str]] = None,
+        **kwargs: Any
+    ) -> List[str]:
+        """Append rows; an existing ID is replaced (its old row tombstoned)."""
+        if not texts:
+            return []
+        ids = ids or [uuid.uuid4().hex for _ in texts]
+        metadatas = metadatas or [{} for _ in texts]
+        vectors = normalize(np.asarray(embeddings, dtype=np.float32))
+        with self._writing():
+            if self._dim is None:
+                self._dim = vectors.shape[1]
+            snapshot = self._snapshot
+            start = len(snapshot.deleted)
+            if not start:
+                self._stored_dtype = self.vector_dtype
+            with open(self._file(DOCUMENTS_FILE), "ab") as f:
+                for id_, text, metadata in zip(ids, texts, metadatas):
+                    line = (json.dumps({"id": id_, "text": text, "metadata": metadata}) + "\n").encode()
+                    f.write(line)
+                    self._documents_offset += len(line)
+            with open(self._file(VECTORS_FILE), "ab") as f:
+                f.write(vectors.tobytes())
+            if self._stored_dtype != "float32":
+                codes, scales = quantize(vectors, self._stored_dtype)
+                with open(self._file(QUANTIZED_FILES[self._stored_dtype]), "ab") as f:
+                    f.write(codes.tobytes())
+                if scales is not None:
+                    with open(self._file(SCALES_FILE), "ab") as f:
+                        f.write(scales.tobytes())
+            deleted = np.concatenate([snapshot.deleted, np.zeros(len(ids), dtype=bool)])
+            for offset, id_ in enumerate(ids):
+                if id_ in self._rows:
+                    deleted[self._rows[id_]] = True
+                self._rows[id_] = start + offset
+                self._documents.append((id_, texts[offset], metadatas[offset]))
+
+            count = start + len(ids)
+            updated = _Snapshot(self._map_vectors(count), deleted, snapshot.centroids)
+            updated.codes, updated.scales = self._map_codes(count, self._stored_dtype)
+            if self._needs_training(count):
+                updated.centroids = self._train(updated.vectors)
+                updated.assignments = self._assign(updated.vectors, updated.centroids)
+                self._trained_count = count
+            elif snapshot.centroids is not None:
+                updated.assignments = np.concatenate([
+                    snapshot.assignments, self._assign(vectors, snapshot.centroids)
+                ])
+            if updated.centroids is not None:
+                updated.lists = self._build_lists(updated.assignments, len(updated.centroids))
+            self._commit(updated)
+        return ids
+
+    def add_texts(
+        self,
+        texts: Iterable[str],
+        metadatas: Optional[List[dict]] = None,
+        **kwargs: Any
+    ) -> List[str]:
+        texts = list(texts)
+        return self.add_embeddings(texts, self._embedding.embed_documents(texts), metadatas, **kwargs)
+
+    def delete(self, ids: Optional[List[str]] = None, **kwargs: Any) -> Optional[bool]:
+        """Tombstone rows by ID."""
+        with self._writing():
+            snapshot = self._snapshot
+            deleted = snapshot.deleted.copy()
+            for id_ in ids or ():
+                row = self._rows.pop(id_, None)
+                if row is not None:
+                    deleted[row] = True
+            self._commit(_Snapshot(
+                snapshot.vectors, deleted, snapshot.centroids, snapshot.assignments, snapshot.lists,
+                snapshot.codes, snapshot.scales
+            ))
+        return True
+
+    def quantize(self, dtype: str) -> None:
+        """Rewrite the first-pass copy of every row as ``dtype`` (float32 drops it)."""
+        if dtype not in VECTOR_DTYPES:
+            raise ValueError(f"Unknown vector type {dtype!r}, use one of {VECTOR_DTYPES}")
+        with self._writing():
+            snapshot = self._snapshot
+            count = len(snapshot.deleted)
+            if dtype != "float32":
+                files = [QUANTIZED_FILES[dtype]] + ([SCALES_FILE] if dtype == "int8" else [])
+                outputs = [open(self._file(name + ".tmp"), "wb") for name in files]
+                try:
+                    for start in range(0, count, ASSIGN_CHUNK_ROWS):
+                        chunk = np.asarray(snapshot.vectors[start:start + ASSIGN_CHUNK_ROWS])
+                        for output, data in zip(outputs, quantize(chunk, dtype)):
+                            output.write(data.tobytes())
+                finally:
+                    for output in outputs:
+                        output.close()
+                for name in files:
+                    os.replace(self._file(name + ".tmp"), self._file(name))
+            self.vector_dtype = self._stored_dtype = dtype
+            codes, scales = self._map_codes(count, dtype)
+            self._commit(_Snapshot(
+                snapshot.vectors, snapshot.deleted, snapshot.centroids, snapshot.assignments,
+                snapshot.lists, codes, scales
+            ))
+            # Files of the previous type are no longer referenced by the state
+            keep = {QUANTIZED_FILES.get(dtype), SCALES_FILE if dtype == "int8" else None}
+            for name in (*QUANTIZED_FILES.values(), SCALES_FILE):
+                if name not in keep and os.path.exists(self._file(name)):
+                    os.remove(self._file(name))
+
+    def vector_bytes(self) -> Dict[str, int]:
+        """Bytes of the full-precision rows and of the first-pass copy searches scan."""
+        snapshot = self._snapshot
+        full = int(snapshot.vectors.nbytes)
+        first_pass = full if snapshot.codes is None else int(snapshot.codes.nbytes) + (
+            int(snapshot.scales.nbytes) if snapshot.scales is not None else 0
+        )
+        return {"float32": full, "first_pass": first_pass}
+
+    def build(
+        self,
+        batches: Iterable[Sequence[Tuple[str, str, dict, List[float]]]],
+        if_empty: bool = False
+    ) -> int:
+        """Replace the index with ``(id, text, metadata, vector)`` rows.
+
+        One process builds at a time. With ``if_empty`` the index is only
+        built if it has no rows once this process's turn comes, so workers
+        starting together build it once and the others load the result.
+        """
+        with self._file_lock(BUILD_LOCK_FILE):
+            if if_empty:
+                self.refresh(force=True)
+                if len(self):
+                    return len(self)
+            with self._writing():
+                # The state goes first, so readers keep their snapshot meanwhile
+                for name in (STATE_FILE, VECTORS_FILE, DOCUMENTS_FILE, CENTROIDS_FILE,
+                             ASSIGNMENTS_FILE, DELETED_FILE, *QUANTIZED_FILES.values(), SCALES_FILE):
+                    if os.path.exists(self._file(name)):
+                        os.remove(self._file(name))
+                self._reset()
+            for batch in batches:
+                ids, texts, metadatas, vectors = zip(*batch)
+                self.add_embeddings(list(texts), list(vectors), list(metadatas), list(ids))
+            return len(self)
+
+    # Search
+
+    def search(self, embedding: Sequence[float], k: int = 4) -> List[Tuple[int, float]]:
+        """Return ``(row, cosine similarity)`` for the approximate top k rows."""
+        self.refresh()
+        snapshot = self._snapshot
+        if not len(snapshot.deleted):
+            return []
+        query = normalize(np.asarray(embedding, dtype=np.float32))
+        if snapshot.centroids is None:
+            rows = np.flatnonzero(~snapshot.deleted)
+            if snapshot.codes is None:
+                scores = np.asarray(snapshot.vectors) @ query
+            else:
+                scores = approximate_scores(snapshot.codes, snapshot.scales, query)
+            scores = scores[rows]
+        else:
+            nprobe = min(self.nprobe, len(snapshot.centroids))
+            probes = np.argpartition(-(snapshot.centroids @ query), nprobe - 1)[:nprobe]
+            rows = np.sort(np.concatenate([snapshot.lists[p] for p in probes]))
+            rows = rows[~snapshot.deleted[rows]]
+            if snapshot.codes is None:
+                scores = snapshot.vectors[rows] @ query
+            else:
+                scores = approximate_scores(snapshot.codes, snapshot.scales, query, rows)
+        if snapshot.codes is not None:
+            # Rescore the best approximate candidates with the float32 rows
+            candidates = min(len(rows), k * self.rescore_factor)
+            if len(rows) > candidates:
+                best = np.sort(np.argpartition(-scores, candidates - 1)[:candidates])
+                rows = rows[best]
+            scores = snapshot.vectors[rows] @ query
+        if len(rows) > k:
+            top = np.argpartition(-scores, k - 1)[:k]
+        else:
+            top = np.arange(len(rows))
+        top = top[np.argsort(-scores[top])]
+        return [(int(rows[i]), float(scores[i])) for i in top]
+
+    def similarity_search_with_score_by_vector(
+        self, embedding: List[float], k: int = 4, **kwargs: Any
+    ) -> List[Tuple[Document, float]]:
+        results = []
+        for row, score in self.search(embedding, k):
+            id_, text, metadata = self._documents[row]
+            results.append((Document(page_content=text, metadata=dict(metadata, id=id_)), score))
+        return results
+
+    def similarity_search_by_vector(
+        self, embedding: List[float], k: int = 4, **kwargs: Any
+    ) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score_by_vector(embedding, k)]
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: Any) -> List[Document]:
+        return self.similarity_search_by_vector(self._embedding.embed_query(query), k)
+
+    @classmethod
+    def from_texts(cls, texts: List[str], embedding, metadatas=None, path: str = "ann_index",
+                   **kwargs: Any) -> "ANNIndex":
+        index = cls(path, embedding, **kwargs)
+        index.add_texts(texts, metadatas)
+        return index
+
+
+def iter_table_rows(
+    fetch_all: Callable[[str, Sequence[Any]], List[tuple]],
+    table_name: str = "documents",
+    batch_size: int = 5000
+) -> Iterable[List[Tuple[str, str, dict, List[float]]]]:
+    """Page through the documents table in ``(id, text, metadata, vector)`` batches."""
+    offset = 0
+    while True:
+        rows = fetch_all(DOCUMENTS_QUERY.format(table=table_name), (batch_size, offset))
+        if not rows:
+            return
+        yield [
+            (str(id_), text, metadata if isinstance(metadata, dict) else json.loads(metadata or "{}"),
+             vector)
+            for id_, text, metadata, vector in rows
+        ]
+        offset += len(rows)
+
+
+def build_from_table(
+    index: ANNIndex,
+    fetch_all,
+    table_name: str = "documents",
+    if_empty: bool = False
+) -> int:
+    """Rebuild ``index`` from every row of the CrateDB documents table.
+
+    With ``if_empty``, an index that already has rows (possibly built by
+    another process meanwhile) is kept and the table is not read.
+    """
+    start_time = time.time()
+    count = index.build(iter_table_rows(fetch_all, table_name), if_empty=if_empty)
+    logger.info(f"ANN index has {count} vectors after {time.time() - start_time:.1f}s")
+    return count
+
+
+if __name__ == "__main__":
+    from ..config import config
+    from ..resources import ResourceRegistry
+
+    parser = argparse.ArgumentParser(description="Build or convert the local ANN index.")
+    parser.add_argument(
+        "--quantize", choices=VECTOR_DTYPES,
+        help="convert the existing index's first-pass vectors instead of rebuilding from CrateDB"
+    )
+    args = parser.parse_args()
+    logging.basicConfig(level=config.observability.log_level)
+    index = ANNIndex.open(config.retriever)
+    if args.quantize:
+        start_time = time.time()
+        index.quantize(args.quantize)
+        logger.info(
+            f"Converted {len(index)} ANN index vectors to {args.quantize} "
+            f"in {time.time() - start_time:.1f}s: {index.vector_bytes()}"
+        )
+    else:
+        resources = ResourceRegistry(config)
+        try:
+            build_from_table(index, resources.fetch_all)
+        finally:
+            resources.close()
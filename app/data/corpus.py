@@ -0,0 +1,85 @@
+"""Version counter of the document corpus, shared by every process."""
+import threading
+import time
+from typing import Any, Callable, List, Optional, Sequence
+
+# How long a process trusts its last read of the counter
+REFRESH_SECONDS = 1.0
+
+
+class CorpusVersion:
+    """Counter in CrateDB that ingestion bumps whenever documents change.
+
+    Caches store the version an entry was computed under and treat older
+    entries as stale. Reads are cached for ``refresh_seconds``, so other
+    processes see a bump within about that long; the bumping process sees
+    it immediately.
+    """
+
+    def __init__(
+        self,
+        execute: Callable[[str, Sequence[Any]], Any],
+        fetch_all: Callable[[str, Sequence[Any]], List[tuple]],
+        table_name: str = "corpus_state",
+        refresh_seconds: float = REFRESH_SECONDS
+    ):
+        self.execute = execute
+        self.fetch_all = fetch_all
+        self.table_name = table_name
+        self.refresh_seconds = refresh_seconds
+        self._version: Optional[int] = None
+        self._changed_at = 0.0
+        self._read_at = 0.0
+        self._lock = threading.Lock()
+        self._created = False
+
+    def _create_table(self) -> None:
+        if self._created:
+            return
+        self.execute(
+            f"CREATE TABLE IF NOT EXISTS {self.table_name} "
+            "(name TEXT PRIMARY KEY, version BIGINT, changed_at DOUBLE PRECISION)"
+        )
+        self.execute(
+            f"INSERT INTO {self.table_name} (name, version, changed_at) "
+            "VALUES ('documents', 0, 0) ON CONFLICT (name) DO NOTHING"
+        )
+        self._created = True
+
+    def current(self) -> int:
+        """The latest version, read at most every ``refresh_seconds``."""
+        with self._lock:
+            if self._version is None or time.monotonic() - self._read_at > self.refresh_seconds:
+                self._create_table()
+                rows = self.fetch_all(
+                    f"SELECT version, changed_at FROM {self.table_name} WHERE name = 'documents'"
+                )
+                self._version = int(rows[0][0]) if rows else 0
+                self._changed_at = float(rows[0][1] or 0.0) if rows else 0.0
+                self._read_at = time.monotonic()
+            return self._version
+
+    def cached(self) -> Optional[int]:
+        """The last version read if still fresh, else None; never touches CrateDB."""
+        version, read_at = self._version, self._read_at
+        if version is None or time.monotonic() - read_at > self.refresh_seconds:
+            return None
+        return version
+
+    def changed_at(self) -> float:
+        """Wall-clock time of the latest bump (0 if the corpus never changed)."""
+        self.current()
+        return self._changed_at
+
+    def bump(self) -> int:
+        """Record a corpus change and return the new version."""
+        with self._lock:
+            self._create_table()
+            self.execute(
+                f"UPDATE {self.table_name} SET version = version + 1, changed_at = ? "
+                "WHERE name = 'documents'",
+                (time.time(),)
+            )
+            # Force the next current() to read the new value
+            self._version = None
+        return self.current()
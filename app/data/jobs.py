@@ -0,0 +1,139 @@
+"""Background ingestion jobs and their progress tracking."""
+import asyncio
+import logging
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Only the most recent error messages are kept per job
+MAX_JOB_ERRORS = 50
+
+
+@dataclass
+class IngestionJob:
+    """Progress of a single directory ingestion run."""
+    directory_path: str
+    id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    status: str = "pending"
+    # Files examined, and what happened to them relative to the manifest
+    files_done: int = 0
+    files_skipped: int = 0
+    files_added: int = 0
+    files_updated: int = 0
+    files_deleted: int = 0
+    # Chunks embedded and stored, already stored, and removed
+    chunks_done: int = 0
+    chunks_deduplicated: int = 0
+    chunks_deleted: int = 0
+    error_count: int = 0
+    errors: List[str] = field(default_factory=list)
+    # Set when the job is profiled, see GET /profiles/{profile_id}
+    profile_id: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+
+    def record_error(self, source: str, error: Exception) -> None:
+        """Record a per-file error without failing the job."""
+        self.error_count += 1
+        if len(self.errors) < MAX_JOB_ERRORS:
+            self.errors.append(f"{source}: {error}")
+
+    @property
+    def elapsed(self) -> float:
+        if self.started_at is None:
+            return 0.0
+        return (self.finished_at or time.time()) - self.started_at
+
+    @property
+    def chunks_per_second(self) -> float:
+        elapsed = self.elapsed
+        return self.chunks_done / elapsed if elapsed > 0 else 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Serialize job status for the API."""
+        return {
+            "job_id": self.id,
+            "directory_path": self.directory_path,
+            "status": self.status,
+            "files_done": self.files_done,
+            "files_skipped": self.files_skipped,
+            "files_added": self.files_added,
+            "files_updated": self.files_updated,
+            "files_deleted": self.files_deleted,
+            "chunks_done": self.chunks_done,
+            "chunks_deduplicated": self.chunks_deduplicated,
+            "chunks_deleted": self.chunks_deleted,
+            "chunks_per_second": round(self.chunks_per_second, 2),
+            "elapsed_seconds": round(self.elapsed, 3),
+            "error_count": self.error_count,
+            "errors": list(self.errors),
+            "profile_id": self.profile_id,
+        }
+
+
+class JobManager:
+    """Runs ingestion jobs as background tasks and keeps their status."""
+
+    def __init__(self, max_history: int = 100):
+        self.max_history = max_history
+        self._jobs: "OrderedDict[str, IngestionJob]" = OrderedDict()
+        self._tasks: Dict[str, asyncio.Task] = {}
+
+    def submit(
+        self,
+        directory_path: str,
+        runner: Callable[[IngestionJob], Awaitable[Any]]
+    ) -> IngestionJob:
+        """Create a job and start ``runner(job)`` in the background."""
+        job = IngestionJob(directory_path=directory_path)
+        self._jobs[job.id] = job
+        self._prune()
+        self._tasks[job.id] = asyncio.create_task(self._run(job, runner))
+        return job
+
+    def get(self, job_id: str) -> Optional[IngestionJob]:
+        """Look up a job by ID."""
+        return self._jobs.get(job_id)
+
+    async def _run(
+        self,
+        job: IngestionJob,
+        runner: Callable[[IngestionJob], Awaitable[Any]]
+    ) -> None:
+        job.status = "running"
+        job.started_at = time.time()
+        try:
+            await runner(job)
+            job.status = "completed"
+        except asyncio.CancelledError:
+            job.status = "cancelled"
+            raise
+        except Exception as e:
+            job.status = "failed"
+            job.record_error(job.directory_path, e)
+            logger.error(f"Ingestion job {job.id} failed: {str(e)}")
+        finally:
+            job.finished_at = time.time()
+            self._tasks.pop(job.id, None)
+
+    def _prune(self) -> None:
+        """Drop the oldest finished jobs beyond the history limit."""
+        while len(self._jobs) > self.max_history:
+            for job_id, job in self._jobs.items():
+                if job_id not in self._tasks and job.status != "pending":
+                    del self._jobs[job_id]
+                    break
+            else:
+                return
+
+    async def shutdown(self) -> None:
+        """Cancel running jobs."""
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
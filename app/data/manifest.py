@@ -0,0 +1,116 @@
+"""Record of ingested files and chunks for incremental re-ingestion."""
+import hashlib
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterable, List, Sequence
+
+# Rows per multi-row INSERT / IN (...) list
+STATEMENT_BATCH_SIZE = 500
+
+
+def content_hash(data: bytes) -> str:
+    """Stable hash of file contents or chunk text."""
+    return hashlib.sha256(data).hexdigest()
+
+
+def chunk_hash(text: str) -> str:
+    """Chunk ID in the vector store: identical chunks share one row."""
+    return content_hash(text.encode("utf-8"))
+
+
+@dataclass
+class ManifestEntry:
+    """What was ingested from one source file."""
+    source: str
+    mtime: float
+    size: int
+    content_hash: str
+    chunk_hashes: List[str] = field(default_factory=list)
+
+    def unchanged(self, mtime: float, size: int) -> bool:
+        return self.mtime == mtime and self.size == size
+
+
+class IngestionManifest:
+    """Per-file manifest stored next to the documents table.
+
+    ``ingestion_files`` holds one row per source file (mtime, size, content
+    hash) and ``ingestion_chunks`` one row per chunk a file references.
+    Chunks are keyed by content hash, so several files may share one
+    vector store row; it is only deleted once no file references it.
+    """
+
+    def __init__(
+        self,
+        execute: Callable[[str, Sequence[Any]], Any],
+        fetch_all: Callable[[str, Sequence[Any]], List[tuple]],
+        table_prefix: str = "ingestion"
+    ):
+        self.execute = execute
+        self.fetch_all = fetch_all
+        self.files_table = f"{table_prefix}_files"
+        self.chunks_table = f"{table_prefix}_chunks"
+
+    def create_tables(self) -> None:
+        self.execute(
+            f"CREATE TABLE IF NOT EXISTS {self.files_table} ("
+            "source TEXT PRIMARY KEY, mtime DOUBLE PRECISION, size BIGINT, "
+            "content_hash TEXT, ingested_at DOUBLE PRECISION)"
+        )
+        self.execute(
+            f"CREATE TABLE IF NOT EXISTS {self.chunks_table} (source TEXT, chunk_hash TEXT)"
+        )
+
+    def load(self) -> Dict[str, ManifestEntry]:
+        """Read the whole manifest, keyed by source path."""
+        entries = {
+            source: ManifestEntry(source, mtime, size, digest)
+            for source, mtime, size, digest in self.fetch_all(
+                f"SELECT source, mtime, size, content_hash FROM {self.files_table}"
+            )
+        }
+        for source, digest in self.fetch_all(
+            f"SELECT source, chunk_hash FROM {self.chunks_table}"
+        ):
+            if source in entries:
+                entries[source].chunk_hashes.append(digest)
+        return entries
+
+    def save(self, entry: ManifestEntry, chunks_changed: bool = True) -> None:
+        """Insert or update one file's row and, if needed, its chunk rows."""
+        self.execute(
+            f"INSERT INTO {self.files_table} "
+            "(source, mtime, size, content_hash, ingested_at) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT (source) DO UPDATE SET mtime = excluded.mtime, "
+            "size = excluded.size, content_hash = excluded.content_hash, "
+            "ingested_at = excluded.ingested_at",
+            (entry.source, entry.mtime, entry.size, entry.content_hash, time.time())
+        )
+        if not chunks_changed:
+            return
+        self.execute(f"DELETE FROM {self.chunks_table} WHERE source = ?", (entry.source,))
+        for start in range(0, len(entry.chunk_hashes), STATEMENT_BATCH_SIZE):
+            batch = entry.chunk_hashes[start:start + STATEMENT_BATCH_SIZE]
+            self.execute(
+                f"INSERT INTO {self.chunks_table} (source, chunk_hash) VALUES "
+                + ", ".join("(?, ?)" for _ in batch),
+                [value for digest in batch for value in (entry.source, digest)]
+            )
+
+    def delete(self, sources: Iterable[str]) -> None:
+        """Forget removed files."""
+        sources = list(sources)
+        for start in range(0, len(sources), STATEMENT_BATCH_SIZE):
+            batch = sources[start:start + STATEMENT_BATCH_SIZE]
+            placeholders = ", ".join("?" for _ in batch)
+            for table in (self.chunks_table, self.files_table):
+                self.execute(f"DELETE FROM {table} WHERE source IN ({placeholders})", batch)
+
+
+def chunk_references(entries: Iterable[ManifestEntry]) -> Counter:
+    """How many files reference each stored chunk."""
+    references: Counter = Counter()
+    for entry in entries:
+        references.update(set(entry.chunk_hashes))
+    return references
@@ -1,44 +1,377 @@
 """Data processing module for ingesting and processing knowledge base content."""
-from typing import List, Dict, Any
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain.document_loaders import DirectoryLoader, TextLoader
-from langchain.embeddings import HuggingFaceEmbeddings
-from langchain.vectorstores import CrateDB
+import asyncio
+import logging
+import multiprocessing
+import os
+import threading
+import uuid
+from collections import Counter, deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from pathlib import Path
+from typing import List, Dict, Any, Iterable, Iterator, Optional, Set, Tuple
+from langchain.schema import Document
+from ..concurrency import run_sync
+from ..monitoring.metrics import stage
+from ..resources import ResourceRegistry
+from .ann_index import ANNIndex, build_from_table
+from .jobs import IngestionJob
+from .manifest import IngestionManifest, ManifestEntry, chunk_hash, chunk_references
+from .splitting import get_splitter, load_and_split
+
+# A new or changed file and its chunks; chunks are None if only the mtime changed
+FileChange = Tuple[ManifestEntry, Optional[List[Document]]]
+
+logger = logging.getLogger(__name__)
+
+# Files being loaded and split ahead of the embedding stage, per worker
+SPLIT_WINDOW_PER_WORKER = 4
 
 class DataProcessor:
-    def __init__(self, config):
+    def __init__(self, config, resources: ResourceRegistry, vector_store=None, metrics=None):
         self.config = config
-        self.embeddings = HuggingFaceEmbeddings(
-            model_endpoint=config.embeddings.endpoint
-        )
-        self.vector_store = CrateDB(
-            connection_string=config.vector_store.connection_string,
-            embeddings=self.embeddings,
-            table_name="documents"
-        )
-        self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=1000,
-            chunk_overlap=200
+        self.resources = resources
+        self.metrics = metrics
+        self.embeddings = resources.embeddings
+        if vector_store is None:
+            # Imported here so callers passing their own store (tests,
+            # benchmarks) do not need the CrateDB vector store installed
+            from langchain.vectorstores import CrateDB
+            vector_store = CrateDB(
+                connection=resources.engine,
+                embeddings=self.embeddings,
+                table_name="documents"
+            )
+        self.vector_store = vector_store
+        # Optional local index that serves retrieval instead of CrateDB
+        self.ann_index: Optional[ANNIndex] = None
+        self.retrieval_store = vector_store
+        if config.retriever.type.lower() == "ann":
+            # Filled at startup by ``build_ann_index``, not here
+            self.ann_index = ANNIndex.open(config.retriever, self.embeddings)
+            self.retrieval_store = self.ann_index
+        self.text_splitter = get_splitter(
+            config.ingestion.chunk_size,
+            config.ingestion.chunk_overlap
         )
+        # Worker processes for CPU-bound splitting, started on first use
+        self._split_pool: Optional[ProcessPoolExecutor] = None
+        self._split_pool_lock = threading.Lock()
+        self.manifest = IngestionManifest(resources.execute, resources.fetch_all)
+        self.manifest.create_tables()
+        # Directory runs read and update the shared manifest one at a time
+        self._manifest_lock = asyncio.Lock()
     
-    async def process_directory(self, directory_path: str) -> None:
-        """Process all text files in a directory."""
-        loader = DirectoryLoader(
-            directory_path,
-            glob="**/*.txt",
-            loader_cls=TextLoader
-        )
-        documents = loader.load()
-        texts = self.text_splitter.split_documents(documents)
+    def build_ann_index(self) -> Optional[ANNIndex]:
+        """Build an empty ANN index from the documents table (``ann_build_on_start``).
+        
+        Every worker process calls this on startup; the first to take the
+        index's build lock builds it, the others wait and load the result.
+        """
+        if self.ann_index is not None and self.config.retriever.ann_build_on_start:
+            build_from_table(self.ann_index, self.resources.fetch_all, if_empty=True)
+        return self.ann_index
+    
+    def iter_files(self, directory_path: str) -> Iterator[Path]:
+        """Lazily yield files under a directory matching the ingestion glob."""
+        for path in Path(directory_path).glob(self.config.ingestion.file_glob):
+            if path.is_file():
+                yield path
+    
+    def _submit_split(self, source: str, previous_hash: Optional[str]) -> Future:
+        """Load and split a file in a worker process (or inline with one worker)."""
+        ingestion = self.config.ingestion
+        args = (source, ingestion.chunk_size, ingestion.chunk_overlap, previous_hash)
+        if ingestion.workers > 1:
+            with self._split_pool_lock:
+                if self._split_pool is None:
+                    # spawn: forking a process that runs threads is unsafe
+                    self._split_pool = ProcessPoolExecutor(
+                        max_workers=ingestion.workers,
+                        mp_context=multiprocessing.get_context("spawn")
+                    )
+            return self._split_pool.submit(load_and_split, *args)
+        future = Future()
+        try:
+            future.set_result(load_and_split(*args))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+    
+    def iter_changes(
+        self,
+        directory_path: str,
+        manifest: Dict[str, ManifestEntry],
+        job: IngestionJob,
+        seen: Set[str]
+    ) -> Iterator[FileChange]:
+        """Yield files that are new or changed since they were last ingested.
+        
+        Files whose mtime and size match the manifest are skipped without
+        being read; files whose content hash matches are only re-stamped.
+        Loading and splitting run ``ingestion.workers`` files at a time in
+        worker processes, and results are yielded in directory order.
+        Every source found is added to ``seen``, even if it fails to load.
+        """
+        window = max(1, self.config.ingestion.workers) * SPLIT_WINDOW_PER_WORKER
+        in_flight = deque()
+        for path in self.iter_files(directory_path):
+            source = str(path.resolve())
+            seen.add(source)
+            job.files_done += 1
+            try:
+                stat = path.stat()
+            except OSError as e:
+                job.record_error(source, e)
+                continue
+            previous = manifest.get(source)
+            if previous is not None and previous.unchanged(stat.st_mtime, stat.st_size):
+                job.files_skipped += 1
+                continue
+            entry = ManifestEntry(source, stat.st_mtime, stat.st_size, "")
+            future = self._submit_split(source, previous.content_hash if previous else None)
+            in_flight.append((entry, previous, future))
+            while len(in_flight) >= window:
+                yield from self._split_result(*in_flight.popleft(), job)
+        while in_flight:
+            yield from self._split_result(*in_flight.popleft(), job)
+    
+    @staticmethod
+    def _split_result(
+        entry: ManifestEntry,
+        previous: Optional[ManifestEntry],
+        future: Future,
+        job: IngestionJob
+    ) -> Iterator[FileChange]:
+        """Turn a finished split into a file change, recording failures on the job."""
+        try:
+            entry.content_hash, chunks = future.result()
+        except Exception as e:
+            job.record_error(entry.source, e)
+            return
+        if chunks is None:
+            entry.chunk_hashes = previous.chunk_hashes
+            job.files_skipped += 1
+            yield entry, None
+            return
+        if previous is None:
+            job.files_added += 1
+        else:
+            job.files_updated += 1
+        yield entry, [
+            Document(page_content=chunk, metadata={"source": entry.source})
+            for chunk in chunks
+        ]
+    
+    def iter_change_batches(
+        self,
+        directory_path: str,
+        manifest: Dict[str, ManifestEntry],
+        job: IngestionJob,
+        seen: Set[str]
+    ) -> Iterator[List[FileChange]]:
+        """Group file changes into batches of about ``chunk_batch_size`` chunks."""
+        batch_size = self.config.ingestion.chunk_batch_size
+        batch, chunks = [], 0
+        for change in self.iter_changes(directory_path, manifest, job, seen):
+            batch.append(change)
+            chunks += len(change[1] or ())
+            if chunks >= batch_size or len(batch) >= batch_size:
+                yield batch
+                batch, chunks = [], 0
+        if batch:
+            yield batch
+    
+    async def _store_batch(
+        self,
+        batch: List[Document],
+        ids: Optional[List[str]] = None,
+        replace: bool = False
+    ) -> None:
+        """Embed a batch of chunks in one call and bulk insert them.
+        
+        With ``replace``, rows already stored under ``ids`` are deleted
+        first, so re-inserting them does not fail on a duplicate key.
+        """
+        texts = [doc.page_content for doc in batch]
+        # Explicit IDs keep the documents table and the ANN index in step
+        ids = ids or [uuid.uuid4().hex for _ in batch]
+        metadatas = [doc.metadata for doc in batch]
+        with stage("embed", self.metrics, pipeline="ingest") as span:
+            span.set_attribute("chunks", len(texts))
+            vectors = await run_sync(self.embeddings.embed_documents, texts)
+        with stage("store", self.metrics, pipeline="ingest"):
+            if replace:
+                await run_sync(self.vector_store.delete, ids)
+            await run_sync(
+                self.vector_store.add_embeddings,
+                texts=texts,
+                embeddings=vectors,
+                metadatas=metadatas,
+                ids=ids
+            )
+        if self.ann_index is not None:
+            with stage("index", self.metrics, pipeline="ingest"):
+                await run_sync(self.ann_index.add_embeddings, texts, vectors, metadatas, ids)
+        if self.metrics:
+            self.metrics.update_vector_store_size(len(batch))
+    
+    async def _delete_chunks(self, ids: List[str], job: IngestionJob) -> None:
+        """Remove chunks no file references any more."""
+        if not ids:
+            return
+        with stage("delete", self.metrics, pipeline="ingest"):
+            await run_sync(self.vector_store.delete, ids)
+            if self.ann_index is not None:
+                await run_sync(self.ann_index.delete, ids)
+        job.chunks_deleted += len(ids)
+        if self.metrics:
+            self.metrics.update_vector_store_size(-len(ids))
+    
+    @staticmethod
+    def _release(hashes: Iterable[str], references: Counter) -> List[str]:
+        """Drop one reference to each chunk; return chunks nothing references."""
+        unreferenced = []
+        for digest in set(hashes):
+            references[digest] -= 1
+            if references[digest] <= 0:
+                del references[digest]
+                unreferenced.append(digest)
+        return unreferenced
+    
+    async def _apply_changes(
+        self,
+        changes: List[FileChange],
+        manifest: Dict[str, ManifestEntry],
+        references: Counter,
+        job: IngestionJob
+    ) -> None:
+        """Store the new chunks of a batch of files, then record the files.
+        
+        Chunks already in the store (by content hash) are not embedded
+        again. Manifest rows are written only after their chunks are stored,
+        and replaced chunks are deleted only after that, so an interrupted
+        run at worst leaves orphaned rows, never missing ones. The next run
+        does not know about those rows and stores the same chunks again, so
+        they are replaced rather than inserted.
+        """
+        new_chunks: Dict[str, Document] = {}
+        for entry, documents in changes:
+            if documents is None:
+                continue
+            hashes = {}
+            for document in documents:
+                digest = chunk_hash(document.page_content)
+                if digest in hashes:
+                    job.chunks_deduplicated += 1
+                    continue
+                hashes[digest] = None
+                if references[digest] or digest in new_chunks:
+                    job.chunks_deduplicated += 1
+                else:
+                    new_chunks[digest] = document
+            entry.chunk_hashes = list(hashes)
         
-        # Store in vector database
-        self.vector_store.add_documents(texts)
+        if new_chunks:
+            await self._store_batch(list(new_chunks.values()), ids=list(new_chunks), replace=True)
+            job.chunks_done += len(new_chunks)
+        
+        unreferenced = []
+        for entry, documents in changes:
+            await run_sync(self.manifest.save, entry, documents is not None)
+            if documents is None:
+                continue
+            references.update(entry.chunk_hashes)
+            previous = manifest.get(entry.source)
+            if previous is not None:
+                unreferenced.extend(self._release(previous.chunk_hashes, references))
+        await self._delete_chunks(unreferenced, job)
+    
+    async def process_directory(
+        self,
+        directory_path: str,
+        job: Optional[IngestionJob] = None
+    ) -> IngestionJob:
+        """Incrementally sync a directory of text files into the vector store.
+        
+        Only new and changed files are split, only chunks not already
+        stored are embedded, and chunks of changed or removed files that
+        nothing references any more are deleted. Files are processed batch
+        by batch, so memory use is bounded by ``ingestion.chunk_batch_size``
+        rather than by the size of the corpus. The corpus version is bumped
+        once, when the run ends, so the caches are not emptied batch by
+        batch while it runs.
+        """
+        job = job or IngestionJob(directory_path=directory_path)
+        changed_before = job.chunks_done + job.chunks_deleted
+        async with self._manifest_lock:
+            try:
+                await self._sync_directory(directory_path, job)
+            finally:
+                if job.chunks_done + job.chunks_deleted > changed_before:
+                    # Cached answers computed before this run are now stale
+                    await run_sync(self.resources.corpus.bump)
+        return job
+    
+    async def _sync_directory(self, directory_path: str, job: IngestionJob) -> None:
+        manifest = await run_sync(self.manifest.load)
+        references = chunk_references(manifest.values())
+        seen: Set[str] = set()
+        batches = self.iter_change_batches(directory_path, manifest, job, seen)
+        while True:
+            with stage("load", self.metrics, pipeline="ingest"):
+                changes = await run_sync(next, batches, None)
+            if changes is None:
+                break
+            await self._apply_changes(changes, manifest, references, job)
+        
+        # Files that were ingested from this directory but are gone now
+        prefix = os.path.join(str(Path(directory_path).resolve()), "")
+        removed = [
+            entry for source, entry in manifest.items()
+            if source.startswith(prefix) and source not in seen
+        ]
+        if removed:
+            await run_sync(self.manifest.delete, [entry.source for entry in removed])
+            unreferenced = []
+            for entry in removed:
+                unreferenced.extend(self._release(entry.chunk_hashes, references))
+            await self._delete_chunks(unreferenced, job)
+            job.files_deleted += len(removed)
     
     async def process_text(self, text: str, metadata: Dict[str, Any] = None) -> None:
         """Process a single text string."""
-        texts = self.text_splitter.split_text(text)
-        self.vector_store.add_texts(texts, metadatas=[metadata] * len(texts) if metadata else None)
+        with stage("split", self.metrics, pipeline="ingest"):
+            documents = self.text_splitter.create_documents(
+                [text], [metadata] if metadata else None
+            )
+        if documents:
+            await self._store_batch(documents)
+            await run_sync(self.resources.corpus.bump)
+    
+    def close(self) -> None:
+        """Stop the splitting worker processes."""
+        if self._split_pool is not None:
+            self._split_pool.shutdown(wait=False, cancel_futures=True)
+            self._split_pool = None
     
     def search(self, query: str, k: int = 4) -> List[str]:
         """Search for relevant documents."""
-        return self.vector_store.similarity_search(query, k=k)
+        return self.retrieval_store.similarity_search(query, k=k)
+    
+    async def asearch(self, query: str, k: int = 4) -> List[str]:
+        """Search for relevant documents without blocking the event loop."""
+        return await run_sync(self.retrieval_store.similarity_search, query, k=k)
+    
+    async def asearch_by_vector(self, embedding: List[float], k: int = 4) -> List[Document]:
+        """Search with a precomputed query embedding."""
+        return await run_sync(
+            self.retrieval_store.similarity_search_by_vector, embedding, k=k
+        )
+    
+    async def asearch_with_scores_by_vector(
+        self, embedding: List[float], k: int = 4
+    ) -> List[Tuple[Document, float]]:
+        """Search with a precomputed query embedding, keeping the scores."""
+        return await run_sync(
+            self.retrieval_store.similarity_search_with_score_by_vector, embedding, k=k
+        )
@@ -0,0 +1,120 @@
+"""In-process cache of vector search results, independent of the answer caches."""
+import threading
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from langchain.schema import Document
+
+from ..llms.cache import LRUCache, SemanticIndex
+
+# Retrieved chunks with their search scores, best first
+SearchResults = List[Tuple[Document, float]]
+
+
+class RetrievalCache:
+    """Maps a query, or a near-identical query embedding, to its search results.
+
+    Entries hold the retrieved chunks (IDs in metadata where the store
+    provides them) and their scores, so a prompt, model or temperature
+    change that empties the answer caches still skips the similarity
+    search. A paraphrase hits when its embedding is within
+    ``similarity_threshold`` cosine similarity of a cached query. The
+    whole cache is dropped when the corpus version changes.
+    """
+
+    def __init__(self, config, corpus=None, metrics=None):
+        self.exact = LRUCache(config.cache_max_entries, config.cache_ttl_seconds)
+        self.semantic: Optional[SemanticIndex] = None
+        if config.cache_similarity_threshold > 0:
+            self.semantic = SemanticIndex(
+                config.cache_max_entries,
+                config.cache_ttl_seconds,
+                config.cache_similarity_threshold
+            )
+        self.corpus = corpus
+        self.metrics = metrics
+        self._corpus_version: Optional[int] = None
+        self._lock = threading.Lock()
+        self._lookups = 0
+        self._exact_hits = 0
+        self._semantic_hits = 0
+
+    @staticmethod
+    def _key(query: str) -> str:
+        return " ".join(query.lower().split())
+
+    def _check_corpus(self) -> None:
+        if self.corpus is None:
+            return
+        version = self.corpus.current()
+        with self._lock:
+            if version != self._corpus_version:
+                if self._corpus_version is not None:
+                    self._clear()
+                self._corpus_version = version
+
+    def lookup(self, query: str, vector: Sequence[float], k: int) -> Optional[SearchResults]:
+        """Cached results for at least ``k`` chunks, or None."""
+        self._check_corpus()
+        with self._lock:
+            self._lookups += 1
+            entry, evicted = self.exact.get(self._key(query))
+            kind = "exact"
+            if entry is None and self.semantic is not None:
+                entry = self.semantic.get(vector)
+                kind = "semantic"
+            if entry is not None and entry[0] < k:
+                entry = None
+            if entry is not None:
+                if kind == "exact":
+                    self._exact_hits += 1
+                else:
+                    self._semantic_hits += 1
+        self._record(entry is not None, evicted)
+        return None if entry is None else entry[1][:k]
+
+    def update(self, query: str, vector: Sequence[float], k: int, results: SearchResults,
+               corpus_version: Optional[int] = None) -> None:
+        """Store the results of a search for ``k`` chunks.
+
+        ``corpus_version`` is the version read before the search; results
+        from a search that ingestion has overtaken are not stored.
+        """
+        self._check_corpus()
+        entry = (k, list(results))
+        with self._lock:
+            if self.corpus is not None and corpus_version not in (None, self._corpus_version):
+                return
+            evicted = self.exact.put(self._key(query), entry)
+            if self.semantic is not None:
+                evicted += self.semantic.put(vector, entry)
+        if self.metrics and evicted:
+            self.metrics.record_cache_eviction(evicted, cache="retrieval")
+
+    def _record(self, hit: bool, evicted: int) -> None:
+        if self.metrics:
+            self.metrics.record_cache_result(hit, cache="retrieval", tier="l1")
+            if evicted:
+                self.metrics.record_cache_eviction(evicted, cache="retrieval")
+
+    def _clear(self) -> None:
+        self.exact.clear()
+        if self.semantic is not None:
+            self.semantic.clear()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Entries and hit ratios."""
+        with self._lock:
+            lookups = self._lookups
+            hits = self._exact_hits + self._semantic_hits
+            return {
+                "entries": len(self.exact),
+                "lookups": lookups,
+                "exact_hits": self._exact_hits,
+                "semantic_hits": self._semantic_hits,
+                "hit_ratio": round(hits / lookups, 4) if lookups else 0.0,
+                "corpus_version": self._corpus_version,
+            }
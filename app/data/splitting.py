@@ -0,0 +1,35 @@
+"""File loading and splitting; runs in worker processes for large ingestions.
+
+Kept free of app-wide imports so spawned workers start quickly.
+"""
+from typing import Dict, List, Optional, Tuple
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from .manifest import content_hash
+
+_splitters: Dict[Tuple[int, int], RecursiveCharacterTextSplitter] = {}
+
+
+def get_splitter(chunk_size: int, chunk_overlap: int) -> RecursiveCharacterTextSplitter:
+    """Return this process's splitter for the given chunk settings."""
+    key = (chunk_size, chunk_overlap)
+    if key not in _splitters:
+        _splitters[key] = RecursiveCharacterTextSplitter(
+            chunk_size=chunk_size,
+            chunk_overlap=chunk_overlap
+        )
+    return _splitters[key]
+
+
+def load_and_split(
+    path: str,
+    chunk_size: int,
+    chunk_overlap: int,
+    previous_hash: Optional[str] = None
+) -> Tuple[str, Optional[List[str]]]:
+    """Read, hash and split a file; chunks are None if the hash is unchanged."""
+    with open(path, "rb") as f:
+        data = f.read()
+    digest = content_hash(data)
+    if digest == previous_hash:
+        return digest, None
+    return digest, get_splitter(chunk_size, chunk_overlap).split_text(data.decode("utf-8"))
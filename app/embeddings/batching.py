@@ -0,0 +1,187 @@
+"""Embedding client that merges concurrent requests into batched HTTP calls."""
+import asyncio
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+from langchain.embeddings.base import Embeddings
+from .context import current_embedding_context
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class BatchingEmbeddings(Embeddings):
+    """Embeddings backed by a sentence-transformers HTTP endpoint.
+
+    Calls from any thread or coroutine are queued and a dispatcher thread
+    merges them into requests of up to ``max_batch_size`` texts, waiting
+    at most ``max_wait_ms`` for a batch to fill. At most
+    ``max_concurrency`` requests are in flight, over pooled connections.
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self.url = config.endpoint.rstrip("/") + config.embed_path
+        self.max_batch_size = max(1, config.max_batch_size)
+        self.max_wait = config.max_wait_ms / 1000.0
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=config.max_concurrency
+        )
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self._queue: "queue.Queue" = queue.Queue()
+        self._slots = threading.BoundedSemaphore(config.max_concurrency)
+        self._pool = ThreadPoolExecutor(
+            max_workers=config.max_concurrency,
+            thread_name_prefix="embeddings"
+        )
+        self._dispatcher: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    # Embeddings interface
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Embed a list of texts, batched with any concurrent callers."""
+        return [future.result() for future in self._submit(texts)]
+
+    def embed_query(self, text: str) -> List[float]:
+        """Embed a single query text, reusing the request's vector if any."""
+        ctx = current_embedding_context()
+        if ctx is not None:
+            vector = ctx.get(text)
+            if vector is not None:
+                return vector
+        vector = self._submit([text])[0].result()
+        if ctx is not None:
+            ctx.put(text, vector)
+        return vector
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Embed texts without blocking the event loop."""
+        futures = [asyncio.wrap_future(f) for f in self._submit(texts)]
+        return list(await asyncio.gather(*futures))
+
+    async def aembed_query(self, text: str) -> List[float]:
+        """Embed a query without blocking the event loop."""
+        ctx = current_embedding_context()
+        if ctx is not None:
+            vector = ctx.get(text)
+            if vector is not None:
+                return vector
+        vector = await asyncio.wrap_future(self._submit([text])[0])
+        if ctx is not None:
+            ctx.put(text, vector)
+        return vector
+
+    # Batching
+
+    def _submit(self, texts: List[str]) -> List[Future]:
+        self._ensure_dispatcher()
+        futures = []
+        for text in texts:
+            future: Future = Future()
+            self._queue.put((text, future))
+            futures.append(future)
+        return futures
+
+    def _ensure_dispatcher(self) -> None:
+        if self._dispatcher is not None:
+            return
+        with self._lock:
+            if self._dispatcher is None:
+                self._dispatcher = threading.Thread(
+                    target=self._dispatch_loop,
+                    name="embeddings-dispatcher",
+                    daemon=True
+                )
+                self._dispatcher.start()
+
+    def _dispatch_loop(self) -> None:
+        while True:
+            # Wait for a free request slot first so batches keep filling
+            # while the endpoint is busy
+            self._slots.acquire()
+            batch = self._collect_batch()
+            if batch is None:
+                self._slots.release()
+                return
+            self._pool.submit(self._send_batch, batch)
+
+    def _collect_batch(self) -> Optional[List[Tuple[str, Future]]]:
+        item = self._queue.get()
+        if item is _STOP:
+            return None
+        batch = [item]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is _STOP:
+                # Re-queue so the loop exits after this batch
+                self._queue.put(_STOP)
+                break
+            batch.append(item)
+        return batch
+
+    def _send_batch(self, batch: List[Tuple[str, Future]]) -> None:
+        # Claim the futures first: a claimed future can no longer be
+        # cancelled, and texts whose callers already gave up are not sent
+        batch = [
+            (text, future) for text, future in batch if future.set_running_or_notify_cancel()
+        ]
+        try:
+            if not batch:
+                return
+            # Identical texts in a batch are embedded once
+            positions: Dict[str, int] = {}
+            for text, _ in batch:
+                positions.setdefault(text, len(positions))
+            vectors = self._post(list(positions))
+        except Exception as e:
+            logger.error(f"Embedding batch of {len(batch)} failed: {str(e)}")
+            for _, future in batch:
+                future.set_exception(e)
+        else:
+            for text, future in batch:
+                future.set_result(vectors[positions[text]])
+        finally:
+            self._slots.release()
+
+    def _post(self, texts: List[str]) -> List[List[float]]:
+        response = self.session.post(
+            self.url,
+            json={"inputs": texts},
+            timeout=self.config.timeout
+        )
+        response.raise_for_status()
+        vectors = response.json()
+        if len(vectors) != len(texts):
+            raise ValueError(
+                f"Embedding endpoint returned {len(vectors)} vectors for {len(texts)} texts"
+            )
+        return vectors
+
+    def close(self) -> None:
+        """Stop the dispatcher and release pooled connections."""
+        if self._dispatcher is not None:
+            self._queue.put(_STOP)
+            self._dispatcher.join(timeout=5)
+            self._dispatcher = None
+        self._pool.shutdown(wait=True)
+        self.session.close()
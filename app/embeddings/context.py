@@ -0,0 +1,49 @@
+"""Per-request memoization of query embeddings."""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional
+
+
+class EmbeddingContext:
+    """Query vectors computed while handling a single request."""
+
+    def __init__(self):
+        self.vectors: Dict[str, List[float]] = {}
+        self.computed = 0
+        self.reused = 0
+
+    def get(self, text: str) -> Optional[List[float]]:
+        vector = self.vectors.get(text)
+        if vector is not None:
+            self.reused += 1
+        return vector
+
+    def put(self, text: str, vector: List[float]) -> None:
+        self.vectors[text] = vector
+        self.computed += 1
+
+
+_current: ContextVar[Optional[EmbeddingContext]] = ContextVar(
+    "embedding_context", default=None
+)
+
+
+def current_embedding_context() -> Optional[EmbeddingContext]:
+    """Return the context of the request being handled, if any."""
+    return _current.get()
+
+
+@contextmanager
+def embedding_context() -> Iterator[EmbeddingContext]:
+    """Memoize query embeddings until the block exits.
+
+    Every ``embed_query`` for the same text inside the block (including
+    calls made from executor threads via ``run_sync``) reuses the first
+    computed vector.
+    """
+    ctx = EmbeddingContext()
+    token = _current.set(ctx)
+    try:
+        yield ctx
+    finally:
+        _current.reset(token)
@@ -0,0 +1,112 @@
+"""Lazy, parallel component startup with readiness tracking."""
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from .concurrency import run_sync
+
+logger = logging.getLogger(__name__)
+
+# A startup stage is a list of (name, factory) pairs built in parallel
+Stage = Sequence[Tuple[str, Callable[[], Any]]]
+
+
+class ComponentNotReady(RuntimeError):
+    """Raised when a component is requested before it finished starting."""
+
+
+@dataclass
+class ComponentStatus:
+    """Startup state of a single component."""
+    ready: bool = False
+    init_seconds: Optional[float] = None
+    error: Optional[str] = None
+    attempts: int = 0
+
+
+class Startup:
+    """Builds components off the event loop and reports readiness.
+
+    Stages run in order; the components of a stage are built in parallel
+    in the shared executor. Failed components are retried every
+    ``retry_seconds`` so a dependency that is down at boot keeps the pod
+    unready instead of crashing it.
+    """
+
+    def __init__(self, metrics=None, retry_seconds: float = 5.0):
+        self.metrics = metrics
+        self.retry_seconds = retry_seconds
+        self.components: Dict[str, Any] = {}
+        self.status: Dict[str, ComponentStatus] = {}
+
+    async def init(self, name: str, factory: Callable[[], Any]) -> bool:
+        """Build one component, recording its init time and any error."""
+        status = self.status.setdefault(name, ComponentStatus())
+        status.attempts += 1
+        start_time = time.perf_counter()
+        try:
+            self.components[name] = await run_sync(factory)
+            status.ready = True
+            status.error = None
+        except Exception as e:
+            status.error = str(e)
+            logger.error(f"Failed to initialize {name}: {str(e)}")
+        finally:
+            status.init_seconds = time.perf_counter() - start_time
+            if self.metrics:
+                self.metrics.record_component_init(name, status.init_seconds, status.ready)
+        return status.ready
+
+    async def run_stages(self, stages: List[Stage]) -> bool:
+        """Build every not-yet-ready component, stage by stage."""
+        for stage in stages:
+            for name, _ in stage:
+                self.status.setdefault(name, ComponentStatus())
+        for stage in stages:
+            pending = [
+                (name, factory) for name, factory in stage
+                if not self.status[name].ready
+            ]
+            results = await asyncio.gather(
+                *(self.init(name, factory) for name, factory in pending)
+            )
+            if not all(results):
+                return False
+        return True
+
+    async def run_until_ready(self, stages: List[Stage]) -> None:
+        """Retry failed components until everything is ready."""
+        while not await self.run_stages(stages):
+            await asyncio.sleep(self.retry_seconds)
+        logger.info("All components ready")
+
+    def get(self, name: str) -> Any:
+        """Return a ready component or raise ComponentNotReady."""
+        try:
+            return self.components[name]
+        except KeyError:
+            raise ComponentNotReady(f"{name} is not ready") from None
+
+    @property
+    def ready(self) -> bool:
+        return bool(self.status) and all(s.ready for s in self.status.values())
+
+    def readiness(self) -> Dict[str, Any]:
+        """Per-component readiness for the readiness endpoint."""
+        return {
+            "ready": self.ready,
+            "components": {
+                name: {
+                    "ready": status.ready,
+                    "init_seconds": (
+                        round(status.init_seconds, 3)
+                        if status.init_seconds is not None else None
+                    ),
+                    "attempts": status.attempts,
+                    "error": status.error,
+                }
+                for name, status in self.status.items()
+            },
+        }
@@ -0,0 +1,436 @@
+"""In-process L1 cache tier in front of the CrateDB-backed LLM caches."""
+import threading
+import time
+from abc import abstractmethod
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+import numpy as np
+from langchain.schema.cache import BaseCache
+
+
+class LRUCache:
+    """Exact-match cache with a size bound and LRU + TTL eviction."""
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+
+    def get(self, key: Hashable) -> Tuple[Optional[Any], int]:
+        """Return ``(value, evicted)`` for a key, expiring stale entries."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None, 0
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None, 1
+        self._entries.move_to_end(key)
+        return value, 0
+
+    def put(self, key: Hashable, value: Any) -> int:
+        """Insert a value and return the number of evicted entries."""
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        evicted = 0
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            evicted += 1
+        return evicted
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class SemanticIndex:
+    """Fixed-size matrix of recent query embeddings with top-1 cosine lookup.
+
+    Rows are L2-normalized so one matrix-vector product scores every
+    entry. When full, expired rows are reused first, then the least
+    recently used one.
+    """
+
+    def __init__(self, max_entries: int, ttl: float, threshold: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.threshold = threshold
+        self._vectors: Optional[np.ndarray] = None
+        self._values: List[Any] = [None] * max_entries
+        self._expires_at = np.zeros(max_entries)
+        self._last_used = np.zeros(max_entries)
+        self._size = 0
+
+    @staticmethod
+    def _normalize(vector) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def get(self, vector) -> Optional[Any]:
+        """Return the value of the most similar live entry above the threshold."""
+        if self._size == 0:
+            return None
+        query = self._normalize(vector)
+        if query.shape[0] != self._vectors.shape[1]:
+            return None
+        now = time.monotonic()
+        scores = self._vectors[:self._size] @ query
+        scores[self._expires_at[:self._size] < now] = -np.inf
+        best = int(np.argmax(scores))
+        if scores[best] < self.threshold:
+            return None
+        self._last_used[best] = now
+        return self._values[best]
+
+    def get_many(self, vectors) -> List[Optional[Any]]:
+        """``get`` for many query vectors with one matrix product."""
+        queries = np.asarray(vectors, dtype=np.float32)
+        if self._size == 0 or queries.ndim != 2 or queries.shape[1] != self._vectors.shape[1]:
+            return [None] * len(queries)
+        norms = np.linalg.norm(queries, axis=1, keepdims=True)
+        queries = queries / np.where(norms == 0, 1.0, norms)
+        now = time.monotonic()
+        scores = queries @ self._vectors[:self._size].T
+        scores[:, self._expires_at[:self._size] < now] = -np.inf
+        best = np.argmax(scores, axis=1)
+        results = []
+        for i, row in enumerate(best):
+            if scores[i, row] < self.threshold:
+                results.append(None)
+                continue
+            self._last_used[row] = now
+            results.append(self._values[row])
+        return results
+
+    def put(self, vector, value: Any) -> int:
+        """Insert an entry and return the number of evicted entries."""
+        vector = self._normalize(vector)
+        if self._vectors is None or vector.shape[0] != self._vectors.shape[1]:
+            self._vectors = np.zeros((self.max_entries, vector.shape[0]), dtype=np.float32)
+            self._size = 0
+        now = time.monotonic()
+        evicted = 0
+        if self._size < self.max_entries:
+            row = self._size
+            self._size += 1
+        else:
+            expired = np.flatnonzero(self._expires_at < now)
+            row = int(expired[0]) if expired.size else int(np.argmin(self._last_used))
+            evicted = 1
+        self._vectors[row] = vector
+        self._values[row] = value
+        self._expires_at[row] = now + self.ttl
+        self._last_used[row] = now
+        return evicted
+
+    def clear(self) -> None:
+        self._vectors = None
+        self._values = [None] * self.max_entries
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+
+class _TieredBase(BaseCache):
+    """Shared plumbing for L1 tiers wrapping a CrateDB cache.
+
+    ``BaseCache`` is an ABC; subclasses provide the L1 hooks below.
+
+    With a ``corpus`` version counter, the L1 is emptied whenever the
+    version changes, like the CrateDB tier treats older entries as stale.
+    """
+
+    def __init__(self, backend, name: str, metrics=None, corpus=None):
+        self.backend = backend
+        self.name = name
+        self.metrics = metrics
+        self.corpus = corpus
+        self._corpus_version: Optional[int] = None
+        self._lock = threading.Lock()
+        self._l1_lookups = 0
+        self._l1_hits = 0
+
+    def _check_corpus(self) -> None:
+        if self.corpus is None:
+            return
+        version = self.corpus.current()
+        if version != self._corpus_version:
+            with self._lock:
+                if self._corpus_version is not None:
+                    self._clear_l1()
+                self._corpus_version = version
+
+    @abstractmethod
+    def _clear_l1(self) -> None:
+        """Drop every L1 entry."""
+
+    @abstractmethod
+    def _l1_size(self) -> int:
+        """Number of entries held in L1."""
+
+    def _record(self, tier: str, hit: bool) -> None:
+        if tier == "l1":
+            with self._lock:
+                self._l1_lookups += 1
+                self._l1_hits += hit
+        if self.metrics:
+            self.metrics.record_cache_result(hit, cache=self.name, tier=tier)
+
+    def stats(self) -> Dict[str, Any]:
+        """CrateDB tier stats plus L1 entries and hit ratio."""
+        stats = self.backend.stats() if hasattr(self.backend, "stats") else {}
+        with self._lock:
+            lookups, hits, entries = self._l1_lookups, self._l1_hits, self._l1_size()
+        stats["l1"] = {
+            "entries": entries,
+            "lookups": lookups,
+            "hits": hits,
+            "hit_ratio": round(hits / lookups, 4) if lookups else 0.0,
+        }
+        if lookups:
+            # Every lookup reaches L1; misses continue to CrateDB
+            stats["overall_hit_ratio"] = round((hits + stats.get("hits", 0)) / lookups, 4)
+        return stats
+
+    def _current(self, corpus_version: Optional[int]) -> bool:
+        """Whether an answer computed under ``corpus_version`` is still current."""
+        return corpus_version is None or self.corpus is None or (
+            corpus_version >= self.corpus.current()
+        )
+
+    def _backend_lookup_many(self, prompts: List[str], *args) -> List[Optional[Any]]:
+        lookup_many = getattr(self.backend, "lookup_many", None)
+        if lookup_many is not None:
+            return lookup_many(prompts, *args)
+        return [self.backend.lookup(prompt, *args) for prompt in prompts]
+
+    def _record_evictions(self, count: int) -> None:
+        if self.metrics and count:
+            self.metrics.record_cache_eviction(count, cache=self.name, tier="l1")
+
+    def __getattr__(self, name):
+        # Anything not overridden (table names, ...) goes to CrateDB
+        if name == "backend":
+            raise AttributeError(name)
+        return getattr(self.backend, name)
+
+
+class TieredCache(_TieredBase):
+    """Exact-match L1 tier; misses fall through to the CrateDB cache.
+
+    Extra positional arguments (e.g. LangChain's ``llm_string``) are
+    forwarded to the backend and form part of the L1 key.
+    """
+
+    def __init__(self, backend, l1: LRUCache, name: str = "standard", metrics=None, corpus=None):
+        super().__init__(backend, name, metrics, corpus)
+        self.l1 = l1
+
+    def _clear_l1(self) -> None:
+        self.l1.clear()
+
+    def _l1_size(self) -> int:
+        return len(self.l1)
+
+    def lookup(self, prompt: str, *args) -> Optional[Any]:
+        self._check_corpus()
+        key = (prompt,) + args
+        with self._lock:
+            value, evicted = self.l1.get(key)
+        self._record_evictions(evicted)
+        self._record("l1", value is not None)
+        if value is not None:
+            return value
+
+        value = self.backend.lookup(prompt, *args)
+        self._record("crate", bool(value))
+        if value:
+            with self._lock:
+                evicted = self.l1.put(key, value)
+            self._record_evictions(evicted)
+        return value
+
+    def peek(self, prompt: str, *args) -> Optional[Any]:
+        """L1-only lookup safe to call on the event loop: it never does I/O.
+
+        Returns None (leaving it to ``lookup``) while the corpus version
+        has not been confirmed within its refresh interval.
+        """
+        if self.corpus is not None:
+            version = self.corpus.cached()
+            if version is None or version != self._corpus_version:
+                return None
+        with self._lock:
+            value, expired = self.l1.get((prompt,) + args)
+        self._record_evictions(expired)
+        if value is not None:
+            self._record("l1", True)
+        return value
+
+    def lookup_many(self, prompts: List[str], *args) -> List[Optional[Any]]:
+        """``lookup`` for many prompts; L1 misses are read from CrateDB in bulk."""
+        self._check_corpus()
+        values = []
+        evicted = 0
+        with self._lock:
+            for prompt in prompts:
+                value, expired = self.l1.get((prompt,) + args)
+                values.append(value)
+                evicted += expired
+        for value in values:
+            self._record("l1", value is not None)
+        misses = [i for i, value in enumerate(values) if value is None]
+        if misses:
+            found = self._backend_lookup_many([prompts[i] for i in misses], *args)
+            with self._lock:
+                for i, value in zip(misses, found):
+                    if value:
+                        values[i] = value
+                        evicted += self.l1.put((prompts[i],) + args, value)
+            for value in found:
+                self._record("crate", bool(value))
+        self._record_evictions(evicted)
+        return values
+
+    def update(self, prompt: str, *args, corpus_version: Optional[int] = None) -> None:
+        """Write through to both tiers; the last argument is the value.
+
+        An answer computed under an older ``corpus_version`` stays out of L1.
+        """
+        if self._current(corpus_version):
+            key = (prompt,) + args[:-1]
+            with self._lock:
+                evicted = self.l1.put(key, args[-1])
+            self._record_evictions(evicted)
+        self.backend.update(prompt, *args, corpus_version=corpus_version)
+
+    def clear(self, **kwargs) -> None:
+        with self._lock:
+            self.l1.clear()
+        self.backend.clear(**kwargs)
+
+
+class TieredSemanticCache(_TieredBase):
+    """Semantic L1 tier over recent query embeddings.
+
+    Query vectors come from ``embeddings.embed_query``, which reuses the
+    request's memoized vector, so the L1 adds no embedding round-trip.
+    """
+
+    def __init__(
+        self,
+        backend,
+        embeddings,
+        max_entries: int,
+        ttl: float,
+        threshold: float,
+        name: str = "semantic",
+        metrics=None,
+        corpus=None
+    ):
+        super().__init__(backend, name, metrics, corpus)
+        self.embeddings = embeddings
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.threshold = threshold
+        # One index per extra-argument scope (e.g. llm_string)
+        self._indexes: Dict[Tuple, SemanticIndex] = {}
+
+    def _index(self, scope: Tuple) -> SemanticIndex:
+        index = self._indexes.get(scope)
+        if index is None:
+            index = SemanticIndex(self.max_entries, self.ttl, self.threshold)
+            self._indexes[scope] = index
+        return index
+
+    def _clear_l1(self) -> None:
+        self._indexes.clear()
+
+    def _l1_size(self) -> int:
+        return sum(len(index) for index in self._indexes.values())
+
+    def lookup(self, prompt: str, *args) -> Optional[Any]:
+        self._check_corpus()
+        vector = self.embeddings.embed_query(prompt)
+        with self._lock:
+            value = self._index(args).get(vector)
+        self._record("l1", value is not None)
+        if value is not None:
+            return value
+
+        value = self.backend.lookup(prompt, *args)
+        self._record("crate", bool(value))
+        if value:
+            with self._lock:
+                evicted = self._index(args).put(vector, value)
+            self._record_evictions(evicted)
+        return value
+
+    def lookup_many(self, prompts: List[str], *args) -> List[Optional[Any]]:
+        """Bulk ``lookup``: L1 scores every prompt at once, misses go to CrateDB in bulk."""
+        if not prompts:
+            return []
+        self._check_corpus()
+        vectors = [self.embeddings.embed_query(prompt) for prompt in prompts]
+        with self._lock:
+            values = self._index(args).get_many(vectors)
+        for value in values:
+            self._record("l1", value is not None)
+        misses = [i for i, value in enumerate(values) if value is None]
+        if misses:
+            found = self._backend_lookup_many([prompts[i] for i in misses], *args)
+            evicted = 0
+            with self._lock:
+                for i, value in zip(misses, found):
+                    if value:
+                        values[i] = value
+                        evicted += self._index(args).put(vectors[i], value)
+            for value in found:
+                self._record("crate", bool(value))
+            self._record_evictions(evicted)
+        return values
+
+    def update(self, prompt: str, *args, corpus_version: Optional[int] = None) -> None:
+        """Write through to both tiers; the last argument is the value.
+
+        An answer computed under an older ``corpus_version`` stays out of L1.
+        """
+        if self._current(corpus_version):
+            vector = self.embeddings.embed_query(prompt)
+            with self._lock:
+                evicted = self._index(args[:-1]).put(vector, args[-1])
+            self._record_evictions(evicted)
+        self.backend.update(prompt, *args, corpus_version=corpus_version)
+
+    def clear(self, **kwargs) -> None:
+        with self._lock:
+            self._indexes.clear()
+        self.backend.clear(**kwargs)
+
+
+def build_tiered_caches(config, standard_backend, semantic_backend, embeddings, metrics=None,
+                        corpus=None):
+    """Wrap the CrateDB caches with L1 tiers, unless disabled in config."""
+    if not config.cache.l1_enabled:
+        return standard_backend, semantic_backend
+    standard = TieredCache(
+        standard_backend,
+        LRUCache(config.cache.l1_max_entries, config.cache.l1_ttl_seconds),
+        metrics=metrics,
+        corpus=corpus
+    )
+    semantic = TieredSemanticCache(
+        semantic_backend,
+        embeddings,
+        max_entries=config.cache.l1_semantic_max_entries,
+        ttl=config.cache.l1_ttl_seconds,
+        threshold=config.vector_store.semantic_cache_threshold,
+        metrics=metrics,
+        corpus=corpus
+    )
+    return standard, semantic
@@ -2,14 +2,21 @@
 from typing import Optional
 from langchain.chat_models import ChatOpenAI
 from langchain.llms import Ollama
-from langchain.cache import CrateDBCache, CrateDBSemanticCache
-from langchain.globals import set_llm_cache
+from langchain.prompts.base import StringPromptValue
 from opentelemetry import trace
+from ..concurrency import run_sync
+from ..embeddings.context import embedding_context
+from ..resources import ResourceRegistry
+from .cache import build_tiered_caches
+from .pool import LLMBackend, LLMPool
+from .store import CacheCompactor, CacheStore, SemanticCacheStore
 
 class LLMGateway:
-    def __init__(self, config, embeddings):
+    def __init__(self, config, resources: ResourceRegistry, metrics=None):
         self.config = config
-        self.embeddings = embeddings
+        self.resources = resources
+        self.embeddings = resources.embeddings
+        self.metrics = metrics
         self.tracer = trace.get_tracer(__name__)
         
         # Initialize caches
@@ -20,54 +27,122 @@ class LLMGateway:
     
     def _setup_caches(self):
         """Setup standard and semantic caches."""
+        cache_config = self.config.cache
+        corpus = self.resources.corpus
         # Standard cache for exact matches
-        standard_cache = CrateDBCache(
-            connection_string=self.config.vector_store.connection_string,
-            table_name=self.config.vector_store.cache_table
+        standard_cache = CacheStore(
+            self.resources.execute,
+            self.resources.fetch_all,
+            self.config.vector_store.cache_table,
+            corpus,
+            max_entries=cache_config.max_entries,
+            ttl=cache_config.ttl_seconds,
+            policy=cache_config.eviction_policy,
+            metrics=self.metrics
         )
         
         # Semantic cache for similar queries
-        semantic_cache = CrateDBSemanticCache(
-            connection_string=self.config.vector_store.connection_string,
-            table_name=self.config.vector_store.semantic_cache_table,
-            embedding=self.embeddings,
-            score_threshold=self.config.vector_store.semantic_cache_threshold
+        semantic_cache = SemanticCacheStore(
+            self.resources.execute,
+            self.resources.fetch_all,
+            self.config.vector_store.semantic_cache_table,
+            corpus,
+            self.embeddings,
+            threshold=self.config.vector_store.semantic_cache_threshold,
+            max_entries=cache_config.semantic_max_entries,
+            ttl=cache_config.ttl_seconds,
+            policy=cache_config.eviction_policy,
+            metrics=self.metrics
         )
         
-        # Set standard cache as default
-        set_llm_cache(standard_cache)
+        # TTL, corpus-version and size-cap cleanup of both tables
+        self.compactor = CacheCompactor(
+            {"standard": standard_cache, "semantic": semantic_cache},
+            cache_config.compaction_interval_seconds
+        )
+        self.compactor.start()
+        
+        # Put the in-process L1 tier in front of both
+        standard_cache, semantic_cache = build_tiered_caches(
+            self.config, standard_cache, semantic_cache, self.embeddings, self.metrics, corpus
+        )
+        self.standard_cache = standard_cache
         self.semantic_cache = semantic_cache
     
-    def _initialize_llm(self):
-        """Initialize LLM based on configuration."""
+    def _initialize_llm(self) -> LLMPool:
+        """Initialize the LLM backend pool based on configuration.
+
+        ChatbotBackend does its own cache lookups and writes, so the LLMs
+        bypass LangChain's global cache (its lookup blocks the event loop).
+        """
+        max_concurrency = self.config.llm_pool.max_concurrency
         if self.config.llm.type.lower() == "openai":
-            return ChatOpenAI(
-                model=self.config.llm.openai_model,
-                openai_api_key=self.config.llm.openai_api_key,
-                temperature=self.config.llm.temperature
-            )
-        else:  # default to ollama
-            return Ollama(
-                base_url=self.config.llm.ollama_base_url,
-                model=self.config.llm.ollama_model,
-                temperature=self.config.llm.temperature
-            )
+            backends = [LLMBackend(
+                "openai",
+                ChatOpenAI(
+                    model=self.config.llm.openai_model,
+                    openai_api_key=self.config.llm.openai_api_key,
+                    temperature=self.config.llm.temperature,
+                    cache=False
+                ),
+                max_concurrency
+            )]
+        else:  # default to ollama, one backend per replica
+            backends = [
+                LLMBackend(
+                    base_url,
+                    Ollama(
+                        base_url=base_url,
+                        model=self.config.llm.ollama_model,
+                        temperature=self.config.llm.temperature,
+                        cache=False
+                    ),
+                    max_concurrency,
+                    health_url=f"{base_url.rstrip('/')}/api/tags"
+                )
+                for base_url in self.config.llm.ollama_urls
+            ]
+        return LLMPool(backends, self.config.llm_pool, self.metrics)
+    
+    def cache_stats(self) -> dict:
+        """Entries, hit ratios and lookup times of both caches."""
+        return {
+            "corpus_version": self.resources.corpus.current(),
+            "standard": self.standard_cache.stats(),
+            "semantic": self.semantic_cache.stats(),
+        }
+    
+    async def close(self) -> None:
+        """Stop the backend pool's health checks and cache compaction."""
+        await self.llm.close()
+        await run_sync(self.compactor.close)
     
     async def get_completion(self, prompt: str) -> str:
         """Get completion from LLM with caching."""
-        with self.tracer.start_span("llm_completion") as span:
+        with self.tracer.start_span("llm_completion") as span, \
+                embedding_context() as embedding_ctx:
             span.set_attribute("prompt", prompt)
             
-            # Check semantic cache
-            cached_response = self.semantic_cache.lookup(prompt)
-            if cached_response:
-                span.set_attribute("cache_hit", "semantic")
-                return cached_response
-            
-            # Get response from LLM
-            response = await self.llm.agenerate([prompt])
-            
-            # Update caches
-            self.semantic_cache.update(prompt, response.generations[0][0].text)
+            # Embed once; the cache lookup and update reuse the vector
+            await self.embeddings.aembed_query(prompt)
             
-            return response.generations[0][0].text
+            try:
+                # Check semantic cache
+                cached_response = await run_sync(self.semantic_cache.lookup, prompt)
+                if cached_response:
+                    span.set_attribute("cache_hit", "semantic")
+                    return cached_response
+                
+                # Get response from LLM
+                response = await self.llm.agenerate_prompt([StringPromptValue(text=prompt)])
+                
+                # Update caches
+                await run_sync(
+                    self.semantic_cache.update, prompt, response.generations[0][0].text
+                )
+                
+                return response.generations[0][0].text
+            finally:
+                span.set_attribute("embeddings.computed", embedding_ctx.computed)
+                if self.metrics:
+                    self.metrics.record_request_embeddings(embedding_ctx.computed)
@@ -0,0 +1,277 @@
+"""Pool of LLM backends with load-aware routing, hedging and failover."""
+import asyncio
+import contextvars
+import logging
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional, Sequence
+
+import httpx
+from langchain.schema import LLMResult
+
+logger = logging.getLogger(__name__)
+
+# Latencies kept per backend for the hedging percentile
+LATENCY_WINDOW = 256
+
+
+class LLMBackend:
+    """One LLM client with its own concurrency limit and health state."""
+
+    def __init__(self, name: str, llm, max_concurrency: int, health_url: Optional[str] = None):
+        self.name = name
+        self.llm = llm
+        self.max_concurrency = max(max_concurrency, 1)
+        # Probed by the health check loop; None relies on call failures only
+        self.health_url = health_url
+        self.healthy = True
+        self.failures = 0
+        # Requests in flight or waiting for a slot
+        self.outstanding = 0
+        self.latencies: Deque[float] = deque(maxlen=LATENCY_WINDOW)
+        self._slots: Optional[asyncio.Semaphore] = None
+
+    @property
+    def slots(self) -> asyncio.Semaphore:
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_concurrency)
+        return self._slots
+
+    @property
+    def load(self) -> float:
+        return self.outstanding / self.max_concurrency
+
+    def latency_percentile(self, percentile: float) -> Optional[float]:
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(int(len(ordered) * percentile / 100.0), len(ordered) - 1)]
+
+
+class LLMPool:
+    """Routes LLM calls across several backends.
+
+    Each call goes to the healthy backend with the fewest outstanding
+    requests relative to its ``max_concurrency``; calls beyond that limit
+    wait for a slot on the chosen backend. A call still running past the
+    backend's ``hedge_percentile`` latency is hedged on a second backend
+    and the first answer wins. Errors fail over to another backend, up to
+    ``max_attempts`` backends per call; streams only fail over before the
+    first token. Backends failing ``unhealthy_after_failures`` calls in a
+    row are skipped until a health check passes.
+    """
+
+    def __init__(self, backends: Sequence[LLMBackend], config, metrics=None):
+        if not backends:
+            raise ValueError("LLMPool needs at least one backend")
+        self.backends = list(backends)
+        self.config = config
+        self.metrics = metrics
+        self._next = 0
+        self._health_task: Optional[asyncio.Task] = None
+        if self.metrics:
+            for backend in self.backends:
+                self.metrics.update_llm_backend_healthy(backend.name, 1)
+
+    @property
+    def primary(self):
+        """The first backend's client, e.g. for chains that only render prompts."""
+        return self.backends[0].llm
+
+    def start(self) -> None:
+        """Start health checks on the running event loop."""
+        if self._health_task is None and self.config.health_check_interval > 0:
+            # Started by the first request; it must not inherit that request's
+            # context (its trace or profile)
+            self._health_task = asyncio.create_task(
+                self._health_loop(), context=contextvars.Context()
+            )
+
+    async def close(self) -> None:
+        if self._health_task is not None:
+            self._health_task.cancel()
+            try:
+                await self._health_task
+            except asyncio.CancelledError:
+                pass
+            self._health_task = None
+
+    async def agenerate_prompt(self, prompts: List[Any], stop: Optional[List[str]] = None,
+                               **kwargs) -> LLMResult:
+        """Generate on the best backend, hedging slow calls and failing over on errors."""
+        self.start()
+        loop = asyncio.get_running_loop()
+        tried: List[LLMBackend] = []
+        running: Dict[asyncio.Task, LLMBackend] = {}
+        error: Optional[BaseException] = None
+        hedge_at: Optional[float] = None
+        try:
+            while True:
+                if not running:
+                    backend = self._choose(tried)
+                    if backend is None:
+                        raise error or RuntimeError("No LLM backend available")
+                    if tried and self.metrics:
+                        self.metrics.record_llm_failover()
+                    tried.append(backend)
+                    running[self._start_generation(backend, prompts, stop, kwargs)] = backend
+                    delay = self._hedge_delay(backend)
+                    hedge_at = None if delay is None else loop.time() + delay
+
+                timeout = None if hedge_at is None else max(hedge_at - loop.time(), 0.0)
+                done, _ = await asyncio.wait(
+                    running, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    # Slower than usual: race a second backend
+                    hedge_at = None
+                    backend = self._choose(tried)
+                    if backend is not None:
+                        tried.append(backend)
+                        running[self._start_generation(backend, prompts, stop, kwargs)] = backend
+                        if self.metrics:
+                            self.metrics.record_llm_hedge("started")
+                    continue
+
+                for task in done:
+                    backend = running.pop(task)
+                    if task.exception() is None:
+                        if len(tried) > 1 and self.metrics:
+                            self.metrics.record_llm_hedge(
+                                "primary_won" if backend is tried[0] else "hedge_won"
+                            )
+                        return task.result()
+                    error = task.exception()
+                    logger.warning(f"LLM backend {backend.name} failed: {error}")
+        finally:
+            for task in running:
+                task.cancel()
+
+    async def astream(self, input: Any, config: Optional[Any] = None,
+                      **kwargs) -> AsyncIterator[Any]:
+        """Stream from the best backend, failing over until the first chunk arrives."""
+        self.start()
+        tried: List[LLMBackend] = []
+        error: Optional[BaseException] = None
+        while True:
+            backend = self._choose(tried)
+            if backend is None:
+                raise error or RuntimeError("No LLM backend available")
+            if tried and self.metrics:
+                self.metrics.record_llm_failover()
+            tried.append(backend)
+            started = False
+            try:
+                async with self._lease(backend):
+                    async for chunk in backend.llm.astream(input, config, **kwargs):
+                        started = True
+                        yield chunk
+                return
+            except Exception as e:
+                if started:
+                    raise
+                error = e
+                logger.warning(f"LLM backend {backend.name} failed: {e}")
+
+    def _start_generation(self, backend: LLMBackend, prompts, stop, kwargs) -> asyncio.Task:
+        async def generate():
+            async with self._lease(backend):
+                return await backend.llm.agenerate_prompt(prompts, stop=stop, **kwargs)
+        return asyncio.create_task(generate())
+
+    def _choose(self, tried: Sequence[LLMBackend]) -> Optional[LLMBackend]:
+        """Least-loaded untried backend, preferring healthy ones."""
+        if len(tried) >= self.config.max_attempts:
+            return None
+        untried = [backend for backend in self.backends if backend not in tried]
+        candidates = [backend for backend in untried if backend.healthy] or untried
+        if not candidates:
+            return None
+        # Rotate among equally loaded backends
+        count = len(self.backends)
+        start = self._next
+        self._next = (self._next + 1) % count
+        return min(
+            candidates,
+            key=lambda backend: (backend.load, (self.backends.index(backend) - start) % count)
+        )
+
+    def _hedge_delay(self, backend: LLMBackend) -> Optional[float]:
+        if self.config.hedge_percentile <= 0 or self.config.max_attempts < 2 \
+                or len(self.backends) < 2 \
+                or len(backend.latencies) < self.config.hedge_min_samples:
+            return None
+        return backend.latency_percentile(self.config.hedge_percentile)
+
+    @asynccontextmanager
+    async def _lease(self, backend: LLMBackend) -> AsyncIterator[None]:
+        """Hold one of the backend's slots and record the call's outcome."""
+        backend.outstanding += 1
+        self._update_queue(backend, queued=1)
+        start_time = time.perf_counter()
+        acquired = False
+        outcome = "cancelled"
+        try:
+            async with backend.slots:
+                acquired = True
+                self._update_queue(backend, queued=-1, in_flight=1)
+                try:
+                    yield
+                    outcome = "success"
+                except Exception:
+                    outcome = "error"
+                    raise
+                finally:
+                    self._update_queue(backend, in_flight=-1)
+        finally:
+            if not acquired:
+                self._update_queue(backend, queued=-1)
+            backend.outstanding -= 1
+            duration = time.perf_counter() - start_time
+            if outcome == "success":
+                backend.latencies.append(duration)
+                backend.failures = 0
+            elif outcome == "error":
+                backend.failures += 1
+                if backend.failures >= self.config.unhealthy_after_failures:
+                    self._set_health(backend, False)
+            if self.metrics:
+                self.metrics.record_llm_backend_request(backend.name, duration, outcome)
+
+    def _update_queue(self, backend: LLMBackend, queued: int = 0, in_flight: int = 0) -> None:
+        if self.metrics:
+            self.metrics.update_llm_backend_load(backend.name, queued, in_flight)
+
+    def _set_health(self, backend: LLMBackend, healthy: bool) -> None:
+        if backend.healthy == healthy:
+            return
+        backend.healthy = healthy
+        if healthy:
+            backend.failures = 0
+            logger.info(f"LLM backend {backend.name} is healthy again")
+        else:
+            logger.warning(f"LLM backend {backend.name} marked unhealthy")
+        if self.metrics:
+            self.metrics.update_llm_backend_healthy(backend.name, 1 if healthy else -1)
+
+    async def _health_loop(self) -> None:
+        async with httpx.AsyncClient(timeout=self.config.health_check_timeout) as client:
+            while True:
+                await asyncio.sleep(self.config.health_check_interval)
+                await asyncio.gather(*(self._check(client, backend) for backend in self.backends))
+
+    async def _check(self, client: httpx.AsyncClient, backend: LLMBackend) -> None:
+        if backend.health_url is None:
+            # Nothing to probe: retry an unhealthy backend after one interval
+            self._set_health(backend, True)
+            return
+        try:
+            response = await client.get(backend.health_url)
+            response.raise_for_status()
+        except httpx.HTTPError as e:
+            if backend.healthy:
+                logger.warning(f"Health check of LLM backend {backend.name} failed: {e}")
+            self._set_health(backend, False)
+        else:
+            self._set_health(backend, True)
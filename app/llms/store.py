@@ -0,0 +1,529 @@
+"""CrateDB-backed LLM caches with TTL, a size cap and corpus invalidation.
+
+The tables of LangChain's CrateDBCache/CrateDBSemanticCache that these
+replace are not used any more; drop them with::
+
+    python -m app.llms.store
+"""
+import hashlib
+import json
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain.load.dump import dumps
+from langchain.load.load import loads
+from langchain.schema.cache import BaseCache
+
+logger = logging.getLogger(__name__)
+
+# Keys per SELECT/DELETE ... IN (...) statement
+STATEMENT_BATCH_SIZE = 500
+# How often a process pulls other processes' semantic entries
+SEMANTIC_SYNC_SECONDS = 1.0
+# Best matches checked before a semantic lookup gives up
+SEMANTIC_CANDIDATES = 3
+
+# Cache tables from before CacheStore, with LangChain's row layout
+LEGACY_TABLES = ("llm_cache", "semantic_cache")
+
+EVICTION_ORDER = {
+    "lru": "COALESCE(last_hit_at, created_at) ASC",
+    "lfu": "hits ASC, COALESCE(last_hit_at, created_at) ASC",
+}
+
+
+def encode_value(value: Any) -> str:
+    """Serialize a cached answer or a list of LangChain generations."""
+    if isinstance(value, str):
+        return json.dumps({"text": value})
+    return json.dumps({"generations": [dumps(generation) for generation in value]})
+
+
+def decode_value(raw: str) -> Any:
+    data = json.loads(raw)
+    if "text" in data:
+        return data["text"]
+    return [loads(generation) for generation in data["generations"]]
+
+
+class CacheStore(BaseCache):
+    """Exact-match LLM cache table with per-entry lifecycle data.
+
+    Each row records when it was written, the corpus version it was
+    computed under and how often and how recently it was hit. Entries
+    older than ``ttl`` seconds or from an older corpus version are misses.
+    ``compact()`` deletes them and then evicts the least recently
+    (``lru``) or least frequently (``lfu``) hit entries above
+    ``max_entries``. Hit counts are buffered in memory and written by
+    ``compact()`` rather than on every lookup.
+    """
+
+    def __init__(
+        self,
+        execute: Callable[[str, Sequence[Any]], Any],
+        fetch_all: Callable[[str, Sequence[Any]], List[tuple]],
+        table_name: str,
+        corpus,
+        max_entries: int,
+        ttl: float,
+        policy: str = "lru",
+        name: str = "standard",
+        metrics=None
+    ):
+        if policy.lower() not in EVICTION_ORDER:
+            raise ValueError(f"Unknown cache eviction policy: {policy}")
+        self.execute = execute
+        self.fetch_all = fetch_all
+        self.table_name = table_name
+        self.corpus = corpus
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.policy = policy.lower()
+        self.name = name
+        self.metrics = metrics
+        self._lock = threading.Lock()
+        self._pending_hits: Dict[str, Tuple[int, float]] = {}
+        self._lookups = 0
+        self._hits = 0
+        self._lookup_seconds = 0.0
+        self._evicted = 0
+        self._last_compaction: Optional[Dict[str, Any]] = None
+        self.create_table()
+
+    def create_table(self) -> None:
+        self.execute(
+            f"CREATE TABLE IF NOT EXISTS {self.table_name} ("
+            "cache_key TEXT PRIMARY KEY, scope TEXT, prompt TEXT, response TEXT, "
+            "embedding TEXT, created_at DOUBLE PRECISION, last_hit_at DOUBLE PRECISION, "
+            "hits BIGINT, corpus_version BIGINT)"
+        )
+
+    @staticmethod
+    def _scope(args: Sequence[Any]) -> str:
+        # Extra lookup arguments, e.g. LangChain's llm_string
+        return json.dumps([str(arg) for arg in args])
+
+    @staticmethod
+    def _key(prompt: str, scope: str) -> str:
+        return hashlib.sha256(json.dumps([prompt, scope]).encode("utf-8")).hexdigest()
+
+    def lookup(self, prompt: str, *args) -> Optional[Any]:
+        start_time = time.perf_counter()
+        value = self._get(self._key(prompt, self._scope(args)))
+        self._record_lookup(start_time, value is not None)
+        return value
+
+    def lookup_many(self, prompts: List[str], *args) -> List[Optional[Any]]:
+        """``lookup`` for many prompts, reading their rows with ``IN (...)`` queries."""
+        start_time = time.perf_counter()
+        scope = self._scope(args)
+        keys = [self._key(prompt, scope) for prompt in prompts]
+        found = self._fetch_many(keys)
+        self._count_hits(found)
+        values = [found.get(key) for key in keys]
+        self._record_lookup(start_time, sum(value is not None for value in values), len(keys))
+        return values
+
+    def update(self, prompt: str, *args, corpus_version: Optional[int] = None) -> None:
+        """Insert or replace an entry; the last argument is the value.
+
+        ``corpus_version`` is the version the answer was computed under,
+        read before retrieval; it defaults to the current one.
+        """
+        scope = self._scope(args[:-1])
+        self._upsert(self._key(prompt, scope), scope, prompt, args[-1], None, corpus_version)
+
+    def clear(self, **kwargs) -> None:
+        self.execute(f"DELETE FROM {self.table_name}")
+        with self._lock:
+            self._pending_hits.clear()
+
+    def _get(self, key: str) -> Optional[Any]:
+        found = self._fetch_many([key])
+        self._count_hits(found)
+        return found.get(key)
+
+    def _fetch_many(self, keys: Sequence[str]) -> Dict[str, Any]:
+        """Values of the live entries among ``keys``."""
+        values = {}
+        keys = list(dict.fromkeys(keys))
+        for start in range(0, len(keys), STATEMENT_BATCH_SIZE):
+            batch = keys[start:start + STATEMENT_BATCH_SIZE]
+            placeholders = ", ".join("?" for _ in batch)
+            rows = self.fetch_all(
+                f"SELECT cache_key, response, created_at, corpus_version FROM {self.table_name} "
+                f"WHERE cache_key IN ({placeholders})",
+                batch
+            )
+            for key, response, created_at, corpus_version in rows:
+                if self._live(created_at, corpus_version):
+                    values[key] = decode_value(response)
+        return values
+
+    def _count_hits(self, keys: Iterable[str]) -> None:
+        now = time.time()
+        with self._lock:
+            for key in keys:
+                hits, _ = self._pending_hits.get(key, (0, 0.0))
+                self._pending_hits[key] = (hits + 1, now)
+
+    def _live(self, created_at: float, corpus_version: int) -> bool:
+        if self.ttl > 0 and created_at < time.time() - self.ttl:
+            return False
+        return corpus_version >= self.corpus.current()
+
+    def _upsert(self, key: str, scope: str, prompt: str, value: Any,
+                embedding: Optional[str] = None, corpus_version: Optional[int] = None) -> None:
+        if corpus_version is None:
+            corpus_version = self.corpus.current()
+        self.execute(
+            f"INSERT INTO {self.table_name} (cache_key, scope, prompt, response, embedding, "
+            "created_at, last_hit_at, hits, corpus_version) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (cache_key) DO UPDATE SET response = excluded.response, "
+            "embedding = excluded.embedding, created_at = excluded.created_at, "
+            "corpus_version = excluded.corpus_version",
+            (key, scope, prompt, encode_value(value), embedding, time.time(), None, 0,
+             corpus_version)
+        )
+
+    def _record_lookup(self, start_time: float, hits: int, lookups: int = 1) -> None:
+        with self._lock:
+            self._lookups += lookups
+            self._hits += hits
+            self._lookup_seconds += time.perf_counter() - start_time
+
+    def count(self) -> int:
+        return int(self.fetch_all(f"SELECT COUNT(*) FROM {self.table_name}")[0][0])
+
+    def compact(self) -> Dict[str, Any]:
+        """Write buffered hit counts, delete dead entries and enforce the size cap."""
+        start_time = time.perf_counter()
+        result = {"hits_flushed": self._flush_hits(), "expired": 0, "stale": 0, "evicted": 0}
+        if self.ttl > 0:
+            result["expired"] = self._delete_where("created_at < ?", (time.time() - self.ttl,))
+        result["stale"] = self._delete_where("corpus_version < ?", (self.corpus.current(),))
+        excess = self.count() - self.max_entries
+        if excess > 0:
+            keys = [row[0] for row in self.fetch_all(
+                f"SELECT cache_key FROM {self.table_name} "
+                f"ORDER BY {EVICTION_ORDER[self.policy]} LIMIT ?",
+                (excess,)
+            )]
+            self._delete_keys(keys)
+            result["evicted"] = len(keys)
+        removed = result["expired"] + result["stale"] + result["evicted"]
+        result["duration_seconds"] = round(time.perf_counter() - start_time, 4)
+        result["finished_at"] = time.time()
+        with self._lock:
+            self._evicted += removed
+            self._last_compaction = result
+        if self.metrics and removed:
+            self.metrics.record_cache_eviction(removed, cache=self.name, tier="crate")
+        return result
+
+    def _flush_hits(self) -> int:
+        with self._lock:
+            pending, self._pending_hits = self._pending_hits, {}
+        for key, (hits, last_hit_at) in pending.items():
+            self.execute(
+                f"UPDATE {self.table_name} SET hits = hits + ?, last_hit_at = ? "
+                "WHERE cache_key = ?",
+                (hits, last_hit_at, key)
+            )
+        return len(pending)
+
+    def _delete_where(self, condition: str, params: Sequence[Any]) -> int:
+        count = int(self.fetch_all(
+            f"SELECT COUNT(*) FROM {self.table_name} WHERE {condition}", params
+        )[0][0])
+        if count:
+            self.execute(f"DELETE FROM {self.table_name} WHERE {condition}", params)
+        return count
+
+    def _delete_keys(self, keys: List[str]) -> None:
+        for start in range(0, len(keys), STATEMENT_BATCH_SIZE):
+            batch = keys[start:start + STATEMENT_BATCH_SIZE]
+            placeholders = ", ".join("?" for _ in batch)
+            self.execute(
+                f"DELETE FROM {self.table_name} WHERE cache_key IN ({placeholders})", batch
+            )
+
+    def stats(self) -> Dict[str, Any]:
+        """Entries, hit ratio, average lookup time and eviction totals."""
+        with self._lock:
+            lookups, hits, seconds = self._lookups, self._hits, self._lookup_seconds
+            evicted, last_compaction = self._evicted, self._last_compaction
+        return {
+            "entries": self.count(),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl,
+            "policy": self.policy,
+            "lookups": lookups,
+            "hits": hits,
+            "hit_ratio": round(hits / lookups, 4) if lookups else 0.0,
+            "avg_lookup_ms": round(seconds / lookups * 1000, 3) if lookups else 0.0,
+            "evicted": evicted,
+            "last_compaction": last_compaction,
+        }
+
+
+class SemanticCacheStore(CacheStore):
+    """Semantic LLM cache over the same table layout, with embeddings.
+
+    Every process keeps the table's embeddings in one normalized matrix,
+    so a lookup is a matrix-vector product plus a primary-key read of the
+    best match; misses below the threshold need no query at all. New
+    entries from other processes are pulled at most every second and the
+    matrix is rebuilt after each compaction.
+    """
+
+    def __init__(
+        self,
+        execute: Callable[[str, Sequence[Any]], Any],
+        fetch_all: Callable[[str, Sequence[Any]], List[tuple]],
+        table_name: str,
+        corpus,
+        embeddings,
+        threshold: float,
+        max_entries: int,
+        ttl: float,
+        policy: str = "lru",
+        name: str = "semantic",
+        metrics=None
+    ):
+        self.embeddings = embeddings
+        self.threshold = threshold
+        self._rows: Dict[str, int] = {}
+        self._keys: List[Optional[str]] = []
+        self._scope_ids: Dict[str, int] = {}
+        self._row_scopes = np.zeros(0, dtype=np.int64)
+        self._vectors: Optional[np.ndarray] = None
+        self._synced_until = 0.0
+        self._synced_at = 0.0
+        super().__init__(
+            execute, fetch_all, table_name, corpus, max_entries, ttl, policy, name, metrics
+        )
+        self.reload()
+
+    @staticmethod
+    def _normalize(vector) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def lookup(self, prompt: str, *args) -> Optional[Any]:
+        start_time = time.perf_counter()
+        vector = self._normalize(self.embeddings.embed_query(prompt))
+        self._sync()
+        value = None
+        for key in self._candidates(vector, self._scope(args)):
+            value = self._get(key)
+            if value is not None:
+                break
+            # Deleted, expired or stale: skip it until the next rebuild
+            self._forget(key)
+        self._record_lookup(start_time, value is not None)
+        return value
+
+    def lookup_many(self, prompts: List[str], *args) -> List[Optional[Any]]:
+        """``lookup`` for many prompts.
+
+        One matrix product scores every prompt and one query per statement
+        batch reads all their candidates.
+        """
+        if not prompts:
+            return []
+        start_time = time.perf_counter()
+        vectors = np.stack([
+            self._normalize(self.embeddings.embed_query(prompt)) for prompt in prompts
+        ])
+        self._sync()
+        candidates = self._candidates_many(vectors, self._scope(args))
+        found = self._fetch_many([key for keys in candidates for key in keys])
+        values, used = [], []
+        for keys in candidates:
+            key = next((key for key in keys if key in found), None)
+            values.append(found.get(key))
+            if key is not None:
+                used.append(key)
+        self._count_hits(used)
+        for key in {key for keys in candidates for key in keys} - found.keys():
+            self._forget(key)
+        self._record_lookup(start_time, len(used), len(prompts))
+        return values
+
+    def update(self, prompt: str, *args, corpus_version: Optional[int] = None) -> None:
+        scope = self._scope(args[:-1])
+        key = self._key(prompt, scope)
+        vector = self._normalize(self.embeddings.embed_query(prompt))
+        self._upsert(key, scope, prompt, args[-1], json.dumps(vector.tolist()), corpus_version)
+        with self._lock:
+            self._add(key, scope, vector)
+
+    def clear(self, **kwargs) -> None:
+        super().clear(**kwargs)
+        self.reload()
+
+    def compact(self) -> Dict[str, Any]:
+        result = super().compact()
+        self.reload()
+        return result
+
+    def reload(self) -> None:
+        """Rebuild the in-memory matrix from the table."""
+        started_at = time.time()
+        rows = self.fetch_all(f"SELECT cache_key, scope, embedding FROM {self.table_name}")
+        with self._lock:
+            self._rows, self._keys = {}, []
+            self._row_scopes = np.zeros(len(rows), dtype=np.int64)
+            self._vectors = None
+            for key, scope, embedding in rows:
+                if embedding:
+                    self._add(key, scope, np.asarray(json.loads(embedding), dtype=np.float32))
+            self._synced_until = started_at
+            self._synced_at = time.monotonic()
+
+    def _sync(self) -> None:
+        """Pull entries other processes wrote since the last sync."""
+        if time.monotonic() - self._synced_at < SEMANTIC_SYNC_SECONDS:
+            return
+        started_at = time.time()
+        # Overlap the window: rows become searchable after a short delay
+        rows = self.fetch_all(
+            f"SELECT cache_key, scope, embedding FROM {self.table_name} WHERE created_at > ?",
+            (self._synced_until - 2 * SEMANTIC_SYNC_SECONDS,)
+        )
+        with self._lock:
+            for key, scope, embedding in rows:
+                if embedding:
+                    self._add(key, scope, np.asarray(json.loads(embedding), dtype=np.float32))
+            self._synced_until = started_at
+            self._synced_at = time.monotonic()
+
+    def _add(self, key: str, scope: str, vector: np.ndarray) -> None:
+        if self._vectors is None:
+            self._vectors = np.zeros((max(len(self._row_scopes), 64), vector.shape[0]),
+                                     dtype=np.float32)
+        if vector.shape[0] != self._vectors.shape[1]:
+            # Written with a different embedding model
+            return
+        scope_id = self._scope_ids.setdefault(scope, len(self._scope_ids))
+        row = self._rows.get(key)
+        if row is None:
+            row = len(self._keys)
+            if row >= self._vectors.shape[0]:
+                self._vectors = np.vstack([self._vectors, np.zeros_like(self._vectors)])
+            if row >= len(self._row_scopes):
+                self._row_scopes = np.concatenate(
+                    [self._row_scopes, np.zeros(max(row, 64), dtype=np.int64)]
+                )
+            self._keys.append(key)
+            self._rows[key] = row
+        self._vectors[row] = self._normalize(vector)
+        self._row_scopes[row] = scope_id
+
+    def _forget(self, key: str) -> None:
+        with self._lock:
+            row = self._rows.pop(key, None)
+            if row is not None:
+                self._keys[row] = None
+                self._vectors[row] = 0.0
+
+    def _candidates(self, vector: np.ndarray, scope: str) -> List[str]:
+        """Keys of the best matches above the threshold, best first."""
+        return self._candidates_many(vector[None, :], scope)[0]
+
+    def _candidates_many(self, vectors: np.ndarray, scope: str) -> List[List[str]]:
+        """``_candidates`` for each row of ``vectors``."""
+        with self._lock:
+            size = len(self._keys)
+            scope_id = self._scope_ids.get(scope)
+            if not size or scope_id is None or vectors.shape[1] != self._vectors.shape[1]:
+                return [[] for _ in vectors]
+            scores = vectors @ self._vectors[:size].T
+            scores[:, self._row_scopes[:size] != scope_id] = -np.inf
+            count = min(SEMANTIC_CANDIDATES, size)
+            results = []
+            for row_scores in scores:
+                best = np.argpartition(-row_scores, count - 1)[:count]
+                best = best[np.argsort(-row_scores[best])]
+                results.append([
+                    self._keys[row] for row in best
+                    if row_scores[row] >= self.threshold and self._keys[row] is not None
+                ])
+            return results
+
+    def stats(self) -> Dict[str, Any]:
+        stats = super().stats()
+        stats["threshold"] = self.threshold
+        with self._lock:
+            stats["indexed"] = len(self._rows)
+        return stats
+
+
+class CacheCompactor:
+    """Background thread compacting the cache tables every ``interval`` seconds."""
+
+    def __init__(self, caches: Dict[str, Any], interval: float):
+        self.caches = caches
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if self._thread is None and self.interval > 0:
+            self._thread = threading.Thread(
+                target=self._run, name="cache-compactor", daemon=True
+            )
+            self._thread.start()
+
+    def run_once(self) -> Dict[str, Dict[str, Any]]:
+        results = {}
+        for name, cache in self.caches.items():
+            compact = getattr(cache, "compact", None)
+            if compact is None:
+                continue
+            try:
+                results[name] = compact()
+            except Exception as e:
+                logger.error(f"Compacting the {name} cache failed: {e}")
+        return results
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.run_once()
+
+    def close(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval)
+            self._thread = None
+
+
+def drop_legacy_tables(execute: Callable[[str, Sequence[Any]], Any],
+                       keep: Sequence[str] = ()) -> List[str]:
+    """Drop the cache tables used before CacheStore, except any in ``keep``."""
+    dropped = []
+    for table_name in LEGACY_TABLES:
+        if table_name not in keep:
+            execute(f"DROP TABLE IF EXISTS {table_name}")
+            dropped.append(table_name)
+    return dropped
+
+
+if __name__ == "__main__":
+    from ..config import config
+    from ..resources import ResourceRegistry
+
+    logging.basicConfig(level=config.observability.log_level)
+    resources = ResourceRegistry(config)
+    try:
+        dropped = drop_legacy_tables(resources.execute, keep=(
+            config.vector_store.cache_table, config.vector_store.semantic_cache_table
+        ))
+        logger.info(f"Dropped legacy cache tables (if present): {', '.join(dropped)}")
+    finally:
+        resources.close()
@@ -1,27 +1,164 @@
 """FastAPI application for the knowledge assistant."""
-from fastapi import FastAPI, HTTPException
+import time
+
+_import_start = time.perf_counter()
+
+from contextlib import aclosing, asynccontextmanager
+from fastapi import Depends, FastAPI, Header, HTTPException
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest, start_http_server
 from pydantic import BaseModel
 from typing import List, Optional, Dict, Any
+import asyncio
+import hmac
+import json
+import os
 import uvicorn
 from app.config import config
+from app.concurrency import install_executor, run_sync, shutdown_executor
+from app.lifecycle import ComponentNotReady, Startup
+from app.resources import ResourceRegistry
 from app.data.processor import DataProcessor
+from app.data.jobs import JobManager
+from app.data.retrieval_cache import RetrievalCache
+from app.chatbot.admission import AdmissionController, Overloaded
 from app.chatbot.backend import ChatbotBackend
+from app.chatbot.warming import CacheWarmer
 from app.llms.gateway import LLMGateway
-from app.monitoring.metrics import MetricsManager
-from langchain.embeddings import HuggingFaceEmbeddings
-
-app = FastAPI(title="Knowledge Assistant")
+from app.monitoring.metrics import (
+    MetricsManager, RequestSpanMiddleware, setup_prometheus, setup_tracing, shutdown_tracing
+)
+from app.monitoring.interactions import InteractionWriter
+from app.monitoring.profiling import (
+    Profiler, ProfilingMiddleware, install_task_factory, requested, track
+)
 
-# Initialize components
-embeddings = HuggingFaceEmbeddings(model_endpoint=config.embeddings.endpoint)
-data_processor = DataProcessor(config)
-llm_gateway = LLMGateway(config, embeddings)
-chatbot = ChatbotBackend(config, llm_gateway.llm, data_processor)
+# Cheap, connection-free objects; everything that talks to a dependency
+# is built in the lifespan so importing this module never blocks or fails
+setup_prometheus()
 metrics = MetricsManager()
+resources = ResourceRegistry(config, metrics)
+startup = Startup(metrics, retry_seconds=config.server.startup_retry_seconds)
+ingestion_jobs = JobManager(max_history=config.ingestion.max_job_history)
+interaction_writer = InteractionWriter(config.interactions, resources.execute, metrics)
+retrieval_cache = (
+    RetrievalCache(config.retriever, resources.corpus, metrics)
+    if config.retriever.cache_enabled else None
+)
+admission = AdmissionController(config.admission, metrics) if config.admission.enabled else None
+profiler = Profiler(config.profiling, metrics)
+cache_warmer = CacheWarmer(
+    config.warming, resources.fetch_all, resources.corpus, metrics,
+    table_name=interaction_writer.table_name
+)
+
+def build_chatbot() -> ChatbotBackend:
+    """Assemble the chatbot from already-initialized components."""
+    llm_gateway = startup.get("llm_gateway")
+    return ChatbotBackend(
+        config,
+        llm_gateway.llm,
+        startup.get("data_processor"),
+        metrics,
+        standard_cache=llm_gateway.standard_cache,
+        semantic_cache=llm_gateway.semantic_cache,
+        retrieval_cache=retrieval_cache,
+        admission=admission
+    )
+
+# Components in a stage are warmed in parallel; stages run in order
+STARTUP_STAGES = [
+    [
+        ("cratedb", resources.check_database),
+        ("embeddings", resources.check_embeddings),
+        ("data_processor", lambda: DataProcessor(config, resources, metrics=metrics)),
+        ("llm_gateway", lambda: LLMGateway(config, resources, metrics)),
+    ],
+    [
+        # Retrieval must not start on an ANN index that is still being built
+        ("ann_index", lambda: startup.get("data_processor").build_ann_index()),
+    ],
+    [
+        ("chatbot", build_chatbot),
+    ],
+]
+
+async def warm_caches_when_ready(warmup: asyncio.Task) -> None:
+    """Start a cache warming run once every component is ready."""
+    await warmup
+    cache_warmer.submit(startup.get("chatbot"))
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Warm components in the background and release them on shutdown."""
+    install_executor()
+    install_task_factory()
+    # Stage spans are exported to Tempo; before this they are non-recording
+    setup_tracing(config.observability.tempo_endpoint)
+    # /metrics is always served by the app; a separate port is opt-in
+    if config.observability.prometheus_port != config.server.port:
+        start_http_server(config.observability.prometheus_port)
+    metrics.record_component_init("import", IMPORT_SECONDS)
+    interaction_writer.start()
+    warmup = asyncio.create_task(startup.run_until_ready(STARTUP_STAGES))
+    if config.warming.on_startup:
+        warm_caches = asyncio.create_task(warm_caches_when_ready(warmup))
+    yield
+    warmup.cancel()
+    if config.warming.on_startup:
+        warm_caches.cancel()
+    await cache_warmer.shutdown()
+    await ingestion_jobs.shutdown()
+    if "data_processor" in startup.components:
+        startup.components["data_processor"].close()
+    if "llm_gateway" in startup.components:
+        await startup.components["llm_gateway"].close()
+    await interaction_writer.close()
+    resources.close()
+    await run_sync(shutdown_tracing)
+    shutdown_executor(wait=False)
+
+app = FastAPI(title="Knowledge Assistant", lifespan=lifespan)
+# Ingestion jobs are profiled in ingest_directory, since they outlive the request
+app.add_middleware(
+    ProfilingMiddleware, profiler=profiler, paths={"/query": "query", "/query/stream": "query"}
+)
+# Outermost, so profiles and pipeline spans see the request's span
+app.add_middleware(RequestSpanMiddleware)
+
+def overloaded_response(e: Overloaded) -> JSONResponse:
+    """Fast rejection telling the client when to retry."""
+    return JSONResponse(
+        {"detail": str(e), "lane": e.lane, "reason": e.reason},
+        status_code=e.status_code,
+        headers={"Retry-After": str(e.retry_after)}
+    )
+
+def component(name: str) -> Any:
+    """Return a ready component, or fail the request with 503."""
+    try:
+        return startup.get(name)
+    except ComponentNotReady as e:
+        raise HTTPException(status_code=503, detail=str(e))
 
 class QueryRequest(BaseModel):
     query: str
 
+class BatchQueryRequest(BaseModel):
+    queries: List[str]
+    # Defaults to streaming above QUERY_BATCH_STREAM_THRESHOLD queries
+    stream: Optional[bool] = None
+
+class CacheWarmRequest(BaseModel):
+    # Default to WARMING_STRATEGY and WARMING_TOP_N
+    strategy: Optional[str] = None
+    top_n: Optional[int] = None
+
+class ProfileRequest(BaseModel):
+    # "query" or "ingest"
+    kind: str = "query"
+    count: int = 1
+
 class DocumentRequest(BaseModel):
     content: str
     metadata: Optional[Dict[str, Any]] = None
@@ -30,13 +167,119 @@ class QueryResponse(BaseModel):
     answer: str
     sources: List[str]
     metadata: List[Dict[str, Any]]
+    cache_type: str = "none"
 
 @app.post("/query", response_model=QueryResponse)
 async def query_knowledge_base(request: QueryRequest):
     """Query the knowledge base."""
+    chatbot = component("chatbot")
     try:
+        start_time = time.time()
+        prompt_version = chatbot.prompt_version
         response = await chatbot.process_input(request.query)
+        await interaction_writer.record(
+            request.query,
+            response["answer"],
+            time.time() - start_time,
+            cache_type=response["cache_type"],
+            prompt_version=prompt_version
+        )
         return response
+    except Overloaded as e:
+        return overloaded_response(e)
+    except Exception as e:
+        metrics.record_error()
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/query/stream")
+async def stream_query_knowledge_base(request: QueryRequest):
+    """Query the knowledge base, streaming the answer as server-sent events."""
+    chatbot = component("chatbot")
+    start_time = time.time()
+    prompt_version = chatbot.prompt_version
+    # The stream runs in its own task (its context variables must stay in one
+    # context) and admission is decided before its first event, so a shed
+    # request gets a plain 429/503 instead of a 200 with an error event
+    events_queue: asyncio.Queue = asyncio.Queue(maxsize=16)
+    
+    async def pump():
+        try:
+            async with aclosing(chatbot.stream_input(request.query)) as stream:
+                async for event in stream:
+                    await events_queue.put(event)
+        except Exception as e:
+            await events_queue.put(e)
+    
+    task = asyncio.create_task(pump())
+    first = await events_queue.get()
+    if isinstance(first, Overloaded):
+        return overloaded_response(first)
+    if isinstance(first, Exception):
+        metrics.record_error()
+        raise HTTPException(status_code=500, detail=str(first))
+    
+    async def events():
+        event = first
+        try:
+            while not isinstance(event, Exception):
+                yield f"event: {event['event']}\ndata: {json.dumps(event['data'])}\n\n"
+                if event["event"] == "done":
+                    await interaction_writer.record(
+                        request.query,
+                        event["data"]["answer"],
+                        time.time() - start_time,
+                        cache_type=event["data"]["cache_type"],
+                        prompt_version=prompt_version
+                    )
+                    return
+                event = await events_queue.get()
+            metrics.record_error()
+            yield f"event: error\ndata: {json.dumps({'detail': str(event)})}\n\n"
+        finally:
+            # A client that disconnects releases the stream's admission slots
+            task.cancel()
+    
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+@app.post("/query/batch")
+async def batch_query_knowledge_base(request: BatchQueryRequest):
+    """Answer many queries; results keep input order and carry per-item errors."""
+    if len(request.queries) > config.batch.max_queries:
+        raise HTTPException(
+            status_code=413,
+            detail=f"At most {config.batch.max_queries} queries per batch"
+        )
+    chatbot = component("chatbot")
+    prompt_version = chatbot.prompt_version
+    
+    async def results():
+        async for item in chatbot.process_batch(request.queries):
+            if "error" not in item:
+                await interaction_writer.record(
+                    item["query"],
+                    item["answer"],
+                    item["process_time"],
+                    cache_type=item["cache_type"],
+                    prompt_version=prompt_version
+                )
+            yield item
+    
+    stream = request.stream
+    if stream is None:
+        stream = len(request.queries) > config.batch.stream_threshold
+    if stream:
+        async def lines():
+            try:
+                async for item in results():
+                    yield json.dumps(item) + "\n"
+            except Exception as e:
+                metrics.record_error()
+                yield json.dumps({"error": str(e)}) + "\n"
+        
+        return StreamingResponse(lines(), media_type="application/x-ndjson")
+    
+    try:
+        return {"results": [item async for item in results()]}
     except Exception as e:
         metrics.record_error()
         raise HTTPException(status_code=500, detail=str(e))
@@ -44,6 +287,7 @@ async def query_knowledge_base(request: QueryRequest):
 @app.post("/ingest")
 async def ingest_document(request: DocumentRequest):
     """Ingest a new document into the knowledge base."""
+    data_processor = component("data_processor")
     try:
         await data_processor.process_text(request.content, request.metadata)
         return {"status": "success"}
@@ -51,15 +295,148 @@ async def ingest_document(request: DocumentRequest):
         metrics.record_error()
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.post("/ingest/directory")
-async def ingest_directory(directory_path: str):
-    """Ingest all documents from a directory."""
+@app.post("/ingest/directory", status_code=202)
+async def ingest_directory(directory_path: str, x_profile: Optional[str] = Header(None)):
+    """Start a background job ingesting all documents from a directory."""
+    data_processor = component("data_processor")
+    if not os.path.isdir(directory_path):
+        raise HTTPException(status_code=400, detail=f"Not a directory: {directory_path}")
+    trigger = profiler.trigger("ingest", requested(x_profile))
+    
+    async def run(job):
+        async with profiler.session(
+            "ingest", directory_path, trigger, trace_memory=config.profiling.tracemalloc
+        ) as profile:
+            if profile is not None:
+                job.profile_id = profile.id
+            await track(data_processor.process_directory(directory_path, job))
+    
+    job = ingestion_jobs.submit(directory_path, run)
+    return {"status": job.status, "job_id": job.id}
+
+@app.get("/ingest/jobs/{job_id}")
+async def ingestion_job_status(job_id: str):
+    """Report progress of an ingestion job."""
+    job = ingestion_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job: {job_id}")
+    return job.to_dict()
+
+@app.get("/cache/stats")
+async def cache_stats():
+    """Entries, hit ratio and average lookup time of the LLM and retrieval caches."""
+    llm_gateway = component("llm_gateway")
+    stats = await run_sync(llm_gateway.cache_stats)
+    if retrieval_cache is not None:
+        stats["retrieval"] = retrieval_cache.stats()
+    return stats
+
+@app.post("/cache/warm", status_code=202)
+async def warm_cache(request: Optional[CacheWarmRequest] = None):
+    """Start warming the LLM caches with the top logged queries."""
+    chatbot = component("chatbot")
+    request = request or CacheWarmRequest()
     try:
-        await data_processor.process_directory(directory_path)
-        return {"status": "success"}
-    except Exception as e:
-        metrics.record_error()
-        raise HTTPException(status_code=500, detail=str(e))
+        run = cache_warmer.submit(chatbot, request.strategy, request.top_n)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return run.to_dict()
+
+@app.get("/cache/warm")
+async def cache_warming_status():
+    """Report progress of the current or last cache warming run."""
+    if cache_warmer.last_run is None:
+        raise HTTPException(status_code=404, detail="No cache warming run yet")
+    return cache_warmer.last_run.to_dict()
+
+@app.get("/admission")
+async def admission_status():
+    """In-flight and queued requests per admission lane."""
+    if admission is None:
+        raise HTTPException(status_code=404, detail="Admission control is disabled")
+    return admission.stats()
+
+def require_admin(authorization: Optional[str] = Header(None)) -> None:
+    """Fail the request with 401 unless it carries ``Bearer <ADMIN_TOKEN>``."""
+    token = config.server.admin_token
+    if not token or not hmac.compare_digest(
+        (authorization or "").encode(), f"Bearer {token}".encode()
+    ):
+        raise HTTPException(
+            status_code=401, detail="Admin token required",
+            headers={"WWW-Authenticate": "Bearer"}
+        )
+
+def require_profiling() -> None:
+    """Fail the request with 404 unless profiling is enabled."""
+    if not config.profiling.enabled:
+        raise HTTPException(status_code=404, detail="Profiling is disabled")
+
+# Profiles expose code paths, timings and files; 404 before the token is checked
+PROFILING_ADMIN = [Depends(require_profiling), Depends(require_admin)]
+
+@app.post("/profiles", status_code=202, dependencies=PROFILING_ADMIN)
+async def arm_profiles(request: Optional[ProfileRequest] = None):
+    """Profile the next requests or ingestion jobs of a kind."""
+    request = request or ProfileRequest()
+    try:
+        return {"armed": profiler.arm(request.kind, request.count)}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/profiles", dependencies=PROFILING_ADMIN)
+async def list_profiles():
+    """Kept profiles, newest first, and the requests still armed for profiling."""
+    return {
+        "armed": profiler.armed,
+        "sample_rate": config.profiling.sample_rate,
+        "profiles": [profile.to_dict() for profile in profiler.profiles()],
+    }
+
+def get_profile(profile_id: str) -> Any:
+    """Return a kept profile, or fail the request with 404."""
+    profile = profiler.get(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail=f"Unknown profile: {profile_id}")
+    return profile
+
+@app.get("/profiles/{profile_id}", dependencies=PROFILING_ADMIN)
+async def profile_report(profile_id: str):
+    """Top functions, allocation growth and trace ID of a profile."""
+    return get_profile(profile_id).to_dict(details=True)
+
+@app.get("/profiles/{profile_id}/file", dependencies=PROFILING_ADMIN)
+async def profile_file(profile_id: str):
+    """The profile's pstats file, for snakeviz or ``python -m pstats``."""
+    profile = get_profile(profile_id)
+    if profile.path is None or not os.path.exists(profile.path):
+        raise HTTPException(status_code=404, detail=f"No file for profile: {profile_id}")
+    return FileResponse(
+        profile.path, media_type="application/octet-stream",
+        filename=os.path.basename(profile.path)
+    )
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Prometheus scrape endpoint."""
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+@app.get("/health")
+@app.get("/health/live")
+async def liveness():
+    """Liveness: the process is up and serving HTTP."""
+    return {"status": "alive"}
+
+@app.get("/health/ready")
+async def readiness():
+    """Readiness: every component is initialized and its dependency reachable."""
+    body = startup.readiness()
+    body["import_seconds"] = round(IMPORT_SECONDS, 3)
+    return JSONResponse(body, status_code=200 if body["ready"] else 503)
+
+IMPORT_SECONDS = time.perf_counter() - _import_start
 
 if __name__ == "__main__":
-    uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
+    uvicorn.run("main:app", host="0.0.0.0", port=config.server.port, reload=True)
@@ -0,0 +1,130 @@
+"""Background writer batching interaction records into bulk inserts."""
+import asyncio
+import logging
+import time
+from typing import Any, Callable, List, Optional, Sequence, Tuple
+
+from ..concurrency import run_sync
+
+logger = logging.getLogger(__name__)
+
+INTERACTION_COLUMNS = (
+    "query", "response", "process_time", "cache_type", "timestamp", "prompt_version"
+)
+
+_STOP = object()
+
+
+class InteractionWriter:
+    """Buffers interaction records and writes them as multi-row inserts.
+
+    Records are flushed when ``batch_size`` are queued or
+    ``flush_interval_seconds`` pass, and on ``close()``. When the queue is
+    full, ``overflow_policy`` decides whether to drop the record or make
+    the caller wait.
+    """
+
+    def __init__(
+        self,
+        config,
+        execute: Callable[[str, Sequence[Any]], Any],
+        metrics=None,
+        table_name: str = "interactions"
+    ):
+        self.config = config
+        self.execute = execute
+        self.metrics = metrics
+        self.table_name = table_name
+        self.overflow_policy = config.overflow_policy.lower()
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        """Start the flush loop on the running event loop."""
+        if self._task is None:
+            self._queue = asyncio.Queue(maxsize=self.config.queue_size)
+            self._task = asyncio.create_task(self._run())
+
+    async def record(
+        self,
+        query: str,
+        response: Any,
+        process_time: float,
+        cache_type: str = "none",
+        prompt_version: Optional[str] = None
+    ) -> bool:
+        """Queue an interaction; returns False if it was dropped.
+
+        ``prompt_version`` is the chatbot's prompt version the answer was
+        produced under; cache warming only reuses answers logged with the
+        current one.
+        """
+        self.start()
+        item = (query, str(response), process_time, cache_type, time.time(), prompt_version)
+        if self.overflow_policy == "block":
+            await self._queue.put(item)
+        else:
+            try:
+                self._queue.put_nowait(item)
+            except asyncio.QueueFull:
+                if self.metrics:
+                    self.metrics.record_interaction_dropped()
+                return False
+        if self.metrics:
+            self.metrics.update_interaction_queue_depth(1)
+        return True
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            item = await self._queue.get()
+            if item is _STOP:
+                break
+            batch = [item]
+            deadline = loop.time() + self.config.flush_interval_seconds
+            while len(batch) < self.config.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            await self._flush(batch)
+
+    async def _flush(self, batch: List[Tuple]) -> None:
+        start_time = time.time()
+        try:
+            await run_sync(self._insert, batch)
+            logger.debug(f"Flushed {len(batch)} interactions")
+            if self.metrics:
+                self.metrics.record_interaction_flush(time.time() - start_time, len(batch))
+        except Exception as e:
+            logger.error(f"Error storing {len(batch)} interactions: {str(e)}")
+            if self.metrics:
+                self.metrics.record_error()
+                self.metrics.record_interaction_failed(len(batch))
+        finally:
+            if self.metrics:
+                self.metrics.update_interaction_queue_depth(-len(batch))
+
+    def _insert(self, batch: List[Tuple]) -> None:
+        row = "(" + ", ".join("?" for _ in INTERACTION_COLUMNS) + ")"
+        sql = (
+            f"INSERT INTO {self.table_name} ({', '.join(INTERACTION_COLUMNS)}) "
+            f"VALUES {', '.join(row for _ in batch)}"
+        )
+        self.execute(sql, [value for record in batch for value in record])
+
+    async def close(self) -> None:
+        """Flush everything queued and stop the flush loop."""
+        if self._task is None:
+            return
+        await self._queue.put(_STOP)
+        await self._task
+        self._task = None
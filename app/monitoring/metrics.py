@@ -1,8 +1,113 @@
 """Monitoring and metrics collection for the knowledge assistant."""
+import time
+from contextlib import contextmanager
+from typing import Iterator, Optional
 from opentelemetry import metrics, trace
-from opentelemetry.sdk.metrics import MeterProvider
+from opentelemetry.sdk.metrics import Histogram, MeterProvider
+from opentelemetry.sdk.metrics.view import ExplicitBucketHistogramAggregation, View
+from opentelemetry.sdk.trace import TracerProvider
 from opentelemetry.exporter.prometheus import PrometheusMetricReader
 
+_tracer = trace.get_tracer(__name__)
+_reader: Optional[PrometheusMetricReader] = None
+_tracer_provider: Optional[TracerProvider] = None
+
+# The SDK's default buckets (0..10000) suit milliseconds, not seconds
+SECONDS_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0
+)
+
+def setup_prometheus() -> PrometheusMetricReader:
+    """Export all meters to the Prometheus client registry (once per process)."""
+    global _reader
+    if _reader is None:
+        _reader = PrometheusMetricReader()
+        seconds_view = View(
+            instrument_type=Histogram,
+            instrument_name="*_seconds",
+            aggregation=ExplicitBucketHistogramAggregation(SECONDS_BUCKETS)
+        )
+        metrics.set_meter_provider(
+            MeterProvider(metric_readers=[_reader], views=[seconds_view])
+        )
+    return _reader
+
+def setup_tracing(endpoint: str, service_name: str = "rag-assistant-bootstrap") -> None:
+    """Export spans to Tempo over OTLP and instrument LangChain (once per process).
+
+    Keeps a tracer provider someone else already installed (the benchmark
+    records spans in memory); an empty endpoint leaves tracing off.
+    """
+    global _tracer_provider
+    if _tracer_provider is not None or not endpoint:
+        return
+    if isinstance(trace.get_tracer_provider(), TracerProvider):
+        return
+    # Exporter and instrumentor are only imported where traces are shipped
+    from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter
+    from opentelemetry.instrumentation.langchain import LangchainInstrumentor
+    from opentelemetry.sdk.resources import Resource
+    from opentelemetry.sdk.trace.export import BatchSpanProcessor
+    
+    provider = TracerProvider(resource=Resource.create({"service.name": service_name}))
+    provider.add_span_processor(
+        BatchSpanProcessor(OTLPSpanExporter(endpoint=endpoint, insecure=True))
+    )
+    trace.set_tracer_provider(provider)
+    LangchainInstrumentor().instrument()
+    _tracer_provider = provider
+
+def shutdown_tracing() -> None:
+    """Flush spans still buffered for export."""
+    if _tracer_provider is not None:
+        _tracer_provider.shutdown()
+
+class RequestSpanMiddleware:
+    """ASGI middleware opening a server span for each HTTP request.
+
+    Pipeline spans and profiles hang off it. Requests that already have a
+    span, from an ASGI instrumentation or FastAPI's own telemetry, pass
+    through unchanged.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http" or trace.get_current_span().get_span_context().is_valid:
+            await self.app(scope, receive, send)
+            return
+        with _tracer.start_as_current_span(
+            f"{scope['method']} {scope['path']}",
+            kind=trace.SpanKind.SERVER,
+            attributes={"http.method": scope["method"], "http.target": scope["path"]}
+        ) as span:
+            async def send_with_status(message) -> None:
+                if message["type"] == "http.response.start":
+                    span.set_attribute("http.status_code", message["status"])
+                    if message["status"] >= 500:
+                        span.set_status(trace.Status(trace.StatusCode.ERROR))
+                await send(message)
+
+            await self.app(scope, receive, send_with_status)
+
+@contextmanager
+def stage(name: str, metrics_manager=None, pipeline: str = "query") -> Iterator[trace.Span]:
+    """Run one pipeline stage in its own span and record its duration."""
+    start_time = time.perf_counter()
+    success = True
+    with _tracer.start_as_current_span(name, attributes={"pipeline": pipeline}) as span:
+        try:
+            yield span
+        except BaseException:
+            success = False
+            raise
+        finally:
+            if metrics_manager:
+                metrics_manager.record_stage(
+                    name, time.perf_counter() - start_time, pipeline, success
+                )
+
 class MetricsManager:
     def __init__(self):
         self.meter = metrics.get_meter(__name__)
@@ -24,8 +129,62 @@ class MetricsManager:
         
         self.token_usage = self.meter.create_counter(
             name="knowledge_assistant_token_usage_total",
-            description="Total number of tokens used",
-            attributes={"type": "total"}
+            description="Total number of tokens used"
+        )
+        
+        self.prompt_tokens = self.meter.create_histogram(
+            name="knowledge_assistant_prompt_tokens",
+            description="Prompt tokens per LLM request",
+        )
+        
+        # LLM backend pool metrics
+        self.llm_backend_latency = self.meter.create_histogram(
+            name="knowledge_assistant_llm_backend_latency_seconds",
+            description="LLM call latency per backend, including time queued for a slot",
+            unit="s",
+        )
+        
+        self.llm_backend_queued = self.meter.create_up_down_counter(
+            name="knowledge_assistant_llm_backend_queued",
+            description="LLM calls waiting for a backend slot"
+        )
+        
+        self.llm_backend_in_flight = self.meter.create_up_down_counter(
+            name="knowledge_assistant_llm_backend_in_flight",
+            description="LLM calls running on a backend"
+        )
+        
+        self.llm_backend_healthy = self.meter.create_up_down_counter(
+            name="knowledge_assistant_llm_backend_healthy",
+            description="1 while a backend is considered healthy"
+        )
+        
+        self.llm_hedges = self.meter.create_counter(
+            name="knowledge_assistant_llm_hedged_requests_total",
+            description="Hedged LLM calls by outcome"
+        )
+        
+        self.llm_failovers = self.meter.create_counter(
+            name="knowledge_assistant_llm_failovers_total",
+            description="LLM calls retried on another backend after an error"
+        )
+        
+        # Context packing metrics
+        self.context_tokens = self.meter.create_histogram(
+            name="knowledge_assistant_context_tokens",
+            description="Tokens of retrieved text per query before and after packing",
+        )
+        
+        self.context_chunks = self.meter.create_counter(
+            name="knowledge_assistant_context_chunks_total",
+            description="Retrieved chunks by packing outcome"
+        )
+        
+        # Pipeline stage metrics (embed, cache lookups, retrieval, generation, ...)
+        self.stage_duration = self.meter.create_histogram(
+            name="knowledge_assistant_stage_duration_seconds",
+            description="Duration of each query and ingestion pipeline stage",
+            unit="s",
         )
         
         # Vector store metrics
@@ -40,17 +199,104 @@ class MetricsManager:
             description="Total number of documents in vector store"
         )
         
+        self.request_embeddings = self.meter.create_histogram(
+            name="knowledge_assistant_embeddings_per_request",
+            description="Number of embeddings computed per request",
+        )
+        
+        # Connection pool metrics
+        self.pool_checkout_wait = self.meter.create_histogram(
+            name="knowledge_assistant_db_pool_checkout_wait_seconds",
+            description="Time spent waiting for a pooled CrateDB connection",
+            unit="s",
+        )
+        
+        self.pool_in_use = self.meter.create_up_down_counter(
+            name="knowledge_assistant_db_pool_connections_in_use",
+            description="CrateDB connections currently checked out of the pool"
+        )
+        
+        self.pool_timeouts = self.meter.create_counter(
+            name="knowledge_assistant_db_pool_timeouts_total",
+            description="Total number of pool checkouts that timed out"
+        )
+        
         # Cache metrics
         self.cache_hits = self.meter.create_counter(
             name="knowledge_assistant_cache_hits_total",
-            description="Total number of cache hits",
-            attributes={"type": "total"}
+            description="Total number of cache hits"
         )
         
         self.cache_misses = self.meter.create_counter(
             name="knowledge_assistant_cache_misses_total",
-            description="Total number of cache misses",
-            attributes={"type": "total"}
+            description="Total number of cache misses"
+        )
+        
+        self.cache_evictions = self.meter.create_counter(
+            name="knowledge_assistant_cache_evictions_total",
+            description="Total number of entries evicted from in-process caches"
+        )
+        
+        self.cache_warming_queries = self.meter.create_counter(
+            name="knowledge_assistant_cache_warming_queries_total",
+            description="Total number of queries handled by cache warming, by outcome"
+        )
+        
+        self.coalesced_requests = self.meter.create_counter(
+            name="knowledge_assistant_coalesced_requests_total",
+            description="Total number of queries served by another in-flight execution"
+        )
+        
+        # Admission control metrics
+        self.admission_queued = self.meter.create_up_down_counter(
+            name="knowledge_assistant_admission_queued",
+            description="Requests waiting for an admission lane slot"
+        )
+        
+        self.admission_in_flight = self.meter.create_up_down_counter(
+            name="knowledge_assistant_admission_in_flight",
+            description="Requests holding an admission lane slot"
+        )
+        
+        self.admission_wait_time = self.meter.create_histogram(
+            name="knowledge_assistant_admission_wait_seconds",
+            description="Time queued for an admission lane slot in seconds",
+            unit="s",
+        )
+        
+        self.admission_shed = self.meter.create_counter(
+            name="knowledge_assistant_admission_shed_total",
+            description="Total number of requests rejected by admission control"
+        )
+        
+        # Profiling metrics
+        self.profiles = self.meter.create_counter(
+            name="knowledge_assistant_profiles_total",
+            description="Total number of profiles taken or skipped because one was running"
+        )
+        
+        # Interaction log metrics
+        self.interaction_queue_depth = self.meter.create_up_down_counter(
+            name="knowledge_assistant_interaction_queue_depth",
+            description="Interaction records waiting to be written"
+        )
+        
+        self.interaction_flush_time = self.meter.create_histogram(
+            name="knowledge_assistant_interaction_flush_time_seconds",
+            description="Interaction log bulk insert time in seconds",
+            unit="s",
+        )
+        
+        self.interaction_records = self.meter.create_counter(
+            name="knowledge_assistant_interaction_records_total",
+            description="Total number of interaction records flushed, failed or dropped"
+        )
+        
+        # Startup metrics
+        self.component_init_time = self.meter.create_histogram(
+            name="knowledge_assistant_component_init_seconds",
+            description="Time to import the app or initialize a component",
+            unit="s",
         )
         
         # Error metrics
@@ -59,22 +305,136 @@ class MetricsManager:
             description="Total number of errors"
         )
     
-    def record_llm_request(self, duration: float, tokens: int):
+    def record_llm_request(self, duration: float, prompt_tokens: int = 0, completion_tokens: int = 0):
         """Record LLM request metrics."""
         self.llm_requests.add(1)
         self.llm_response_time.record(duration)
-        self.token_usage.add(tokens)
+        self.token_usage.add(prompt_tokens, {"kind": "prompt"})
+        self.token_usage.add(completion_tokens, {"kind": "completion"})
+        if prompt_tokens:
+            self.prompt_tokens.record(prompt_tokens)
+    
+    def record_llm_backend_request(self, backend: str, duration: float, outcome: str = "success"):
+        """Record one call to a pooled LLM backend."""
+        self.llm_backend_latency.record(duration, {"backend": backend, "outcome": outcome})
+    
+    def update_llm_backend_load(self, backend: str, queued: int = 0, in_flight: int = 0):
+        """Track calls queued for or running on a backend."""
+        if queued:
+            self.llm_backend_queued.add(queued, {"backend": backend})
+        if in_flight:
+            self.llm_backend_in_flight.add(in_flight, {"backend": backend})
+    
+    def update_llm_backend_healthy(self, backend: str, delta: int):
+        """Track a backend becoming healthy (+1) or unhealthy (-1)."""
+        self.llm_backend_healthy.add(delta, {"backend": backend})
+    
+    def update_admission_lane(self, lane: str, queued: int = 0, in_flight: int = 0):
+        """Track requests queued for or holding an admission lane slot."""
+        if queued:
+            self.admission_queued.add(queued, {"lane": lane})
+        if in_flight:
+            self.admission_in_flight.add(in_flight, {"lane": lane})
+    
+    def record_admission_wait(self, lane: str, duration: float):
+        """Record time spent queued for an admission lane."""
+        self.admission_wait_time.record(duration, {"lane": lane})
+    
+    def record_admission_shed(self, lane: str, reason: str):
+        """Record a request rejected because a lane is full or too slow."""
+        self.admission_shed.add(1, {"lane": lane, "reason": reason})
+    
+    def record_profile(self, kind: str, trigger: str, outcome: str):
+        """Record a profile that completed, failed or was skipped as busy."""
+        self.profiles.add(1, {"kind": kind, "trigger": trigger, "outcome": outcome})
+    
+    def record_llm_hedge(self, outcome: str):
+        """Record a hedge being started or which attempt won."""
+        self.llm_hedges.add(1, {"outcome": outcome})
+    
+    def record_llm_failover(self):
+        """Record an LLM call moving to another backend after an error."""
+        self.llm_failovers.add(1)
+    
+    def record_context_packing(self, packed):
+        """Record tokens and chunks kept or removed by context packing."""
+        self.context_tokens.record(packed.retrieved_tokens, {"kind": "retrieved"})
+        self.context_tokens.record(packed.packed_tokens, {"kind": "packed"})
+        for outcome, count in (
+            ("packed", len(packed.documents)),
+            ("duplicate", packed.duplicates),
+            ("over_budget", packed.over_budget),
+        ):
+            if count:
+                self.context_chunks.add(count, {"outcome": outcome})
+    
+    def record_stage(self, stage: str, duration: float, pipeline: str = "query", success: bool = True):
+        """Record the duration of a pipeline stage."""
+        self.stage_duration.record(
+            duration,
+            {"pipeline": pipeline, "stage": stage, "success": str(success).lower()}
+        )
     
     def record_vector_search(self, duration: float):
         """Record vector store search metrics."""
         self.vector_search_time.record(duration)
     
-    def record_cache_result(self, hit: bool):
-        """Record cache hit/miss."""
+    def record_pool_checkout(self, wait: float, timed_out: bool = False):
+        """Record time spent waiting for a pooled connection."""
+        self.pool_checkout_wait.record(wait)
+        if timed_out:
+            self.pool_timeouts.add(1)
+    
+    def update_pool_in_use(self, delta: int):
+        """Track connections checked out of or returned to the pool."""
+        self.pool_in_use.add(delta)
+    
+    def record_request_embeddings(self, count: int):
+        """Record how many embeddings a request needed."""
+        self.request_embeddings.record(count)
+    
+    def record_cache_result(self, hit: bool, cache: str = "total", tier: str = "crate"):
+        """Record cache hit/miss for a cache and tier."""
+        attributes = {"cache": cache, "tier": tier}
         if hit:
-            self.cache_hits.add(1)
+            self.cache_hits.add(1, attributes)
         else:
-            self.cache_misses.add(1)
+            self.cache_misses.add(1, attributes)
+    
+    def record_cache_eviction(self, count: int = 1, cache: str = "total", tier: str = "l1"):
+        """Record entries evicted from a cache tier."""
+        self.cache_evictions.add(count, {"cache": cache, "tier": tier})
+    
+    def record_cache_warming(self, outcome: str, count: int = 1):
+        """Record queries handled by a cache warming run."""
+        self.cache_warming_queries.add(count, {"outcome": outcome})
+    
+    def record_coalesced_request(self, kind: str = "exact"):
+        """Record a query that joined an in-flight execution."""
+        self.coalesced_requests.add(1, {"kind": kind})
+    
+    def update_interaction_queue_depth(self, delta: int):
+        """Track records entering or leaving the interaction queue."""
+        self.interaction_queue_depth.add(delta)
+    
+    def record_interaction_flush(self, duration: float, rows: int):
+        """Record an interaction log bulk insert."""
+        self.interaction_flush_time.record(duration)
+        self.interaction_records.add(rows, {"outcome": "flushed"})
+    
+    def record_interaction_failed(self, rows: int):
+        """Record interactions lost because their bulk insert failed."""
+        self.interaction_records.add(rows, {"outcome": "failed"})
+    
+    def record_interaction_dropped(self):
+        """Record an interaction dropped because the queue was full."""
+        self.interaction_records.add(1, {"outcome": "dropped"})
+    
+    def record_component_init(self, component: str, duration: float, success: bool = True):
+        """Record import or component initialization time."""
+        self.component_init_time.record(
+            duration, {"component": component, "success": str(success).lower()}
+        )
     
     def record_error(self):
         """Record an error occurrence."""
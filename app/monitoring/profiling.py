@@ -0,0 +1,420 @@
+"""On-demand and sampled cProfile/tracemalloc profiles of requests and ingestion jobs."""
+import asyncio
+import contextvars
+import cProfile
+import functools
+import logging
+import os
+import pstats
+import random
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import OrderedDict
+from contextlib import asynccontextmanager, contextmanager
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Callable, Coroutine, Dict, Iterator, List, Optional
+
+from opentelemetry import trace
+
+logger = logging.getLogger(__name__)
+
+KINDS = ("query", "ingest")
+PROFILE_HEADER = "x-profile"
+PROFILE_ID_HEADER = "x-profile-id"
+# Allocations made by the import system and tracemalloc itself are not reported
+MEMORY_FILTERS = (
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, tracemalloc.__file__),
+)
+
+_session: contextvars.ContextVar[Optional["ProfileSession"]] = contextvars.ContextVar(
+    "profile_session", default=None
+)
+
+
+def requested(value: Optional[str]) -> bool:
+    """Whether an X-Profile header value asks for a profile."""
+    return value is not None and value.strip().lower() in ("1", "true", "yes")
+
+
+class ProfileSession:
+    """cProfile profilers of the loop steps and worker calls made for one profile."""
+
+    def __init__(self):
+        self.loop_profiler = cProfile.Profile()
+        self.profilers: List[cProfile.Profile] = []
+        # Set when the profile ends; tasks it started may still be running
+        self.closed = False
+        self._depth = 0
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def step(self) -> Iterator[None]:
+        """Profile one step of a tracked coroutine on the event loop thread."""
+        if self.closed:
+            yield
+            return
+        self._depth += 1
+        if self._depth == 1:
+            self.loop_profiler.enable()
+        try:
+            yield
+        finally:
+            self._depth -= 1
+            if self._depth == 0:
+                self.loop_profiler.disable()
+
+    def wrap(self, func: Callable[..., Any]) -> Callable[..., Any]:
+        @functools.wraps(func)
+        def call(*args, **kwargs):
+            profiler = cProfile.Profile()
+            profiler.enable()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                profiler.disable()
+                with self._lock:
+                    self.profilers.append(profiler)
+        return call
+
+
+def profiled(func: Callable[..., Any]) -> Callable[..., Any]:
+    """``func``, profiled in its worker thread if the caller is being profiled."""
+    session = _session.get()
+    return func if session is None else session.wrap(func)
+
+
+class _Tracked:
+    """Awaitable driving ``coro`` with the session's loop profiler on during its steps.
+
+    Other tasks interleaved on the loop between those steps are not profiled.
+    """
+
+    def __init__(self, coro: Coroutine, session: ProfileSession):
+        self.coro = coro
+        self.session = session
+
+    def __await__(self):
+        value, error = None, None
+        while True:
+            try:
+                with self.session.step():
+                    if error is None:
+                        future = self.coro.send(value)
+                    else:
+                        future = self.coro.throw(error)
+            except StopIteration as stop:
+                return stop.value
+            try:
+                value, error = (yield future), None
+            except GeneratorExit:
+                self.coro.close()
+                raise
+            except BaseException as e:
+                value, error = None, e
+
+
+async def track(coro: Coroutine) -> Any:
+    """Await ``coro``, profiling its steps if the caller is being profiled."""
+    session = _session.get()
+    if session is None:
+        return await coro
+    return await _Tracked(coro, session)
+
+
+def install_task_factory(loop: Optional[asyncio.AbstractEventLoop] = None) -> None:
+    """Track tasks created by profiled code, e.g. coalesced flights and streams."""
+    loop = loop or asyncio.get_running_loop()
+    previous = loop.get_task_factory()
+
+    def factory(loop, coro, **kwargs):
+        context = kwargs.get("context")
+        session = context.get(_session) if context is not None else _session.get()
+        if session is not None:
+            coro = track(coro)
+        if previous is not None:
+            return previous(loop, coro, **kwargs)
+        return asyncio.Task(coro, loop=loop, **kwargs)
+
+    loop.set_task_factory(factory)
+
+
+def top_functions(stats: pstats.Stats, by: str, limit: int) -> List[Dict[str, Any]]:
+    """The ``limit`` functions with the most cumulative or own time."""
+    index = 3 if by == "cumulative" else 2
+    rows = sorted(stats.stats.items(), key=lambda item: item[1][index], reverse=True)
+    return [
+        {
+            "function": pstats.func_std_string(func),
+            "calls": calls,
+            "primitive_calls": primitive_calls,
+            "own_seconds": round(own, 6),
+            "cumulative_seconds": round(cumulative, 6),
+        }
+        for func, (primitive_calls, calls, own, cumulative, _) in rows[:limit]
+    ]
+
+
+@dataclass
+class Profile:
+    """Report of one profiled request or ingestion job."""
+    kind: str
+    name: str
+    # "header", "armed" (POST /profiles) or "sampled"
+    trigger: str
+    id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    status: str = "running"
+    # The request's span, tagged with the profile ID; pipeline spans descend from it
+    trace_id: Optional[str] = None
+    span_id: Optional[str] = None
+    started_at: float = field(default_factory=time.time)
+    duration: float = 0.0
+    worker_calls: int = 0
+    path: Optional[str] = None
+    memory_path: Optional[str] = None
+    cumulative: List[Dict[str, Any]] = field(default_factory=list)
+    own: List[Dict[str, Any]] = field(default_factory=list)
+    # Net allocations by line over the profile, largest growth first
+    allocations: List[Dict[str, Any]] = field(default_factory=list)
+    peak_memory_bytes: Optional[int] = None
+    error: Optional[str] = None
+
+    def to_dict(self, details: bool = False) -> Dict[str, Any]:
+        body = {
+            "profile_id": self.id,
+            "kind": self.kind,
+            "name": self.name,
+            "trigger": self.trigger,
+            "status": self.status,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "started_at": self.started_at,
+            "duration_seconds": round(self.duration, 3),
+            "worker_calls": self.worker_calls,
+            "path": self.path,
+            "memory_path": self.memory_path,
+            "peak_memory_bytes": self.peak_memory_bytes,
+            "error": self.error,
+        }
+        if details:
+            body["cumulative"] = self.cumulative
+            body["own"] = self.own
+            body["allocations"] = self.allocations
+        return body
+
+
+class Profiler:
+    """Profiles requests and ingestion jobs that opt in or are sampled.
+
+    A profile covers the steps the request's or job's own tasks run on the
+    event loop, not other requests interleaved with them, and every
+    ``run_sync`` call they make in the worker threads. Work done in
+    ingestion's splitting processes is not seen. One profile runs at a time,
+    which bounds the overhead and keeps tracemalloc snapshots to one job;
+    requests that would start another are served unprofiled. The request's
+    span is tagged with the profile ID and the profile records its trace ID.
+    """
+
+    def __init__(self, config, metrics=None):
+        self.config = config
+        self.metrics = metrics
+        self._profiles: "OrderedDict[str, Profile]" = OrderedDict()
+        self._armed: Dict[str, int] = {kind: 0 for kind in KINDS}
+        self._busy = False
+
+    @property
+    def armed(self) -> Dict[str, int]:
+        return dict(self._armed)
+
+    def arm(self, kind: str, count: int = 1) -> Dict[str, int]:
+        """Profile the next ``count`` requests or jobs of ``kind``."""
+        if kind not in KINDS:
+            raise ValueError(f"Unknown profile kind {kind!r}, use one of {KINDS}")
+        self._armed[kind] = max(count, 0)
+        return self.armed
+
+    def trigger(self, kind: str, header: bool = False) -> Optional[str]:
+        """Why a request or job of ``kind`` should be profiled, or None."""
+        if header and self.config.enabled:
+            return "header"
+        if self._armed[kind] > 0:
+            return "armed"
+        if self.config.sample_rate > 0 and random.random() < self.config.sample_rate:
+            return "sampled"
+        return None
+
+    @asynccontextmanager
+    async def session(self, kind: str, name: str, trigger: Optional[str],
+                      trace_memory: bool = False) -> AsyncIterator[Optional[Profile]]:
+        """Profile the body if ``trigger`` is set and no profile is running.
+
+        Only coroutines awaited with ``track`` in the body, the tasks they
+        start and their ``run_sync`` calls are profiled.
+        """
+        if trigger is None:
+            yield None
+            return
+        if self._busy:
+            self._record(kind, trigger, "busy")
+            yield None
+            return
+        self._busy = True
+        if trigger == "armed":
+            self._armed[kind] = max(self._armed[kind] - 1, 0)
+        profile = Profile(kind=kind, name=name, trigger=trigger)
+        self._store(profile)
+        baseline = self._start_tracemalloc() if trace_memory else None
+        session = ProfileSession()
+        token = _session.set(session)
+        start_time = time.perf_counter()
+        span = trace.get_current_span()
+        context = span.get_span_context()
+        if context.is_valid:
+            profile.trace_id = format(context.trace_id, "032x")
+            profile.span_id = format(context.span_id, "016x")
+        # An ingestion job's request span may already have ended
+        if span.is_recording():
+            span.set_attributes({
+                "profile.id": profile.id, "profile.kind": kind, "profile.trigger": trigger
+            })
+        try:
+            yield profile
+        finally:
+            profile.duration = time.perf_counter() - start_time
+            session.closed = True
+            _session.reset(token)
+            try:
+                # The shared executor is the loop default, see install_executor
+                await asyncio.get_running_loop().run_in_executor(
+                    None, self._finish, profile, [session.loop_profiler, *session.profilers],
+                    trace_memory, baseline
+                )
+            finally:
+                self._busy = False
+            self._record(kind, trigger, profile.status)
+
+    def _start_tracemalloc(self) -> Optional[tracemalloc.Snapshot]:
+        """Start tracing, or snapshot the allocations of a trace already running."""
+        if tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+            return tracemalloc.take_snapshot().filter_traces(MEMORY_FILTERS)
+        tracemalloc.start(self.config.tracemalloc_frames)
+        return None
+
+    def _finish(self, profile: Profile, profilers: List[cProfile.Profile], trace_memory: bool,
+                baseline: Optional[tracemalloc.Snapshot]) -> None:
+        """Summarize the profilers and allocations and write the profile files."""
+        try:
+            if trace_memory:
+                snapshot = tracemalloc.take_snapshot().filter_traces(MEMORY_FILTERS)
+                profile.peak_memory_bytes = tracemalloc.get_traced_memory()[1]
+                if baseline is None:
+                    tracemalloc.stop()
+                    stats = snapshot.statistics("lineno")
+                else:
+                    stats = snapshot.compare_to(baseline, "lineno")
+                profile.allocations = [
+                    {
+                        "location": str(stat.traceback[0]),
+                        "size_bytes": stat.size,
+                        "size_diff_bytes": getattr(stat, "size_diff", stat.size),
+                        "count": stat.count,
+                    }
+                    for stat in stats[:self.config.top_functions]
+                ]
+            stats = pstats.Stats(profilers[0])
+            for profiler in profilers[1:]:
+                stats.add(profiler)
+            profile.worker_calls = len(profilers) - 1
+            profile.cumulative = top_functions(stats, "cumulative", self.config.top_functions)
+            profile.own = top_functions(stats, "own", self.config.top_functions)
+            if self.config.output_dir:
+                os.makedirs(self.config.output_dir, exist_ok=True)
+                started = time.strftime("%Y%m%dT%H%M%S", time.gmtime(profile.started_at))
+                base = os.path.join(
+                    self.config.output_dir, f"{profile.kind}-{started}-{profile.id}"
+                )
+                stats.dump_stats(base + ".prof")
+                profile.path = base + ".prof"
+                if trace_memory:
+                    snapshot.dump(base + ".tracemalloc")
+                    profile.memory_path = base + ".tracemalloc"
+            profile.status = "completed"
+            logger.info(
+                f"Profile {profile.id} of {profile.kind} {profile.name} took "
+                f"{profile.duration:.3f}s, trace {profile.trace_id}, written to {profile.path}"
+            )
+        except Exception as e:
+            profile.status = "failed"
+            profile.error = str(e)
+            logger.error(f"Profile {profile.id} failed: {e}")
+            if trace_memory and baseline is None and tracemalloc.is_tracing():
+                tracemalloc.stop()
+
+    def _store(self, profile: Profile) -> None:
+        self._profiles[profile.id] = profile
+        while len(self._profiles) > max(self.config.max_profiles, 1):
+            _, old = self._profiles.popitem(last=False)
+            for path in (old.path, old.memory_path):
+                if path:
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+
+    def _record(self, kind: str, trigger: str, outcome: str) -> None:
+        if self.metrics:
+            self.metrics.record_profile(kind, trigger, outcome)
+
+    def get(self, profile_id: str) -> Optional[Profile]:
+        """Look up a profile by ID."""
+        return self._profiles.get(profile_id)
+
+    def profiles(self) -> List[Profile]:
+        """Kept profiles, newest first."""
+        return list(reversed(self._profiles.values()))
+
+
+class ProfilingMiddleware:
+    """ASGI middleware profiling requests to ``paths`` (path to profile kind).
+
+    Request parsing and response serialization are included. Profiled
+    responses carry the ``X-Profile-Id`` header.
+    """
+
+    def __init__(self, app, profiler: Profiler, paths: Dict[str, str]):
+        self.app = app
+        self.profiler = profiler
+        self.paths = paths
+
+    async def __call__(self, scope, receive, send) -> None:
+        kind = self.paths.get(scope["path"]) if scope["type"] == "http" else None
+        if kind is None:
+            await self.app(scope, receive, send)
+            return
+        header = next(
+            (value.decode("latin-1") for name, value in scope["headers"]
+             if name == PROFILE_HEADER.encode()),
+            None
+        )
+        trigger = self.profiler.trigger(kind, requested(header))
+        async with self.profiler.session(kind, scope["path"], trigger) as profile:
+            if profile is None:
+                await self.app(scope, receive, send)
+                return
+
+            async def send_with_id(message) -> None:
+                if message["type"] == "http.response.start":
+                    message = {
+                        **message,
+                        "headers": [
+                            *message.get("headers", []),
+                            (PROFILE_ID_HEADER.encode(), profile.id.encode())
+                        ],
+                    }
+                await send(message)
+
+            await track(self.app(scope, receive, send_with_id))
@@ -0,0 +1,138 @@
+"""Shared, pooled resources used by every component."""
+import logging
+import threading
+import time
+from typing import Any, List, Optional, Sequence
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool
+
+from .data.corpus import CorpusVersion
+from .embeddings.batching import BatchingEmbeddings
+
+logger = logging.getLogger(__name__)
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that reports how long each checkout waited for a connection."""
+
+    checkout_observer = None
+
+    def _do_get(self):
+        start_time = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except PoolTimeoutError:
+            if self.checkout_observer:
+                self.checkout_observer(time.perf_counter() - start_time, timed_out=True)
+            raise
+        if self.checkout_observer:
+            self.checkout_observer(time.perf_counter() - start_time, timed_out=False)
+        return connection
+
+
+class ResourceRegistry:
+    """Creates one SQLAlchemy engine and one embeddings client per process.
+
+    The vector store, both LLM caches and the interaction log share the
+    engine's connection pool, so CrateDB connection usage is bounded by
+    ``pool_size + max_overflow`` and visible in metrics.
+    """
+
+    def __init__(self, config, metrics=None):
+        self.config = config
+        self.metrics = metrics
+        self._engine: Optional[Engine] = None
+        self._embeddings: Optional[BatchingEmbeddings] = None
+        self._corpus: Optional[CorpusVersion] = None
+        # Components may be built in parallel threads at startup
+        self._lock = threading.Lock()
+
+    @property
+    def engine(self) -> Engine:
+        if self._engine is None:
+            with self._lock:
+                if self._engine is None:
+                    self._engine = self._create_engine()
+        return self._engine
+
+    @property
+    def embeddings(self) -> BatchingEmbeddings:
+        if self._embeddings is None:
+            with self._lock:
+                if self._embeddings is None:
+                    self._embeddings = BatchingEmbeddings(self.config.embeddings)
+        return self._embeddings
+
+    @embeddings.setter
+    def embeddings(self, embeddings: BatchingEmbeddings) -> None:
+        """Use a prebuilt client, e.g. a local stand-in for benchmarks."""
+        self._embeddings = embeddings
+
+    @property
+    def corpus(self) -> CorpusVersion:
+        """Version counter bumped by ingestion and checked by the caches."""
+        if self._corpus is None:
+            with self._lock:
+                if self._corpus is None:
+                    self._corpus = CorpusVersion(self.execute, self.fetch_all)
+        return self._corpus
+
+    def execute(self, sql: str, params: Sequence[Any] = ()) -> None:
+        """Run a statement on a pooled connection in its own transaction."""
+        with self.engine.begin() as connection:
+            connection.exec_driver_sql(sql, tuple(params))
+
+    def fetch_all(self, sql: str, params: Sequence[Any] = ()) -> List[tuple]:
+        """Run a query on a pooled connection and return every row."""
+        with self.engine.connect() as connection:
+            return [tuple(row) for row in connection.exec_driver_sql(sql, tuple(params))]
+
+    def check_database(self) -> None:
+        """Verify CrateDB is reachable."""
+        self.execute("SELECT 1")
+
+    def check_embeddings(self) -> None:
+        """Verify the embeddings endpoint answers."""
+        self.embeddings.embed_query("warmup")
+
+    def _create_engine(self) -> Engine:
+        vector_store = self.config.vector_store
+        engine = create_engine(
+            vector_store.connection_string,
+            poolclass=TimedQueuePool,
+            pool_size=vector_store.pool_size,
+            max_overflow=vector_store.max_overflow,
+            pool_timeout=vector_store.pool_timeout,
+            pool_recycle=vector_store.pool_recycle,
+            pool_pre_ping=True
+        )
+        if self.metrics:
+            engine.pool.checkout_observer = self._record_checkout
+            event.listen(engine, "checkout", self._on_checkout)
+            event.listen(engine, "checkin", self._on_checkin)
+        logger.info(
+            f"Created CrateDB engine with pool_size={vector_store.pool_size}, "
+            f"max_overflow={vector_store.max_overflow}"
+        )
+        return engine
+
+    def _record_checkout(self, wait: float, timed_out: bool) -> None:
+        self.metrics.record_pool_checkout(wait, timed_out)
+
+    def _on_checkout(self, dbapi_connection, connection_record, connection_proxy) -> None:
+        self.metrics.update_pool_in_use(1)
+
+    def _on_checkin(self, dbapi_connection, connection_record) -> None:
+        self.metrics.update_pool_in_use(-1)
+
+    def close(self) -> None:
+        """Release pooled connections and stop the embeddings client."""
+        if self._embeddings is not None:
+            self._embeddings.close()
+            self._embeddings = None
+        if self._engine is not None:
+            self._engine.dispose()
+            self._engine = None
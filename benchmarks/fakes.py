@@ -0,0 +1,250 @@
+"""Deterministic local stand-ins for the LLM, embeddings endpoint, vector store and caches."""
+import asyncio
+import hashlib
+import re
+import threading
+import time
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from langchain.llms.base import LLM
+from langchain.schema import Document
+from langchain.schema.output import GenerationChunk
+from langchain.schema.vectorstore import VectorStore
+
+from app.embeddings.batching import BatchingEmbeddings
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+
+def _stable_hash(text: str) -> int:
+    return int.from_bytes(hashlib.md5(text.encode()).digest()[:8], "little")
+
+
+def hashed_embedding(text: str, dim: int) -> List[float]:
+    """Bag-of-words vector with hashed features.
+
+    Texts sharing most of their words get a high cosine similarity, so
+    paraphrased queries behave like near-duplicates.
+    """
+    vector = np.zeros(dim, dtype=np.float32)
+    for token in _TOKEN.findall(text.lower()):
+        h = _stable_hash(token)
+        vector[h % dim] += 1.0 if (h >> 32) & 1 else -1.0
+    norm = np.linalg.norm(vector)
+    if norm:
+        vector /= norm
+    return vector.tolist()
+
+
+class FakeEmbeddingServer(BatchingEmbeddings):
+    """BatchingEmbeddings whose HTTP call is replaced by a local model.
+
+    Everything but the network round-trip (queueing, batching,
+    concurrency limits) is the real client. Each batch costs
+    ``batch_latency + per_text_latency * len(batch)`` seconds.
+    """
+
+    def __init__(self, config, dim: int = 384, batch_latency: float = 0.01,
+                 per_text_latency: float = 0.0005):
+        super().__init__(config)
+        self.dim = dim
+        self.batch_latency = batch_latency
+        self.per_text_latency = per_text_latency
+        self.requests = 0
+        self.texts = 0
+
+    def _post(self, texts: List[str]) -> List[List[float]]:
+        self.requests += 1
+        self.texts += len(texts)
+        time.sleep(self.batch_latency + self.per_text_latency * len(texts))
+        return [hashed_embedding(text, self.dim) for text in texts]
+
+
+class FakeLLM(LLM):
+    """LLM with a configurable time-to-first-token and token rate.
+
+    A ``straggler_rate`` share of calls (chosen deterministically per
+    ``seed``) waits an extra ``straggler_latency`` before the first token.
+    """
+
+    first_token_latency: float = 0.2
+    tokens_per_second: float = 50.0
+    answer_tokens: int = 40
+    straggler_rate: float = 0.0
+    straggler_latency: float = 2.0
+    seed: int = 0
+    calls: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake"
+
+    def _tokens(self, prompt: str) -> List[str]:
+        seed = _stable_hash(prompt)
+        return [f"tok{(seed >> (i % 48)) % 997}" for i in range(self.answer_tokens)]
+
+    def _first_token_latency(self) -> float:
+        self.calls += 1
+        if _stable_hash(f"{self.seed}:{self.calls}") % 10000 < self.straggler_rate * 10000:
+            return self.first_token_latency + self.straggler_latency
+        return self.first_token_latency
+
+    def _duration(self) -> float:
+        return self._first_token_latency() + self.answer_tokens / self.tokens_per_second
+
+    def _call(self, prompt: str, stop: Optional[List[str]] = None,
+              run_manager=None, **kwargs: Any) -> str:
+        time.sleep(self._duration())
+        return " ".join(self._tokens(prompt))
+
+    async def _acall(self, prompt: str, stop: Optional[List[str]] = None,
+                     run_manager=None, **kwargs: Any) -> str:
+        await asyncio.sleep(self._duration())
+        return " ".join(self._tokens(prompt))
+
+    async def _astream(self, prompt: str, stop: Optional[List[str]] = None,
+                       run_manager=None, **kwargs: Any) -> AsyncIterator[GenerationChunk]:
+        await asyncio.sleep(self._first_token_latency())
+        for token in self._tokens(prompt):
+            yield GenerationChunk(text=token + " ")
+            await asyncio.sleep(1.0 / self.tokens_per_second)
+
+
+class FakeVectorStore(VectorStore):
+    """Exact in-memory vector search with a fixed per-query latency."""
+
+    def __init__(self, embedding, latency: float = 0.005):
+        self._embedding = embedding
+        self.latency = latency
+        self._ids: List[str] = []
+        self._texts: List[str] = []
+        self._metadatas: List[dict] = []
+        self._vectors = np.zeros((0, 0), dtype=np.float32)
+        self._lock = threading.Lock()
+        self.searches = 0
+
+    @property
+    def embeddings(self):
+        return self._embedding
+
+    def add_texts(self, texts: Iterable[str], metadatas: Optional[List[dict]] = None,
+                  **kwargs: Any) -> List[str]:
+        texts = list(texts)
+        return self.add_embeddings(texts, self._embedding.embed_documents(texts), metadatas)
+
+    def add_embeddings(self, texts: List[str], embeddings: List[List[float]],
+                       metadatas: Optional[List[dict]] = None,
+                       ids: Optional[List[str]] = None, **kwargs: Any) -> List[str]:
+        time.sleep(self.latency)
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        with self._lock:
+            start = len(self._texts)
+            ids = ids or [str(i) for i in range(start, start + len(texts))]
+            # Like the primary key of the CrateDB table
+            duplicates = set(ids) & set(self._ids)
+            if duplicates or len(set(ids)) < len(ids):
+                raise ValueError(f"Duplicate document ids: {sorted(duplicates)}")
+            self._ids.extend(ids)
+            self._texts.extend(texts)
+            self._metadatas.extend(metadatas or [{} for _ in texts])
+            self._vectors = vectors if start == 0 else np.vstack([self._vectors, vectors])
+        return ids
+
+    def delete(self, ids: Optional[List[str]] = None, **kwargs: Any) -> Optional[bool]:
+        time.sleep(self.latency)
+        drop = set(ids or ())
+        with self._lock:
+            keep = [i for i, id_ in enumerate(self._ids) if id_ not in drop]
+            self._ids = [self._ids[i] for i in keep]
+            self._texts = [self._texts[i] for i in keep]
+            self._metadatas = [self._metadatas[i] for i in keep]
+            self._vectors = self._vectors[keep] if keep else np.zeros((0, 0), dtype=np.float32)
+        return True
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: Any) -> List[Document]:
+        return self.similarity_search_by_vector(self._embedding.embed_query(query), k)
+
+    def similarity_search_with_score_by_vector(self, embedding: List[float], k: int = 4,
+                                               **kwargs: Any) -> List[Tuple[Document, float]]:
+        time.sleep(self.latency)
+        with self._lock:
+            self.searches += 1
+            if not self._texts:
+                return []
+            scores = self._vectors @ np.asarray(embedding, dtype=np.float32)
+            top = np.argsort(-scores)[:k]
+            return [
+                (Document(page_content=self._texts[i], metadata=self._metadatas[i]),
+                 float(scores[i]))
+                for i in top
+            ]
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4,
+                                    **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score_by_vector(embedding, k)]
+
+    def __len__(self) -> int:
+        return len(self._texts)
+
+    @classmethod
+    def from_texts(cls, texts: List[str], embedding, metadatas=None, **kwargs: Any):
+        store = cls(embedding)
+        store.add_texts(texts, metadatas)
+        return store
+
+
+class FakeCache:
+    """Exact-match stand-in for CrateDBCache."""
+
+    def __init__(self, latency: float = 0.002):
+        self.latency = latency
+        self._entries = {}
+
+    def lookup(self, prompt: str, *args) -> Optional[Any]:
+        time.sleep(self.latency)
+        return self._entries.get((prompt,) + args)
+
+    def update(self, prompt: str, *args, **kwargs) -> None:
+        time.sleep(self.latency)
+        self._entries[(prompt,) + args[:-1]] = args[-1]
+
+    def clear(self, **kwargs) -> None:
+        self._entries.clear()
+
+
+class FakeSemanticCache:
+    """Brute-force cosine stand-in for CrateDBSemanticCache."""
+
+    def __init__(self, embedding, score_threshold: float, latency: float = 0.004):
+        self.embedding = embedding
+        self.score_threshold = score_threshold
+        self.latency = latency
+        # Vectors and values per extra-argument scope (e.g. the prompt version)
+        self._vectors: Dict[Tuple, List[np.ndarray]] = {}
+        self._values: Dict[Tuple, List[Any]] = {}
+        self._lock = threading.Lock()
+
+    def lookup(self, prompt: str, *args) -> Optional[Any]:
+        vector = np.asarray(self.embedding.embed_query(prompt), dtype=np.float32)
+        time.sleep(self.latency)
+        with self._lock:
+            vectors = self._vectors.get(args)
+            if not vectors:
+                return None
+            scores = np.stack(vectors) @ vector
+            values = self._values[args]
+        best = int(np.argmax(scores))
+        return values[best] if scores[best] >= self.score_threshold else None
+
+    def update(self, prompt: str, *args, **kwargs) -> None:
+        vector = np.asarray(self.embedding.embed_query(prompt), dtype=np.float32)
+        time.sleep(self.latency)
+        with self._lock:
+            self._vectors.setdefault(args[:-1], []).append(vector)
+            self._values.setdefault(args[:-1], []).append(args[-1])
+
+    def clear(self, **kwargs) -> None:
+        with self._lock:
+            self._vectors.clear()
+            self._values.clear()
@@ -0,0 +1,662 @@
+"""Offline throughput/latency benchmark for the FastAPI app.
+
+Drives ``/query``, ``/ingest`` and ``/ingest/directory`` in-process against
+local stand-ins (see ``benchmarks/fakes.py``) and prints a JSON report:
+
+    python -m benchmarks.run --concurrency 32 --requests 500 --output bench.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+from dataclasses import asdict
+from types import SimpleNamespace
+from typing import Any, Dict, List
+
+import httpx
+import numpy as np
+from opentelemetry import trace
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+
+from app.config import config
+from app.data.ann_index import ANNIndex, normalize
+from app.llms.pool import LLMBackend, LLMPool
+from benchmarks.fakes import (
+    FakeCache,
+    FakeEmbeddingServer,
+    FakeLLM,
+    FakeSemanticCache,
+    FakeVectorStore,
+)
+
+TOPICS = [
+    "vector search", "semantic caching", "kubernetes deployment", "ollama models",
+    "cratedb tables", "prometheus metrics", "loki logging", "tempo tracing",
+    "document ingestion", "prompt templates", "embedding batching", "helm charts",
+]
+
+QUESTION_TEMPLATES = [
+    "how do I configure {topic} for production",
+    "what is the recommended setup for {topic}",
+    "why is {topic} slow under load",
+    "explain how {topic} works in this assistant",
+]
+
+PARAPHRASES = [
+    "{q}", "{q}?", "please {q}", "{q} please", "can you tell me {q}", "{q} in detail",
+]
+
+MIXES = ("repeat-heavy", "semantic-near-duplicate", "all-unique")
+
+
+def make_queries(mix: str, count: int, rng: random.Random) -> List[str]:
+    """Generate a deterministic query stream for a mix."""
+    base = [t.format(topic=topic) for topic in TOPICS for t in QUESTION_TEMPLATES]
+    if mix == "repeat-heavy":
+        # Zipf-like popularity over a small set of hot questions
+        hot = base[:20]
+        weights = [1.0 / (rank + 1) for rank in range(len(hot))]
+        return rng.choices(hot, weights=weights, k=count)
+    if mix == "semantic-near-duplicate":
+        return [
+            rng.choice(PARAPHRASES).format(q=rng.choice(base[:20]))
+            for _ in range(count)
+        ]
+    if mix == "all-unique":
+        return [f"{rng.choice(base)} case {i}" for i in range(count)]
+    raise ValueError(f"Unknown mix: {mix}")
+
+
+def make_corpus(count: int, rng: random.Random) -> List[str]:
+    """Generate documents mentioning the benchmark topics."""
+    return [
+        " ".join(
+            f"{rng.choice(TOPICS)} paragraph {i} sentence {j} about configuration and performance."
+            for j in range(12)
+        )
+        for i in range(count)
+    ]
+
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {}
+    ms = np.asarray(values) * 1000.0
+    return {
+        "p50": round(float(np.percentile(ms, 50)), 3),
+        "p95": round(float(np.percentile(ms, 95)), 3),
+        "p99": round(float(np.percentile(ms, 99)), 3),
+        "mean": round(float(ms.mean()), 3),
+        "max": round(float(ms.max()), 3),
+    }
+
+
+def stage_times(exporter: InMemorySpanExporter) -> Dict[str, Dict[str, float]]:
+    """Aggregate span durations by span name."""
+    durations = defaultdict(list)
+    for span in exporter.get_finished_spans():
+        durations[span.name].append((span.end_time - span.start_time) / 1e9)
+    exporter.clear()
+    return {
+        name: dict(count=len(values), **percentiles(values))
+        for name, values in sorted(durations.items())
+    }
+
+
+class Harness:
+    """Wires the app's startup stages to local stand-ins."""
+
+    def __init__(self, args, workdir: str):
+        self.args = args
+        self.workdir = workdir
+
+        # Interaction log and pool run against a throwaway SQLite file
+        config.vector_store.connection_string = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+        config.retriever.type = args.retriever
+        config.retriever.ann_index_path = os.path.join(workdir, "ann_index")
+        config.retriever.ann_build_on_start = False
+
+        from app import main
+        self.main = main
+
+        embeddings = FakeEmbeddingServer(
+            config.embeddings,
+            batch_latency=args.embed_latency_ms / 1000.0,
+        )
+        main.resources.embeddings = embeddings
+        self.embeddings = embeddings
+        self.vector_store = FakeVectorStore(embeddings, latency=args.store_latency_ms / 1000.0)
+        self.llms = [
+            FakeLLM(
+                first_token_latency=args.llm_latency_ms / 1000.0,
+                tokens_per_second=args.llm_tokens_per_second,
+                answer_tokens=args.answer_tokens,
+                straggler_rate=args.llm_straggler_rate,
+                straggler_latency=args.llm_straggler_ms / 1000.0,
+                seed=seed,
+            )
+            for seed in range(args.llm_backends)
+        ]
+        self.llm = LLMPool(
+            [
+                LLMBackend(f"fake-{seed}", llm, config.llm_pool.max_concurrency)
+                for seed, llm in enumerate(self.llms)
+            ],
+            config.llm_pool,
+            main.metrics,
+        )
+        main.STARTUP_STAGES[:] = [
+            [
+                ("cratedb", main.resources.check_database),
+                ("embeddings", main.resources.check_embeddings),
+                ("data_processor", self._data_processor),
+                ("llm_gateway", self._gateway),
+            ],
+            [
+                ("chatbot", main.build_chatbot),
+            ],
+        ]
+
+    def _data_processor(self):
+        from app.data.processor import DataProcessor
+        return DataProcessor(
+            config, self.main.resources, vector_store=self.vector_store, metrics=self.main.metrics
+        )
+
+    def _gateway(self):
+        from app.llms.cache import build_tiered_caches
+        cache_latency = self.args.cache_latency_ms / 1000.0
+        standard, semantic = build_tiered_caches(
+            config,
+            FakeCache(latency=cache_latency),
+            FakeSemanticCache(
+                self.embeddings,
+                config.vector_store.semantic_cache_threshold,
+                latency=cache_latency,
+            ),
+            self.embeddings,
+            self.main.metrics,
+            self.main.resources.corpus,
+        )
+        self.standard_cache, self.semantic_cache = standard, semantic
+        return SimpleNamespace(
+            llm=self.llm, standard_cache=standard, semantic_cache=semantic, close=self.llm.close
+        )
+
+    @property
+    def llm_calls(self) -> int:
+        return sum(llm.calls for llm in self.llms)
+
+    def reset_caches(self) -> None:
+        self.standard_cache.clear()
+        self.semantic_cache.clear()
+        if self.main.retrieval_cache is not None:
+            self.main.retrieval_cache.clear()
+        # Finished answers are shared for COALESCING_WINDOW_SECONDS
+        self.main.startup.get("chatbot").coalescer.forget_finished()
+
+    def create_tables(self) -> None:
+        self.main.resources.execute(
+            "CREATE TABLE IF NOT EXISTS interactions ("
+            "query TEXT, response TEXT, process_time REAL, cache_type TEXT, timestamp REAL, "
+            "prompt_version TEXT)"
+        )
+
+
+async def run_queries(client: httpx.AsyncClient, queries: List[str],
+                      concurrency: int) -> Dict[str, Any]:
+    latencies: List[float] = []
+    cache_types: Counter = Counter()
+    errors = 0
+    pending = iter(queries)
+
+    async def worker():
+        nonlocal errors
+        for query in pending:
+            start_time = time.perf_counter()
+            response = await client.post("/query", json={"query": query})
+            latencies.append(time.perf_counter() - start_time)
+            if response.status_code != 200:
+                errors += 1
+                continue
+            cache_types[response.json().get("cache_type", "none")] += 1
+
+    start_time = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start_time
+
+    served = sum(cache_types.values())
+    hits = served - cache_types.get("none", 0)
+    return {
+        "requests": len(queries),
+        "errors": errors,
+        "elapsed_seconds": round(elapsed, 3),
+        "qps": round(len(queries) / elapsed, 2),
+        "latency_ms": percentiles(latencies),
+        "cache_types": dict(cache_types),
+        "cache_hit_rate": round(hits / served, 4) if served else 0.0,
+    }
+
+
+async def run_query_batch(client: httpx.AsyncClient, queries: List[str]) -> Dict[str, Any]:
+    cache_types: Counter = Counter()
+    errors = 0
+    start_time = time.perf_counter()
+    response = await client.post("/query/batch", json={"queries": queries, "stream": True})
+    async for line in response.aiter_lines():
+        if not line:
+            continue
+        item = json.loads(line)
+        if "error" in item:
+            errors += 1
+            continue
+        cache_types[item.get("cache_type", "none")] += 1
+    elapsed = time.perf_counter() - start_time
+
+    served = sum(cache_types.values())
+    hits = served - cache_types.get("none", 0)
+    return {
+        "requests": len(queries),
+        "errors": errors,
+        "elapsed_seconds": round(elapsed, 3),
+        "qps": round(len(queries) / elapsed, 2),
+        "cache_types": dict(cache_types),
+        "cache_hit_rate": round(hits / served, 4) if served else 0.0,
+    }
+
+
+async def run_burst(client: httpx.AsyncClient, hot: List[str],
+                    cold: List[str]) -> Dict[str, Any]:
+    """Send cached (hot) and uncached (cold) queries all at once."""
+    results: Dict[str, Dict[str, Any]] = {
+        kind: {"latencies": [], "statuses": Counter(), "retry_after": Counter()}
+        for kind in ("hot", "cold")
+    }
+
+    async def send(kind: str, query: str):
+        start_time = time.perf_counter()
+        response = await client.post("/query", json={"query": query})
+        results[kind]["latencies"].append(time.perf_counter() - start_time)
+        results[kind]["statuses"][response.status_code] += 1
+        if "retry-after" in response.headers:
+            results[kind]["retry_after"][response.headers["retry-after"]] += 1
+
+    queries = [("hot", query) for query in hot] + [("cold", query) for query in cold]
+    random.Random(0).shuffle(queries)
+    start_time = time.perf_counter()
+    await asyncio.gather(*(send(kind, query) for kind, query in queries))
+    report: Dict[str, Any] = {"elapsed_seconds": round(time.perf_counter() - start_time, 3)}
+    for kind, result in results.items():
+        report[kind] = {
+            "requests": len(result["latencies"]),
+            "statuses": dict(result["statuses"]),
+            "retry_after": dict(result["retry_after"]),
+            "latency_ms": percentiles(result["latencies"]),
+        }
+    return report
+
+
+async def run_cache_warm(client: httpx.AsyncClient) -> Dict[str, Any]:
+    start_time = time.perf_counter()
+    response = await client.post("/cache/warm", json={})
+    response.raise_for_status()
+    status = response.json()
+    while status["status"] in ("pending", "running"):
+        await asyncio.sleep(0.05)
+        status = (await client.get("/cache/warm")).json()
+    status["wall_seconds"] = round(time.perf_counter() - start_time, 3)
+    return status
+
+
+async def run_ingest(client: httpx.AsyncClient, documents: List[str],
+                     concurrency: int) -> Dict[str, Any]:
+    latencies: List[float] = []
+    errors = 0
+    pending = iter(documents)
+
+    async def worker():
+        nonlocal errors
+        for document in pending:
+            start_time = time.perf_counter()
+            response = await client.post("/ingest", json={"content": document})
+            latencies.append(time.perf_counter() - start_time)
+            errors += response.status_code != 200
+
+    start_time = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start_time
+    return {
+        "requests": len(documents),
+        "errors": errors,
+        "elapsed_seconds": round(elapsed, 3),
+        "qps": round(len(documents) / elapsed, 2),
+        "latency_ms": percentiles(latencies),
+    }
+
+
+def write_corpus(directory: str, documents: List[str]) -> None:
+    os.makedirs(directory, exist_ok=True)
+    for i, document in enumerate(documents):
+        with open(os.path.join(directory, f"doc_{i:05d}.txt"), "w") as f:
+            f.write(document)
+
+
+def resync_corpus(directory: str, rng: random.Random, fraction: float = 0.1) -> None:
+    """Touch, edit and delete a fraction of the corpus, like a nightly re-sync."""
+    paths = sorted(os.listdir(directory))
+    count = max(1, int(len(paths) * fraction))
+    for name in rng.sample(paths, min(len(paths), 3 * count)):
+        path = os.path.join(directory, name)
+        action = rng.choice(("touch", "edit", "delete"))
+        if action == "touch":
+            os.utime(path)
+        elif action == "edit":
+            with open(path, "a") as f:
+                f.write(" an appended paragraph about tuning and monitoring.")
+        else:
+            os.remove(path)
+
+
+async def run_ingest_directory(client: httpx.AsyncClient, corpus: str) -> Dict[str, Any]:
+    files = len(os.listdir(corpus))
+    start_time = time.perf_counter()
+    response = await client.post("/ingest/directory", params={"directory_path": corpus})
+    job_id = response.json()["job_id"]
+    while True:
+        status = (await client.get(f"/ingest/jobs/{job_id}")).json()
+        if status["status"] not in ("pending", "running"):
+            break
+        await asyncio.sleep(0.05)
+    elapsed = time.perf_counter() - start_time
+    return {
+        "files": files,
+        "status": status["status"],
+        "elapsed_seconds": round(elapsed, 3),
+        "files_per_second": round(status["files_done"] / elapsed, 2),
+        "chunks": status["chunks_done"],
+        "chunks_per_second": status["chunks_per_second"],
+        "errors": status["error_count"],
+        **{
+            key: status[key] for key in (
+                "files_skipped", "files_added", "files_updated", "files_deleted",
+                "chunks_deduplicated", "chunks_deleted",
+            )
+        },
+    }
+
+
+def run_ann_recall(args, workdir: str) -> Dict[str, Any]:
+    """Recall@k and latency of the ANN index against exact search.
+
+    Uses clustered synthetic vectors, which is the hard case for IVF: a
+    query's neighbours often straddle list boundaries.
+    """
+    rng = np.random.default_rng(args.seed)
+    dim, k = args.ann_dim, config.vector_store.retrieval_k
+    centers = normalize(rng.standard_normal((max(1, args.ann_vectors // 100), dim)))
+
+    def sample(count):
+        picks = centers[rng.integers(len(centers), size=count)]
+        return normalize(picks + 0.6 * rng.standard_normal((count, dim)) / np.sqrt(dim) * 4)
+
+    vectors = sample(args.ann_vectors).astype(np.float32)
+    queries = sample(args.ann_queries).astype(np.float32)
+    exact_start = time.perf_counter()
+    exact = [set(np.argsort(-(vectors @ q))[:k]) for q in queries]
+    exact_seconds = time.perf_counter() - exact_start
+
+    start_time = time.perf_counter()
+    index = ANNIndex(os.path.join(workdir, "ann_recall"), nlist=config.retriever.ann_nlist)
+    batch_size = 5000
+    index.build(
+        [(str(i), "", {}, vectors[i]) for i in range(start, min(start + batch_size, len(vectors)))]
+        for start in range(0, len(vectors), batch_size)
+    )
+    result: Dict[str, Any] = {
+        "vectors": args.ann_vectors,
+        "dim": dim,
+        "k": k,
+        "nlist": len(index._snapshot.centroids) if index._snapshot.centroids is not None else 0,
+        "build_seconds": round(time.perf_counter() - start_time, 3),
+        "exact_latency_ms": round(exact_seconds / len(queries) * 1000, 3),
+        "nprobe": {},
+    }
+    for nprobe in sorted({1, 4, config.retriever.ann_nprobe, 16, 32}):
+        index.nprobe = nprobe
+        latencies, hits = [], 0
+        for query, truth in zip(queries, exact):
+            query_start = time.perf_counter()
+            rows = {row for row, _ in index.search(query, k)}
+            latencies.append(time.perf_counter() - query_start)
+            hits += len(rows & truth)
+        result["nprobe"][nprobe] = {
+            "recall": round(hits / (k * len(queries)), 4),
+            "latency_ms": percentiles(latencies),
+        }
+
+    # Compact first-pass vectors against the float32 path at the configured nprobe
+    def measure(nprobe):
+        index.nprobe = nprobe
+        latencies, hits = [], 0
+        for query, truth in zip(queries, exact):
+            query_start = time.perf_counter()
+            rows = {row for row, _ in index.search(query, k)}
+            latencies.append(time.perf_counter() - query_start)
+            hits += len(rows & truth)
+        return {"recall": round(hits / (k * len(queries)), 4), "latency_ms": percentiles(latencies)}
+
+    result["vector_dtype"] = {}
+    for dtype, rescore_factor in (("float32", 1), ("float16", 4), ("int8", 4), ("int8", 1)):
+        index.quantize(dtype)
+        index.rescore_factor = rescore_factor
+        name = dtype if dtype == "float32" else f"{dtype}_rescore_{rescore_factor}"
+        result["vector_dtype"][name] = {
+            "bytes": index.vector_bytes(),
+            "nprobe": {
+                nprobe: measure(nprobe)
+                for nprobe in sorted({config.retriever.ann_nprobe, len(index._snapshot.lists or [1])})
+            },
+        }
+    return result
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except Exception:
+        return "unknown"
+
+
+async def main_async(args) -> Dict[str, Any]:
+    exporter = InMemorySpanExporter()
+    provider = TracerProvider()
+    provider.add_span_processor(SimpleSpanProcessor(exporter))
+    trace.set_tracer_provider(provider)
+
+    rng = random.Random(args.seed)
+    report: Dict[str, Any] = {
+        "revision": git_revision(),
+        "settings": vars(args),
+        "config": {
+            section: asdict(getattr(config, section))
+            for section in (
+                "llm_pool", "server", "cache", "coalescing", "batch", "context", "embeddings",
+                "ingestion", "retriever", "warming",
+                "admission"
+            )
+        },
+        "scenarios": {},
+    }
+
+    with tempfile.TemporaryDirectory() as workdir:
+        harness = Harness(args, workdir)
+        main = harness.main
+        async with main.lifespan(main.app):
+            deadline = time.monotonic() + args.startup_timeout
+            while not main.startup.ready:
+                if time.monotonic() > deadline:
+                    raise RuntimeError(f"App did not become ready: {main.startup.readiness()}")
+                await asyncio.sleep(0.01)
+            harness.create_tables()
+            report["startup"] = main.startup.readiness()
+
+            transport = httpx.ASGITransport(app=main.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench",
+                                         timeout=None) as client:
+                corpus = make_corpus(args.corpus_size, rng)
+                scenarios = report["scenarios"]
+
+                scenarios["ingest"] = await run_ingest(client, corpus, args.concurrency)
+                scenarios["ingest"]["stages_ms"] = stage_times(exporter)
+
+                directory = os.path.join(workdir, "corpus")
+                write_corpus(directory, make_corpus(args.directory_files, rng))
+                scenarios["ingest_directory"] = await run_ingest_directory(client, directory)
+                scenarios["ingest_directory"]["stages_ms"] = stage_times(exporter)
+
+                # Re-running over a mostly unchanged directory should be cheap
+                resync_corpus(directory, rng)
+                scenarios["ingest_directory_resync"] = await run_ingest_directory(
+                    client, directory
+                )
+                scenarios["ingest_directory_resync"]["stages_ms"] = stage_times(exporter)
+
+                for mix in args.mixes:
+                    harness.reset_caches()
+                    llm_calls = harness.llm_calls
+                    embed_requests = harness.embeddings.requests
+                    searches = harness.vector_store.searches
+                    result = await run_queries(
+                        client, make_queries(mix, args.requests, rng), args.concurrency
+                    )
+                    result["llm_calls"] = harness.llm_calls - llm_calls
+                    result["embedding_http_requests"] = harness.embeddings.requests - embed_requests
+                    result["vector_searches"] = harness.vector_store.searches - searches
+                    result["stages_ms"] = stage_times(exporter)
+                    scenarios[f"query:{mix}"] = result
+
+                    # The same workload as one /query/batch request
+                    harness.reset_caches()
+                    llm_calls = harness.llm_calls
+                    embed_requests = harness.embeddings.requests
+                    searches = harness.vector_store.searches
+                    result = await run_query_batch(client, make_queries(mix, args.requests, rng))
+                    result["llm_calls"] = harness.llm_calls - llm_calls
+                    result["embedding_http_requests"] = harness.embeddings.requests - embed_requests
+                    result["vector_searches"] = harness.vector_store.searches - searches
+                    result["stages_ms"] = stage_times(exporter)
+                    scenarios[f"query_batch:{mix}"] = result
+
+                if "repeat-heavy" in args.mixes:
+                    # Cold caches again, warmed from the interactions logged so far
+                    harness.reset_caches()
+                    await asyncio.sleep(config.interactions.flush_interval_seconds + 0.5)
+                    llm_calls = harness.llm_calls
+                    result = await run_cache_warm(client)
+                    result["llm_calls"] = harness.llm_calls - llm_calls
+                    scenarios["cache_warm"] = result
+
+                    llm_calls = harness.llm_calls
+                    result = await run_queries(
+                        client, make_queries("repeat-heavy", args.requests, rng), args.concurrency
+                    )
+                    result["llm_calls"] = harness.llm_calls - llm_calls
+                    result["stages_ms"] = stage_times(exporter)
+                    scenarios["query_warmed:repeat-heavy"] = result
+
+                    # A new prompt misses the answer caches but not the retrieval cache
+                    queries = make_queries("repeat-heavy", args.requests, rng)
+                    harness.reset_caches()
+                    await run_queries(client, queries, args.concurrency)
+                    stage_times(exporter)
+                    chatbot = main.startup.get("chatbot")
+                    chatbot.update_prompt(chatbot.prompt_template.template + " ")
+                    llm_calls = harness.llm_calls
+                    searches = harness.vector_store.searches
+                    result = await run_queries(client, queries, args.concurrency)
+                    result["llm_calls"] = harness.llm_calls - llm_calls
+                    result["vector_searches"] = harness.vector_store.searches - searches
+                    result["stages_ms"] = stage_times(exporter)
+                    scenarios["query_prompt_change:repeat-heavy"] = result
+
+                if args.burst_requests:
+                    # Cached and uncached queries arriving at once, with and without admission
+                    chatbot = main.startup.get("chatbot")
+                    admission = chatbot.admission
+                    hot = make_queries("repeat-heavy", args.requests, rng)[:20]
+                    for mode in ("admission", "unbounded"):
+                        harness.reset_caches()
+                        await run_queries(client, hot, args.concurrency)
+                        cold = make_queries("all-unique", args.burst_requests, rng)
+                        chatbot.admission = admission if mode == "admission" else None
+                        llm_calls = harness.llm_calls
+                        result = await run_burst(client, hot * 5, cold)
+                        result["llm_calls"] = harness.llm_calls - llm_calls
+                        scenarios[f"burst:{mode}"] = result
+                    chatbot.admission = admission
+
+        if args.ann_vectors:
+            report["scenarios"]["ann_recall"] = run_ann_recall(args, workdir)
+    return report
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=200, help="queries per mix")
+    parser.add_argument("--mixes", nargs="+", choices=MIXES, default=list(MIXES))
+    parser.add_argument("--corpus-size", type=int, default=200, help="documents for /ingest")
+    parser.add_argument("--directory-files", type=int, default=200,
+                        help="files for /ingest/directory")
+    parser.add_argument("--llm-latency-ms", type=float, default=200.0,
+                        help="time to first token")
+    parser.add_argument("--llm-tokens-per-second", type=float, default=50.0)
+    parser.add_argument("--answer-tokens", type=int, default=40)
+    parser.add_argument("--llm-backends", type=int, default=1,
+                        help="fake LLM replicas behind the backend pool")
+    parser.add_argument("--llm-straggler-rate", type=float, default=0.0,
+                        help="share of LLM calls delayed by --llm-straggler-ms")
+    parser.add_argument("--llm-straggler-ms", type=float, default=2000.0)
+    parser.add_argument("--burst-requests", type=int, default=300,
+                        help="uncached queries sent at once in the burst scenario (0 to skip)")
+    parser.add_argument("--embed-latency-ms", type=float, default=10.0,
+                        help="per embedding HTTP request")
+    parser.add_argument("--store-latency-ms", type=float, default=5.0,
+                        help="per vector search or insert")
+    parser.add_argument("--cache-latency-ms", type=float, default=2.0,
+                        help="per CrateDB cache round-trip")
+    parser.add_argument("--retriever", choices=("cratedb", "ann"), default="cratedb",
+                        help="cratedb: the fake vector store, ann: the local index")
+    parser.add_argument("--ann-vectors", type=int, default=20000,
+                        help="vectors for the ANN recall scenario (0 to skip)")
+    parser.add_argument("--ann-queries", type=int, default=200)
+    parser.add_argument("--ann-dim", type=int, default=384)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--startup-timeout", type=float, default=30.0)
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> None:
+    args = parse_args(argv)
+    report = asyncio.run(main_async(args))
+    output = json.dumps(report, indent=2, default=str)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        sys.stdout.write(output + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""Shared fixtures: an in-memory SQLite stand-in for CrateDB and a chatbot over fakes."""
+import sqlite3
+import types
+from typing import Any, List, Optional, Sequence
+
+import pytest
+
+from app.chatbot.backend import ChatbotBackend
+from app.config import Config
+from app.data.corpus import CorpusVersion
+from app.data.processor import DataProcessor
+from app.llms.cache import LRUCache, TieredCache
+from app.llms.store import CacheStore
+from benchmarks.fakes import FakeEmbeddingServer, FakeLLM, FakeVectorStore
+
+DOCUMENTS = [
+    "RAG retrieves documents before answering",
+    "Deployments roll out one pod at a time",
+    "The cache keeps answers for an hour",
+]
+
+
+class Database:
+    """``execute``/``fetch_all`` pair like ResourceRegistry's, over SQLite."""
+
+    def __init__(self):
+        self.connection = sqlite3.connect(":memory:", check_same_thread=False)
+
+    def execute(self, sql: str, params: Sequence[Any] = ()) -> None:
+        with self.connection:
+            self.connection.execute(sql, tuple(params))
+
+    def fetch_all(self, sql: str, params: Sequence[Any] = ()) -> List[tuple]:
+        return self.connection.execute(sql, tuple(params)).fetchall()
+
+
+class PickyLLM(FakeLLM):
+    """FakeLLM that fails on prompts asking about ``boom``."""
+
+    async def _acall(self, prompt: str, stop: Optional[List[str]] = None,
+                     run_manager=None, **kwargs: Any) -> str:
+        if "Question: boom" in prompt:
+            raise RuntimeError("generation failed")
+        return await super()._acall(prompt, stop, run_manager, **kwargs)
+
+
+@pytest.fixture
+def database():
+    db = Database()
+    yield db
+    db.connection.close()
+
+
+@pytest.fixture
+def make_backend(database):
+    """Builds a ChatbotBackend over DOCUMENTS, with a standard cache in ``database``."""
+
+    def make(llm=None, config=None, **kwargs) -> ChatbotBackend:
+        config = config or Config()
+        embeddings = FakeEmbeddingServer(config.embeddings, dim=16, batch_latency=0,
+                                         per_text_latency=0)
+        store = FakeVectorStore(embeddings, latency=0)
+        store.add_texts(DOCUMENTS)
+        corpus = CorpusVersion(database.execute, database.fetch_all)
+        resources = types.SimpleNamespace(
+            embeddings=embeddings, execute=database.execute, fetch_all=database.fetch_all,
+            corpus=corpus
+        )
+        processor = DataProcessor(config, resources, vector_store=store)
+        standard_store = CacheStore(database.execute, database.fetch_all, "llm_cache_entries",
+                                    corpus, max_entries=100, ttl=3600)
+        options = {"standard_cache": TieredCache(standard_store, LRUCache(100, 60), corpus=corpus)}
+        options.update(kwargs)
+        llm = llm or PickyLLM(first_token_latency=0, tokens_per_second=1000, answer_tokens=3)
+        return ChatbotBackend(config, llm, processor, **options)
+
+    return make
@@ -0,0 +1,189 @@
+"""Admission lanes: priorities, shedding and slot hand-over."""
+import asyncio
+
+import pytest
+
+from app.chatbot.admission import AdmissionController, Lane, Overloaded
+from app.config import AdmissionConfig
+
+
+async def hold(lane: Lane, started: asyncio.Event, release: asyncio.Event) -> None:
+    await lane.acquire()
+    started.set()
+    await release.wait()
+    lane.release()
+
+
+def test_lane_serves_lower_priority_values_first():
+    async def scenario():
+        lane = Lane("fast", max_concurrency=1, max_queue=10, deadline=5)
+        await lane.acquire()
+        order = []
+
+        async def waiter(name, priority):
+            await lane.acquire(priority)
+            order.append(name)
+            lane.release()
+
+        tasks = [
+            asyncio.create_task(waiter("retrieval-1", 1)),
+            asyncio.create_task(waiter("lookup", 0)),
+            asyncio.create_task(waiter("retrieval-2", 1)),
+        ]
+        await asyncio.sleep(0)
+        assert lane.queued == 3
+        lane.release()
+        await asyncio.gather(*tasks)
+        return order, lane
+
+    order, lane = asyncio.run(scenario())
+    assert order == ["lookup", "retrieval-1", "retrieval-2"]
+    assert lane.active == 0
+    assert lane.queued == 0
+
+
+def test_lane_sheds_when_queue_is_full():
+    async def scenario():
+        lane = Lane("llm", max_concurrency=1, max_queue=1, deadline=5)
+        await lane.acquire()
+        queued = asyncio.create_task(lane.acquire())
+        await asyncio.sleep(0)
+        with pytest.raises(Overloaded) as shed:
+            await lane.acquire()
+        lane.release()
+        await queued
+        lane.release()
+        return shed.value
+
+    shed = asyncio.run(scenario())
+    assert shed.reason == "queue_full"
+    assert shed.status_code == 429
+    assert shed.retry_after >= 1
+
+
+def test_lane_sheds_waiters_past_the_deadline():
+    async def scenario():
+        lane = Lane("llm", max_concurrency=1, max_queue=10, deadline=0.05)
+        await lane.acquire()
+        with pytest.raises(Overloaded) as shed:
+            await lane.acquire()
+        return shed.value, lane
+
+    shed, lane = asyncio.run(scenario())
+    assert shed.reason == "timeout"
+    assert shed.status_code == 503
+    assert lane.queued == 0
+    assert lane.active == 1
+
+
+def test_lane_sheds_on_arrival_when_estimated_wait_exceeds_deadline():
+    async def scenario():
+        lane = Lane("llm", max_concurrency=1, max_queue=10, deadline=0.02)
+        for _ in range(5):
+            await lane.acquire()
+            await asyncio.sleep(0.05)
+            lane.release()
+        await lane.acquire()
+        with pytest.raises(Overloaded) as shed:
+            await lane.acquire()
+        return shed.value, lane
+
+    shed, lane = asyncio.run(scenario())
+    assert shed.reason == "deadline"
+    assert lane.service_time == pytest.approx(0.05, rel=0.5)
+    assert lane.queued == 0
+
+
+def test_cancelled_waiter_does_not_leak_its_slot():
+    async def scenario():
+        lane = Lane("fast", max_concurrency=1, max_queue=10, deadline=5)
+        started, release = asyncio.Event(), asyncio.Event()
+        holder = asyncio.create_task(hold(lane, started, release))
+        await started.wait()
+        cancelled = asyncio.create_task(lane.acquire())
+        await asyncio.sleep(0)
+        cancelled.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await cancelled
+        release.set()
+        await holder
+        await asyncio.wait_for(lane.acquire(), 1)
+        lane.release()
+        return lane
+
+    lane = asyncio.run(scenario())
+    assert lane.active == 0
+    assert lane.queued == 0
+
+
+def test_controller_rejects_retrievals_while_llm_lane_is_full():
+    config = AdmissionConfig(
+        max_concurrency=4, max_queued=4, queue_deadline_seconds=1,
+        max_generations=1, max_queued_generations=0, generation_deadline_seconds=1
+    )
+
+    async def scenario():
+        admission = AdmissionController(config)
+        async with admission.generations:
+            async with admission.lookups:
+                pass
+            with pytest.raises(Overloaded) as shed:
+                async with admission.retrievals:
+                    pass
+        async with admission.retrievals:
+            pass
+        return shed.value, admission
+
+    shed, admission = asyncio.run(scenario())
+    assert shed.lane == "llm"
+    assert shed.reason == "queue_full"
+    assert admission.stats()["fast"]["in_flight"] == 0
+    assert admission.stats()["llm"]["in_flight"] == 0
+
+
+def test_background_waiters_go_last_and_are_never_shed():
+    async def scenario():
+        lane = Lane("llm", max_concurrency=1, max_queue=1, deadline=0.05)
+        await lane.acquire()
+        order = []
+
+        async def waiter(name, priority, shed):
+            await lane.acquire(priority, shed)
+            order.append(name)
+            await asyncio.sleep(0.02)
+            lane.release()
+
+        background = [asyncio.create_task(waiter(f"batch-{i}", 1, False)) for i in range(3)]
+        await asyncio.sleep(0)
+        # Background waiters leave the queue to interactive requests
+        interactive = asyncio.create_task(waiter("query", 0, True))
+        await asyncio.sleep(0)
+        assert (lane.queued, lane.background) == (1, 3)
+        with pytest.raises(Overloaded):
+            await lane.acquire()
+        lane.release()
+        # Waiting past the deadline does not shed them either
+        await asyncio.gather(interactive, *background)
+        return order, lane
+
+    order, lane = asyncio.run(scenario())
+    assert order == ["query", "batch-0", "batch-1", "batch-2"]
+    assert (lane.active, lane.queued, lane.background) == (0, 0, 0)
+
+
+def test_cancelled_background_waiter_does_not_leak_its_slot():
+    async def scenario():
+        lane = Lane("llm", max_concurrency=1, max_queue=10, deadline=5)
+        await lane.acquire()
+        cancelled = asyncio.create_task(lane.acquire(1, shed=False))
+        await asyncio.sleep(0)
+        lane.release()
+        cancelled.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await cancelled
+        await asyncio.wait_for(lane.acquire(), 1)
+        lane.release()
+        return lane
+
+    lane = asyncio.run(scenario())
+    assert (lane.active, lane.queued, lane.background) == (0, 0, 0)
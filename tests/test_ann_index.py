@@ -0,0 +1,161 @@
+"""IVF search recall, quantized first passes, tombstones and shared writes of the ANN index."""
+import multiprocessing
+
+import numpy as np
+import pytest
+
+from app.data.ann_index import ANNIndex, normalize
+
+DIM = 32
+K = 10
+
+
+def clustered(rng, count: int, centers: np.ndarray) -> np.ndarray:
+    picks = centers[rng.integers(len(centers), size=count)]
+    return normalize(picks + 1.5 * rng.standard_normal((count, DIM)) / np.sqrt(DIM))
+
+
+@pytest.fixture(scope="module")
+def dataset():
+    rng = np.random.default_rng(7)
+    centers = normalize(rng.standard_normal((20, DIM)))
+    return clustered(rng, 2000, centers).astype(np.float32), clustered(rng, 50, centers)
+
+
+def build(path, vectors, **kwargs) -> ANNIndex:
+    index = ANNIndex(str(path), nlist=16, nprobe=4, **kwargs)
+    rows = [(f"doc-{i}", f"text {i}", {"i": i}, vector.tolist())
+            for i, vector in enumerate(vectors)]
+    index.build([rows[start:start + 500] for start in range(0, len(rows), 500)])
+    return index
+
+
+def recall(index: ANNIndex, vectors: np.ndarray, queries: np.ndarray) -> float:
+    found = 0
+    for query in queries:
+        exact = set(np.argsort(-(vectors @ query))[:K])
+        found += len(exact & {row for row, _ in index.search(query, k=K)})
+    return found / (K * len(queries))
+
+
+@pytest.mark.parametrize("vector_dtype", ["float32", "float16", "int8"])
+def test_ivf_search_recall(tmp_path, dataset, vector_dtype):
+    vectors, queries = dataset
+    index = build(tmp_path, vectors, vector_dtype=vector_dtype)
+    assert len(index) == len(vectors)
+    assert recall(index, vectors, queries) >= 0.85
+    # Probing every list leaves only the quantized first pass, which rescoring corrects
+    index.nprobe = index.nlist
+    assert recall(index, vectors, queries) == 1.0
+
+
+def test_quantized_search_scans_fewer_bytes(tmp_path, dataset):
+    vectors, queries = dataset
+    index = build(tmp_path, vectors)
+    before = recall(index, vectors, queries)
+    index.quantize("int8")
+    sizes = index.vector_bytes()
+    assert sizes["first_pass"] < sizes["float32"] / 3
+    assert recall(index, vectors, queries) >= before - 0.02
+
+
+def test_search_scores_are_cosine_similarities(tmp_path, dataset):
+    vectors, queries = dataset
+    index = build(tmp_path, vectors)
+    results = index.search(queries[0], k=K)
+    assert [score for _, score in results] == sorted((s for _, s in results), reverse=True)
+    for row, score in results:
+        assert score == pytest.approx(float(vectors[row] @ queries[0]), abs=1e-5)
+
+
+def test_deleted_and_replaced_rows_are_not_returned(tmp_path, dataset):
+    vectors, _ = dataset
+    index = build(tmp_path, vectors[:500])
+    index.delete(["doc-3"])
+    assert 3 not in {row for row, _ in index.search(vectors[3], k=K)}
+
+    index.add_embeddings(["moved"], [(-vectors[4]).tolist()], ids=["doc-4"])
+    documents = index.similarity_search_by_vector(vectors[4].tolist(), k=K)
+    assert "text 4" not in [document.page_content for document in documents]
+    assert index.similarity_search_by_vector((-vectors[4]).tolist(), k=1)[0].page_content == "moved"
+
+
+def test_index_reopens_from_disk(tmp_path, dataset):
+    vectors, queries = dataset
+    index = build(tmp_path, vectors, vector_dtype="int8")
+    expected = index.search(queries[0], k=K)
+    reopened = ANNIndex(str(tmp_path), nlist=16, nprobe=4, vector_dtype="int8")
+    assert len(reopened) == len(vectors)
+    assert reopened.search(queries[0], k=K) == expected
+
+
+def add_rows(path, prefix: str, vectors: np.ndarray) -> None:
+    index = ANNIndex(str(path), nlist=16, nprobe=4)
+    for i, vector in enumerate(vectors):
+        index.add_embeddings([f"{prefix} {i}"], [vector.tolist()], ids=[f"{prefix}-{i}"])
+
+
+def test_writers_in_other_processes_append_after_each_other(tmp_path, dataset):
+    vectors, _ = dataset
+    context = multiprocessing.get_context("fork")
+    workers = [
+        context.Process(target=add_rows, args=(tmp_path, f"w{w}", vectors[w * 30:(w + 1) * 30]))
+        for w in range(3)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    assert all(worker.exitcode == 0 for worker in workers)
+
+    index = ANNIndex(str(tmp_path), nlist=16, nprobe=16)
+    assert len(index) == 90
+    for w in range(3):
+        for i in (0, 29):
+            found = index.similarity_search_by_vector(vectors[w * 30 + i].tolist(), k=1)[0]
+            assert found.page_content == f"w{w} {i}"
+
+
+def test_stale_writer_reloads_before_appending(tmp_path, dataset):
+    vectors, _ = dataset
+    first = ANNIndex(str(tmp_path))
+    second = ANNIndex(str(tmp_path))
+    first.add_embeddings(["a"], [vectors[0].tolist()], ids=["a"])
+    # ``second`` has not refreshed; it still replaces the row ``first`` wrote
+    second.add_embeddings(["a again", "b"], vectors[1:3].tolist(), ids=["a", "b"])
+    reopened = ANNIndex(str(tmp_path))
+    assert len(reopened) == 2
+    assert reopened.similarity_search_by_vector(vectors[1].tolist(), k=1)[0].page_content == "a again"
+    assert "a" not in [doc.page_content for doc in
+                       reopened.similarity_search_by_vector(vectors[0].tolist(), k=3)]
+
+
+def test_rows_appended_without_a_commit_are_cut_off(tmp_path, dataset):
+    vectors, _ = dataset
+    index = ANNIndex(str(tmp_path), vector_dtype="int8")
+    index.add_embeddings(["a"], [vectors[0].tolist()], ids=["a"])
+    # A writer that crashed between appending and committing
+    for name in ("vectors.f32", "vectors.i8", "scales.f32", "documents.jsonl"):
+        with open(tmp_path / name, "ab") as f:
+            f.write(b"\x01" * 7)
+    other = ANNIndex(str(tmp_path), vector_dtype="int8")
+    other.add_embeddings(["b"], [vectors[1].tolist()], ids=["b"])
+    reopened = ANNIndex(str(tmp_path), vector_dtype="int8")
+    assert len(reopened) == 2
+    for row, text in enumerate(("a", "b")):
+        result = reopened.similarity_search_with_score_by_vector(vectors[row].tolist(), k=1)[0]
+        assert result[0].page_content == text
+        assert result[1] == pytest.approx(1.0, abs=1e-5)
+
+
+def test_build_if_empty_keeps_an_index_built_meanwhile(tmp_path, dataset):
+    vectors, _ = dataset
+    starting = ANNIndex(str(tmp_path), nlist=16, nprobe=4)
+    build(tmp_path, vectors[:100])
+
+    def unused():
+        raise AssertionError("the documents table was read")
+        yield
+
+    assert starting.build(unused(), if_empty=True) == 100
+    assert len(starting) == 100
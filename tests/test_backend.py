@@ -0,0 +1,96 @@
+"""Chatbot backend: batch answering over the caches and the pipeline."""
+import asyncio
+from typing import Any, List, Optional
+
+from app.chatbot.admission import AdmissionController
+from app.chatbot.backend import ChatbotBackend
+from app.config import AdmissionConfig, BatchConfig, CoalescingConfig, Config
+from benchmarks.fakes import FakeLLM
+
+def run_batch(backend: ChatbotBackend, queries: List[str]) -> List[dict]:
+    async def scenario():
+        return [item async for item in backend.process_batch(queries)]
+
+    return asyncio.run(scenario())
+
+
+def test_batch_yields_items_in_input_order_with_error_items(make_backend):
+    backend = make_backend(config=Config(batch=BatchConfig(chunk_size=2)))
+    # Only in CrateDB: the bulk lookup has to reach past the empty L1
+    backend.standard_cache.backend.update("cached", backend.prompt_version, "from the cache")
+    queries = ["what is rag", "boom", "cached", "how do deployments work", "cache lifetime"]
+    items = run_batch(backend, queries)
+
+    assert [item["index"] for item in items] == list(range(len(queries)))
+    assert [item["query"] for item in items] == queries
+    assert items[1]["error"] == "generation failed"
+    assert "answer" not in items[1]
+    assert (items[2]["answer"], items[2]["cache_type"]) == ("from the cache", "standard")
+    for item in (items[0], items[3], items[4]):
+        assert item["answer"] and item["sources"] and item["cache_type"] == "none"
+    assert backend.llm.calls == 3
+
+
+def test_batch_answers_are_cached_for_the_next_batch(make_backend):
+    backend = make_backend()
+    first = run_batch(backend, ["what is rag", "how do deployments work"])
+    calls = backend.llm.calls
+    second = run_batch(backend, ["how do deployments work", "what is rag"])
+    assert backend.llm.calls == calls
+    assert [item["answer"] for item in second] == [first[1]["answer"], first[0]["answer"]]
+    assert {item["cache_type"] for item in second} == {"standard"}
+
+
+def test_answer_retrieved_before_an_ingestion_is_not_served_after_it(make_backend):
+    backend = make_backend(config=Config(coalescing=CoalescingConfig(window_seconds=0)))
+    processor = backend.data_processor
+    search = processor.asearch_with_scores_by_vector
+
+    async def search_during_ingestion(embedding, k=4):
+        results = await search(embedding, k=k)
+        processor.resources.corpus.bump()
+        return results
+
+    processor.asearch_with_scores_by_vector = search_during_ingestion
+    first = asyncio.run(backend.process_input("what is rag"))
+    processor.asearch_with_scores_by_vector = search
+    second = asyncio.run(backend.process_input("what is rag"))
+    assert (first["cache_type"], second["cache_type"]) == ("none", "none")
+    assert backend.llm.calls == 2
+    third = asyncio.run(backend.process_input("what is rag"))
+    assert third["cache_type"] == "standard"
+
+
+class CountingLLM(FakeLLM):
+    """FakeLLM that records the most calls it had in flight at once."""
+
+    active: int = 0
+    peak: int = 0
+
+    async def _acall(self, prompt: str, stop: Optional[List[str]] = None,
+                     run_manager=None, **kwargs: Any) -> str:
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        try:
+            return await super()._acall(prompt, stop, run_manager, **kwargs)
+        finally:
+            self.active -= 1
+
+
+def test_batch_and_warming_generations_take_admission_slots(make_backend):
+    config = Config(batch=BatchConfig(max_generations=4))
+    admission = AdmissionController(AdmissionConfig(max_generations=1, max_queued_generations=0))
+    llm = CountingLLM(first_token_latency=0.01, tokens_per_second=1000, answer_tokens=3)
+    backend = make_backend(llm=llm, config=config, admission=admission)
+
+    async def scenario():
+        items = [item async for item in backend.process_batch(["q1", "q2", "q3", "q4"])]
+        outcomes = await backend.warm_batch(["q5", "q6", "q7"], {}, lambda: True,
+                                            generation_limit=asyncio.Semaphore(4))
+        return items, outcomes
+
+    items, outcomes = asyncio.run(scenario())
+    assert all("error" not in item for item in items)
+    assert outcomes == ["generated"] * 3
+    assert (llm.calls, llm.peak) == (7, 1)
+    assert admission.stats()["llm"]["in_flight"] == 0
@@ -0,0 +1,109 @@
+"""Micro-batching embeddings client: merging, deduplication and cancellation."""
+import asyncio
+import threading
+from concurrent.futures import Future
+from typing import List
+
+import pytest
+
+from app.config import EmbeddingsConfig
+from benchmarks.fakes import FakeEmbeddingServer, hashed_embedding
+
+
+class RecordingServer(FakeEmbeddingServer):
+    """Records the texts of every batch; ``on_post`` runs inside the call."""
+
+    def __init__(self, config, **kwargs):
+        super().__init__(config, dim=8, batch_latency=0, per_text_latency=0)
+        self.batches: List[List[str]] = []
+        self.on_post = None
+        self.error = None
+
+    def _post(self, texts):
+        self.batches.append(list(texts))
+        if self.on_post is not None:
+            self.on_post()
+        if self.error is not None:
+            raise self.error
+        return super()._post(texts)
+
+
+@pytest.fixture
+def server():
+    server = RecordingServer(EmbeddingsConfig(max_batch_size=8, max_wait_ms=50,
+                                              max_concurrency=2))
+    yield server
+    server.close()
+
+
+def pending(*texts):
+    return [(text, Future()) for text in texts]
+
+
+def test_concurrent_callers_share_one_request(server):
+    async def scenario():
+        return await asyncio.gather(*(server.aembed_query(f"q{i % 3}") for i in range(6)))
+
+    vectors = asyncio.run(scenario())
+    assert vectors == [hashed_embedding(f"q{i % 3}", 8) for i in range(6)]
+    assert server.batches == [["q0", "q1", "q2"]]
+
+
+def test_batches_are_capped_at_max_batch_size(server):
+    vectors = server.embed_documents([f"d{i}" for i in range(20)])
+    assert len(vectors) == 20
+    assert [len(batch) for batch in server.batches] == [8, 8, 4]
+
+
+def test_cancelled_callers_are_not_sent(server):
+    batch = pending("a", "b", "c")
+    batch[1][1].cancel()
+    server._slots.acquire()
+    server._send_batch(batch)
+    assert server.batches == [["a", "c"]]
+    assert batch[0][1].result() == hashed_embedding("a", 8)
+    assert batch[1][1].cancelled()
+    assert batch[2][1].result() == hashed_embedding("c", 8)
+
+
+def test_cancel_during_the_request_does_not_fail_the_others(server):
+    batch = pending("a", "b")
+    cancelled = []
+    server.on_post = lambda: cancelled.append(batch[0][1].cancel())
+    server._slots.acquire()
+    server._send_batch(batch)
+    # Claimed futures cannot be cancelled any more; every caller gets its vector
+    assert cancelled == [False]
+    assert [future.result() for _, future in batch] == [
+        hashed_embedding("a", 8), hashed_embedding("b", 8)
+    ]
+
+
+def test_failed_request_fails_every_caller_and_frees_its_slot(server):
+    server.error = RuntimeError("endpoint down")
+    batch = pending("a", "b")
+    server._slots.acquire()
+    server._send_batch(batch)
+    for _, future in batch:
+        with pytest.raises(RuntimeError, match="endpoint down"):
+            future.result()
+    # Both slots are free again
+    assert server._slots.acquire(blocking=False) and server._slots.acquire(blocking=False)
+
+
+def test_calls_from_threads_are_batched_together(server):
+    results = {}
+    barrier = threading.Barrier(4)
+
+    def call(i):
+        barrier.wait()
+        results[i] = server.embed_query(f"t{i}")
+
+    threads = [threading.Thread(target=call, args=(i,)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == {i: hashed_embedding(f"t{i}", 8) for i in range(4)}
+    assert sum(len(batch) for batch in server.batches) == 4
+    assert len(server.batches) < 4
@@ -0,0 +1,239 @@
+"""L1 cache tiers and the CrateDB-backed cache store."""
+import types
+
+import pytest
+
+from app.data.corpus import CorpusVersion
+from app.llms import cache
+from app.llms.cache import LRUCache, SemanticIndex, TieredCache
+from app.llms import store as cache_store
+from app.llms.store import CacheStore, SemanticCacheStore, drop_legacy_tables
+from benchmarks.fakes import FakeCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache, "time", types.SimpleNamespace(monotonic=clock.monotonic))
+    return clock
+
+
+@pytest.fixture
+def corpus(database):
+    return CorpusVersion(database.execute, database.fetch_all)
+
+
+def make_store(database, corpus, **kwargs) -> CacheStore:
+    options = {"table_name": "llm_cache", "max_entries": 100, "ttl": 3600}
+    options.update(kwargs)
+    return CacheStore(database.execute, database.fetch_all, corpus=corpus, **options)
+
+
+def test_lru_cache_evicts_least_recently_used(clock):
+    lru = LRUCache(max_entries=2, ttl=60)
+    lru.put("a", 1)
+    lru.put("b", 2)
+    assert lru.get("a") == (1, 0)
+    assert lru.put("c", 3) == 1
+    assert lru.get("b") == (None, 0)
+    assert lru.get("a") == (1, 0)
+    assert len(lru) == 2
+
+
+def test_lru_cache_expires_entries(clock):
+    lru = LRUCache(max_entries=10, ttl=60)
+    lru.put("a", 1)
+    clock.now += 61
+    assert lru.get("a") == (None, 1)
+    assert len(lru) == 0
+
+
+def test_semantic_index_matches_above_threshold(clock):
+    index = SemanticIndex(max_entries=4, ttl=60, threshold=0.9)
+    index.put([1.0, 0.0], "x")
+    assert index.get([0.99, 0.05]) == "x"
+    assert index.get([0.0, 1.0]) is None
+    assert index.get([1.0, 0.0, 0.0]) is None
+    assert index.get_many([[1.0, 0.01], [0.0, 1.0]]) == ["x", None]
+
+
+def test_semantic_index_skips_and_reuses_expired_rows(clock):
+    index = SemanticIndex(max_entries=2, ttl=60, threshold=0.9)
+    index.put([1.0, 0.0], "old")
+    clock.now += 30
+    index.put([0.0, 1.0], "young")
+    clock.now += 31
+    assert index.get([1.0, 0.0]) is None
+    assert index.put([0.7, 0.7], "new") == 1
+    assert index.get([0.0, 1.0]) == "young"
+    assert index.get([0.7, 0.7]) == "new"
+    assert len(index) == 2
+
+
+def test_semantic_index_evicts_least_recently_used_row(clock):
+    index = SemanticIndex(max_entries=2, ttl=60, threshold=0.9)
+    index.put([1.0, 0.0], "a")
+    clock.now += 1
+    index.put([0.0, 1.0], "b")
+    clock.now += 1
+    assert index.get([1.0, 0.0]) == "a"
+    index.put([0.7, 0.7], "c")
+    assert index.get([0.0, 1.0]) is None
+    assert index.get([1.0, 0.0]) == "a"
+
+
+def test_tiered_cache_keys_by_scope_and_clears_on_corpus_bump(clock, corpus):
+    backend = FakeCache(latency=0)
+    tiered = TieredCache(backend, LRUCache(10, 60), corpus=corpus)
+    tiered.update("q", "v1", "answer")
+    assert tiered.lookup("q", "v2") is None
+    assert tiered.peek("q", "v1") == "answer"
+
+    corpus.bump()
+    backend.clear()
+    assert tiered.lookup("q", "v1") is None
+    assert len(tiered.l1) == 0
+
+
+def test_tiered_base_requires_the_l1_hooks():
+    class NoL1(cache._TieredBase):
+        def lookup(self, prompt, *args):
+            return None
+
+        def update(self, prompt, *args):
+            pass
+
+        def clear(self, **kwargs):
+            pass
+
+    with pytest.raises(TypeError, match="_clear_l1"):
+        NoL1(FakeCache(latency=0), "standard")
+
+
+def test_cache_store_lookup_many_reads_in_statement_batches(database, corpus, monkeypatch):
+    monkeypatch.setattr(cache_store, "STATEMENT_BATCH_SIZE", 2)
+    store = make_store(database, corpus)
+    for i in range(5):
+        store.update(f"q{i}", "v1", f"answer {i}")
+    store.update("other scope", "v2", "answer")
+    prompts = ["q4", "missing", "q0", "q2", "other scope", "q0"]
+    assert store.lookup_many(prompts, "v1") == [
+        "answer 4", None, "answer 0", "answer 2", None, "answer 0"
+    ]
+    stats = store.stats()
+    assert (stats["lookups"], stats["hits"]) == (6, 4)
+
+
+def test_semantic_store_lookup_many_scores_prompts_together(database, corpus):
+    vectors = {"what is rag": [1.0, 0.0], "what's rag": [0.99, 0.05],
+               "deploy steps": [0.0, 1.0], "how to deploy": [0.05, 0.99]}
+    embeddings = types.SimpleNamespace(embed_query=lambda text: vectors[text])
+    store = SemanticCacheStore(database.execute, database.fetch_all, "semantic_cache", corpus,
+                               embeddings, threshold=0.95, max_entries=100, ttl=3600)
+    store.update("what is rag", "v1", "rag answer")
+    store.update("deploy steps", "v2", "deploy answer")
+    assert store.lookup_many(["what's rag", "how to deploy"], "v1") == ["rag answer", None]
+    assert store.lookup_many(["how to deploy", "what's rag"], "v2") == ["deploy answer", None]
+
+    # Rows deleted behind the store's back are dropped from its matrix
+    database.execute("DELETE FROM semantic_cache")
+    assert store.lookup_many(["what's rag"], "v1") == [None]
+    assert store.stats()["indexed"] == 1
+
+
+def test_tiered_lookup_many_reads_l1_misses_from_the_backend(clock, corpus, database):
+    backend = make_store(database, corpus)
+    tiered = TieredCache(backend, LRUCache(10, 60), corpus=corpus)
+    tiered.update("in l1", "v1", "first")
+    backend.update("only in crate", "v1", "second")
+    assert tiered.lookup_many(["in l1", "only in crate", "nowhere"], "v1") == [
+        "first", "second", None
+    ]
+    assert tiered.l1.get(("only in crate", "v1"))[0] == "second"
+    l1 = tiered.stats()["l1"]
+    assert (l1["lookups"], l1["hits"]) == (3, 1)
+
+
+def test_cache_store_scopes_entries(database, corpus):
+    store = make_store(database, corpus)
+    store.update("q", "prompt-a", "answer")
+    assert store.lookup("q", "prompt-a") == "answer"
+    assert store.lookup("q", "prompt-b") is None
+    assert store.lookup("q") is None
+
+
+def test_cache_store_treats_old_corpus_entries_as_stale(database, corpus):
+    store = make_store(database, corpus)
+    store.update("q", "answer")
+    corpus.bump()
+    assert store.lookup("q") is None
+    result = store.compact()
+    assert result["stale"] == 1
+    assert store.count() == 0
+
+
+def test_cache_store_compact_deletes_expired_entries(database, corpus):
+    store = make_store(database, corpus, ttl=60)
+    store.update("old", "answer")
+    store.update("new", "answer")
+    database.execute("UPDATE llm_cache SET created_at = created_at - 120 WHERE prompt = 'old'")
+    assert store.lookup("old") is None
+    result = store.compact()
+    assert result["expired"] == 1
+    assert store.count() == 1
+    assert store.lookup("new") == "answer"
+
+
+@pytest.mark.parametrize("policy", ["lru", "lfu"])
+def test_cache_store_compact_evicts_above_max_entries(database, corpus, policy):
+    store = make_store(database, corpus, max_entries=2, policy=policy)
+    for prompt in ("a", "b", "c"):
+        store.update(prompt, "answer")
+    # b is hit most often and c most recently; a is the eviction victim for both policies
+    for prompt in ("b", "b", "c"):
+        assert store.lookup(prompt) == "answer"
+    result = store.compact()
+    assert result["hits_flushed"] == 2
+    assert result["evicted"] == 1
+    assert store.lookup("a") is None
+    assert store.lookup("b") == "answer"
+    assert store.lookup("c") == "answer"
+    assert store.stats()["evicted"] == 1
+
+
+def test_cache_store_rejects_unknown_policy(database, corpus):
+    with pytest.raises(ValueError):
+        make_store(database, corpus, policy="fifo")
+
+
+def test_answers_are_stamped_with_the_version_they_were_computed_under(database, corpus):
+    store = make_store(database, corpus)
+    tiered = TieredCache(store, LRUCache(10, 60), corpus=corpus)
+    retrieved_under = corpus.current()
+    # Ingestion finishes while the answer is being generated
+    corpus.bump()
+    tiered.update("q", "v1", "stale answer", corpus_version=retrieved_under)
+    assert len(tiered.l1) == 0
+    assert store.lookup("q", "v1") is None
+
+    tiered.update("q", "v1", "fresh answer", corpus_version=corpus.current())
+    assert tiered.lookup("q", "v1") == "fresh answer"
+    assert store.lookup("q", "v1") == "fresh answer"
+
+
+def test_drop_legacy_tables_keeps_configured_names(database):
+    for table_name in ("llm_cache", "semantic_cache"):
+        database.execute(f"CREATE TABLE {table_name} (id TEXT)")
+    assert drop_legacy_tables(database.execute, keep=("semantic_cache",)) == ["llm_cache"]
+    tables = {row[0] for row in database.fetch_all("SELECT name FROM sqlite_master")}
+    assert "llm_cache" not in tables and "semantic_cache" in tables
+    # Running it again is harmless
+    assert drop_legacy_tables(database.execute) == ["llm_cache", "semantic_cache"]
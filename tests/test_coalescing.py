@@ -0,0 +1,131 @@
+"""Single-flight sharing of identical and near-duplicate queries."""
+import asyncio
+
+import pytest
+
+from app.chatbot.coalescing import QueryCoalescer
+from app.config import CoalescingConfig
+
+
+def make_coalescer(**kwargs) -> QueryCoalescer:
+    options = {"enabled": True, "semantic_enabled": False, "semantic_threshold": 0.95,
+               "window_seconds": 0}
+    options.update(kwargs)
+    return QueryCoalescer(CoalescingConfig(**options))
+
+
+class Pipeline:
+    """Counts runs; each run waits until ``release`` is set."""
+
+    def __init__(self):
+        self.runs = 0
+        self.release = asyncio.Event()
+
+    async def __call__(self):
+        self.runs += 1
+        await self.release.wait()
+        return f"answer {self.runs}"
+
+
+def test_concurrent_identical_queries_share_one_run():
+    async def scenario():
+        coalescer = make_coalescer()
+        pipeline = Pipeline()
+        leader = asyncio.create_task(coalescer.run("What is RAG?", pipeline))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(coalescer.run("  what is   rag? ", pipeline))
+        await asyncio.sleep(0)
+        assert coalescer.in_flight == 1
+        pipeline.release.set()
+        return await leader, await follower, pipeline.runs
+
+    leader, follower, runs = asyncio.run(scenario())
+    assert leader == ("answer 1", False)
+    assert follower == ("answer 1", True)
+    assert runs == 1
+
+
+def test_finished_result_is_shared_only_within_the_window():
+    async def scenario():
+        coalescer = make_coalescer(window_seconds=60)
+        pipeline = Pipeline()
+        pipeline.release.set()
+        first = await coalescer.run("q", pipeline)
+        second = await coalescer.run("q", pipeline)
+        coalescer.forget_finished()
+        third = await coalescer.run("q", pipeline)
+        return first, second, third
+
+    first, second, third = asyncio.run(scenario())
+    assert first == ("answer 1", False)
+    assert second == ("answer 1", True)
+    assert third == ("answer 2", False)
+
+
+def test_failed_run_fails_followers_and_is_not_kept():
+    async def scenario():
+        coalescer = make_coalescer(window_seconds=60)
+        gate = asyncio.Event()
+
+        async def failing():
+            await gate.wait()
+            raise RuntimeError("backend down")
+
+        leader = asyncio.create_task(coalescer.run("q", failing))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(coalescer.run("q", failing))
+        await asyncio.sleep(0)
+        gate.set()
+        results = await asyncio.gather(leader, follower, return_exceptions=True)
+
+        async def working():
+            return "recovered"
+
+        return results, await coalescer.run("q", working)
+
+    results, retry = asyncio.run(scenario())
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert retry == ("recovered", False)
+
+
+def test_cancelled_leader_does_not_fail_followers():
+    async def scenario():
+        coalescer = make_coalescer()
+        pipeline = Pipeline()
+        leader = asyncio.create_task(coalescer.run("q", pipeline))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(coalescer.run("q", pipeline))
+        await asyncio.sleep(0)
+        leader.cancel()
+        pipeline.release.set()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await follower
+
+    assert asyncio.run(scenario()) == ("answer 1", True)
+
+
+def test_near_duplicate_embeddings_join_when_semantic_matching_is_on():
+    async def scenario(semantic_enabled):
+        coalescer = make_coalescer(semantic_enabled=semantic_enabled)
+        pipeline = Pipeline()
+        leader = asyncio.create_task(coalescer.run("what is rag", pipeline, [1.0, 0.0]))
+        await asyncio.sleep(0)
+        near = asyncio.create_task(coalescer.run("what's rag", pipeline, [0.99, 0.02]))
+        far = asyncio.create_task(coalescer.run("deploy steps", pipeline, [0.0, 1.0]))
+        await asyncio.sleep(0)
+        pipeline.release.set()
+        return [shared for _, shared in await asyncio.gather(leader, near, far)]
+
+    assert asyncio.run(scenario(True)) == [False, True, False]
+    assert asyncio.run(scenario(False)) == [False, False, False]
+
+
+def test_disabled_coalescer_always_runs():
+    async def scenario():
+        coalescer = make_coalescer(enabled=False)
+        pipeline = Pipeline()
+        pipeline.release.set()
+        return await asyncio.gather(coalescer.run("q", pipeline), coalescer.run("q", pipeline))
+
+    assert asyncio.run(scenario()) == [("answer 1", False), ("answer 2", False)]
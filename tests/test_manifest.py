@@ -0,0 +1,148 @@
+"""Ingestion manifest storage, chunk reference counting and directory diffing."""
+import asyncio
+import os
+import types
+
+import pytest
+
+from app.config import Config, IngestionConfig, RetrieverConfig
+from app.data.corpus import CorpusVersion
+from app.data.manifest import (
+    IngestionManifest, ManifestEntry, chunk_hash, chunk_references, content_hash
+)
+from app.data.processor import DataProcessor
+from benchmarks.fakes import FakeEmbeddingServer, FakeVectorStore
+
+
+def make_manifest(database) -> IngestionManifest:
+    manifest = IngestionManifest(database.execute, database.fetch_all)
+    manifest.create_tables()
+    return manifest
+
+
+def test_manifest_round_trips_files_and_chunks(database):
+    manifest = make_manifest(database)
+    entry = ManifestEntry("docs/a.md", 1.5, 10, content_hash(b"a"), ["c1", "c2"])
+    manifest.save(entry)
+    loaded = manifest.load()
+    assert list(loaded) == ["docs/a.md"]
+    assert loaded["docs/a.md"].unchanged(1.5, 10)
+    assert not loaded["docs/a.md"].unchanged(2.0, 10)
+    assert sorted(loaded["docs/a.md"].chunk_hashes) == ["c1", "c2"]
+
+
+def test_manifest_save_replaces_chunks_only_when_they_changed(database):
+    manifest = make_manifest(database)
+    manifest.save(ManifestEntry("a.md", 1.0, 10, "h1", ["c1", "c2"]))
+    # Touched but same content: metadata changes, chunk rows are kept
+    manifest.save(ManifestEntry("a.md", 2.0, 10, "h1", []), chunks_changed=False)
+    entry = manifest.load()["a.md"]
+    assert entry.mtime == 2.0
+    assert sorted(entry.chunk_hashes) == ["c1", "c2"]
+
+    manifest.save(ManifestEntry("a.md", 3.0, 12, "h2", ["c3"]))
+    assert manifest.load()["a.md"].chunk_hashes == ["c3"]
+
+
+def test_manifest_delete_forgets_files(database):
+    manifest = make_manifest(database)
+    for source in ("a.md", "b.md", "c.md"):
+        manifest.save(ManifestEntry(source, 1.0, 1, source, [source + "-chunk"]))
+    manifest.delete(["a.md", "c.md"])
+    assert list(manifest.load()) == ["b.md"]
+    assert database.fetch_all("SELECT source FROM ingestion_chunks") == [("b.md",)]
+
+
+def test_manifest_saves_more_chunks_than_one_statement_holds(database):
+    manifest = make_manifest(database)
+    hashes = [chunk_hash(str(i)) for i in range(1203)]
+    manifest.save(ManifestEntry("big.md", 1.0, 1, "h", hashes))
+    assert sorted(manifest.load()["big.md"].chunk_hashes) == sorted(hashes)
+
+
+def test_chunk_references_count_files_not_duplicates():
+    entries = [
+        ManifestEntry("a.md", 1.0, 1, "ha", ["shared", "only-a", "only-a"]),
+        ManifestEntry("b.md", 1.0, 1, "hb", ["shared"]),
+    ]
+    references = chunk_references(entries)
+    assert references == {"shared": 2, "only-a": 1}
+
+
+def test_chunk_hash_is_content_addressed():
+    assert chunk_hash("same text") == chunk_hash("same text")
+    assert chunk_hash("same text") != chunk_hash("other text")
+
+
+def make_processor(database):
+    config = Config(
+        ingestion=IngestionConfig(file_glob="**/*.txt", chunk_size=200, chunk_overlap=0,
+                                  workers=1, chunk_batch_size=16),
+        retriever=RetrieverConfig(type="similarity"),
+    )
+    embeddings = FakeEmbeddingServer(config.embeddings, dim=8, batch_latency=0,
+                                     per_text_latency=0)
+    store = FakeVectorStore(embeddings, latency=0)
+    corpus = CorpusVersion(database.execute, database.fetch_all)
+    resources = types.SimpleNamespace(
+        embeddings=embeddings, execute=database.execute, fetch_all=database.fetch_all,
+        corpus=corpus
+    )
+    return DataProcessor(config, resources, vector_store=store), store, corpus
+
+
+def test_directory_sync_only_touches_what_changed(database, tmp_path):
+    data, store, corpus = make_processor(database)
+    docs = tmp_path / "docs"
+    docs.mkdir()
+    (docs / "a.txt").write_text("alpha " * 20)
+    (docs / "b.txt").write_text("beta " * 20)
+    (docs / "c.txt").write_text("alpha " * 20)
+
+    def sync():
+        return asyncio.run(data.process_directory(str(docs)))
+
+    first = sync()
+    assert (first.files_added, first.chunks_done, first.chunks_deduplicated) == (3, 2, 1)
+    assert len(store) == 2
+    version = corpus.current()
+
+    second = sync()
+    assert (second.files_skipped, second.chunks_done, second.chunks_deleted) == (3, 0, 0)
+    assert corpus.current() == version
+
+    # b changes, a is only touched, c (sharing a's chunk) is removed
+    (docs / "b.txt").write_text("gamma " * 20)
+    os.utime(docs / "a.txt", (1, 1))
+    (docs / "c.txt").unlink()
+    third = sync()
+    assert (third.files_updated, third.files_skipped, third.files_deleted) == (1, 1, 1)
+    assert (third.chunks_done, third.chunks_deleted) == (1, 1)
+    assert len(store) == 2
+    assert corpus.current() == version + 1
+    assert sorted(data.manifest.load()) == sorted(
+        str((docs / name).resolve()) for name in ("a.txt", "b.txt")
+    )
+
+
+def test_sync_interrupted_after_storing_chunks_recovers(database, tmp_path, monkeypatch):
+    data, store, _ = make_processor(database)
+    docs = tmp_path / "docs"
+    docs.mkdir()
+    (docs / "a.txt").write_text("alpha " * 20)
+
+    def interrupted(entry, chunks_changed=True):
+        raise RuntimeError("interrupted")
+
+    # Chunks are stored, but the run stops before its manifest rows are written
+    with monkeypatch.context() as patch:
+        patch.setattr(data.manifest, "save", interrupted)
+        with pytest.raises(RuntimeError, match="interrupted"):
+            asyncio.run(data.process_directory(str(docs)))
+    assert len(store) == 1
+    assert data.manifest.load() == {}
+
+    job = asyncio.run(data.process_directory(str(docs)))
+    assert (job.files_added, job.chunks_done) == (1, 1)
+    assert len(store) == 1
+    assert list(data.manifest.load()) == [str((docs / "a.txt").resolve())]
@@ -0,0 +1,85 @@
+"""Packing retrieved chunks into the prompt's token budget."""
+from langchain.schema import Document
+
+from app.chatbot.packing import (
+    ContextPacker, context_window, estimate_tokens, trim_overlap, truncate
+)
+from app.config import ContextConfig
+
+
+def words(start: int, count: int) -> str:
+    return " ".join(f"word{i}" for i in range(start, start + count))
+
+
+def make_packer(max_documents: int = 4, **kwargs) -> ContextPacker:
+    options = {"token_budget": 1000, "reserved_tokens": 0, "dedupe_threshold": 0.8,
+               "mmr_enabled": False}
+    options.update(kwargs)
+    return ContextPacker(ContextConfig(**options), "llama2", max_documents)
+
+
+def docs(*texts) -> list:
+    return [Document(page_content=text, metadata={"rank": i}) for i, text in enumerate(texts)]
+
+
+def test_budget_comes_from_the_model_window_unless_configured():
+    assert context_window("llama2:13b") == 4096
+    assert context_window("openai/gpt-4-32k-0613") == 32768
+    assert context_window("unknown-model") == 4096
+    assert make_packer(token_budget=0, reserved_tokens=1024).budget == 4096 - 1024
+    assert make_packer(token_budget=300).budget == 300
+
+
+def test_near_duplicates_of_better_ranked_chunks_are_dropped():
+    text = words(0, 50)
+    packed = make_packer().pack(docs(text, text + " extra", words(100, 50)))
+    assert [doc.metadata["rank"] for doc in packed.documents] == [0, 2]
+    assert packed.duplicates == 1
+    assert packed.candidates == 3
+
+
+def test_splitter_overlap_is_trimmed_from_neighbouring_chunks():
+    first, second = words(0, 40), words(30, 40)
+    overlap = words(30, 10)
+    assert trim_overlap(second, first) == words(40, 30)
+    packed = make_packer(dedupe_threshold=1.0).pack(docs(first, second))
+    assert packed.trimmed == 1
+    assert packed.documents[1].page_content == words(40, 30)
+    assert overlap not in packed.documents[1].page_content
+
+
+def test_chunks_stop_at_the_token_budget_and_the_last_is_truncated():
+    chunks = [words(i * 100, 60) for i in range(4)]
+    budget = estimate_tokens(chunks[0]) + estimate_tokens(chunks[1]) + 50
+    packed = make_packer(token_budget=budget).pack(docs(*chunks))
+    assert packed.packed_tokens <= budget
+    assert [doc.metadata["rank"] for doc in packed.documents] == [0, 1, 2]
+    assert packed.documents[2].page_content == truncate(chunks[2], 50)
+    assert (packed.trimmed, packed.over_budget) == (1, 1)
+    assert packed.retrieved_tokens == sum(estimate_tokens(chunk) for chunk in chunks)
+
+
+def test_small_leftover_budget_is_not_filled_with_a_stub():
+    chunks = [words(0, 60), words(100, 60)]
+    budget = estimate_tokens(chunks[0]) + 10
+    packed = make_packer(token_budget=budget).pack(docs(*chunks))
+    assert len(packed.documents) == 1
+    assert packed.over_budget == 1
+
+
+def test_max_documents_caps_the_packed_chunks():
+    packed = make_packer(max_documents=2).pack(docs(*(words(i * 100, 20) for i in range(5))))
+    assert len(packed.documents) == 2
+    assert packed.over_budget == 3
+
+
+def test_mmr_prefers_diverse_chunks():
+    vectors = {"a": [0.96, 0.28, 0.0], "a2": [0.94, 0.34, 0.0], "b": [0.9, -0.2, 0.39]}
+    texts = [f"{name} " + words(i * 100, 20) for i, name in enumerate(vectors)]
+
+    def embed_documents(batch):
+        return [vectors[text.split()[0]] for text in batch]
+
+    packer = make_packer(mmr_enabled=True, mmr_lambda=0.5)
+    packed = packer.pack(docs(*texts), [1.0, 0.0, 0.0], embed_documents)
+    assert [doc.metadata["rank"] for doc in packed.documents] == [0, 2, 1]
@@ -0,0 +1,114 @@
+"""Routing, hedging and failover of the LLM backend pool."""
+import asyncio
+import time
+from typing import Any, List, Optional
+
+import pytest
+from langchain.prompts.base import StringPromptValue
+
+from app.config import LLMPoolConfig
+from app.llms.pool import LLMBackend, LLMPool
+from benchmarks.fakes import FakeLLM
+
+PROMPTS = [StringPromptValue(text="What is RAG?")]
+
+
+class FailingLLM(FakeLLM):
+    """FakeLLM whose calls fail after the first-token latency."""
+
+    async def _acall(self, prompt: str, stop: Optional[List[str]] = None,
+                     run_manager=None, **kwargs: Any) -> str:
+        await asyncio.sleep(self._first_token_latency())
+        raise RuntimeError("backend down")
+
+    async def _astream(self, prompt: str, stop: Optional[List[str]] = None,
+                       run_manager=None, **kwargs: Any):
+        await asyncio.sleep(self._first_token_latency())
+        raise RuntimeError("backend down")
+        yield
+
+
+def fake(first_token_latency: float = 0.01, cls=FakeLLM) -> FakeLLM:
+    return cls(first_token_latency=first_token_latency, tokens_per_second=1000, answer_tokens=3)
+
+
+def make_pool(*llms, **kwargs) -> LLMPool:
+    options = {"max_concurrency": 2, "max_attempts": 2, "hedge_percentile": 0,
+               "hedge_min_samples": 5, "unhealthy_after_failures": 2,
+               "health_check_interval": 0, "health_check_timeout": 1}
+    options.update(kwargs)
+    backends = [LLMBackend(f"llm-{i}", llm, options["max_concurrency"])
+                for i, llm in enumerate(llms)]
+    return LLMPool(backends, LLMPoolConfig(**options))
+
+
+def generate(pool: LLMPool):
+    return asyncio.run(pool.agenerate_prompt(PROMPTS))
+
+
+def test_calls_are_spread_across_equally_loaded_backends():
+    first, second = fake(), fake()
+    pool = make_pool(first, second)
+
+    async def scenario():
+        return await asyncio.gather(*(pool.agenerate_prompt(PROMPTS) for _ in range(4)))
+
+    results = asyncio.run(scenario())
+    assert len(results) == 4
+    assert (first.calls, second.calls) == (2, 2)
+    assert all(backend.outstanding == 0 for backend in pool.backends)
+
+
+def test_errors_fail_over_to_another_backend():
+    broken, healthy = fake(cls=FailingLLM), fake()
+    pool = make_pool(broken, healthy)
+    result = generate(pool)
+    assert result.generations[0][0].text
+    assert (broken.calls, healthy.calls) == (1, 1)
+    assert pool.backends[0].failures == 1
+
+
+def test_failing_backend_is_marked_unhealthy_and_skipped():
+    broken, healthy = fake(cls=FailingLLM), fake()
+    pool = make_pool(broken, healthy)
+    for _ in range(4):
+        generate(pool)
+    assert not pool.backends[0].healthy
+    assert broken.calls == 2
+    assert healthy.calls == 4
+
+
+def test_gives_up_after_max_attempts():
+    pool = make_pool(fake(cls=FailingLLM), fake(cls=FailingLLM), fake(), max_attempts=2)
+    with pytest.raises(RuntimeError, match="backend down"):
+        generate(pool)
+
+
+def test_slow_call_is_hedged_on_another_backend():
+    straggler, fast = fake(first_token_latency=2.0), fake()
+    pool = make_pool(straggler, fast, hedge_percentile=50, hedge_min_samples=5)
+    # A history of fast answers puts the hedge point at 10ms
+    pool.backends[0].latencies.extend([0.01] * 5)
+    start_time = time.perf_counter()
+    result = generate(pool)
+    assert time.perf_counter() - start_time < 1.0
+    assert result.generations[0][0].text
+    assert (straggler.calls, fast.calls) == (1, 1)
+    assert all(backend.outstanding == 0 for backend in pool.backends)
+
+
+def test_stream_fails_over_before_the_first_chunk():
+    broken, healthy = fake(cls=FailingLLM), fake()
+    pool = make_pool(broken, healthy)
+
+    async def scenario():
+        return [chunk async for chunk in pool.astream("What is RAG?")]
+
+    chunks = asyncio.run(scenario())
+    assert len(chunks) == 3
+    assert (broken.calls, healthy.calls) == (1, 1)
+
+
+def test_pool_needs_a_backend():
+    with pytest.raises(ValueError):
+        LLMPool([], LLMPoolConfig())
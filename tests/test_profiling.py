@@ -0,0 +1,76 @@
+"""Per-request profiles: only the profiled request's own work is recorded."""
+import asyncio
+import os
+import pstats
+
+from app.config import ProfilingConfig
+from app.monitoring import profiling
+from app.monitoring.profiling import Profiler, install_task_factory, profiled, track
+
+
+def profiled_work():
+    return sum(range(100))
+
+
+def other_work():
+    return sum(range(100))
+
+
+def calls(profile_stats: pstats.Stats, name: str) -> int:
+    return sum(stat[1] for func, stat in profile_stats.stats.items() if func[2] == name)
+
+
+def test_session_profiles_own_tasks_and_worker_calls_only():
+    async def child():
+        profiled_work()
+
+    async def request():
+        for _ in range(5):
+            profiled_work()
+            await asyncio.sleep(0)
+        # Tasks the request starts, e.g. a coalesced flight, are part of it
+        await asyncio.create_task(child())
+        await asyncio.get_running_loop().run_in_executor(None, profiled(profiled_work))
+
+    async def neighbour():
+        for _ in range(10):
+            other_work()
+            await asyncio.sleep(0)
+
+    async def scenario():
+        install_task_factory()
+        busy = asyncio.create_task(neighbour())
+        session = profiling.ProfileSession()
+        token = profiling._session.set(session)
+        try:
+            await track(request())
+        finally:
+            profiling._session.reset(token)
+            session.closed = True
+        await busy
+        return session
+
+    session = asyncio.run(scenario())
+    loop_stats = pstats.Stats(session.loop_profiler)
+    assert calls(loop_stats, "profiled_work") == 6
+    assert calls(loop_stats, "other_work") == 0
+    assert len(session.profilers) == 1
+    assert calls(pstats.Stats(session.profilers[0]), "profiled_work") == 1
+
+
+def test_one_profile_runs_at_a_time(tmp_path):
+    config = ProfilingConfig(enabled=True, sample_rate=0, output_dir=str(tmp_path),
+                             max_profiles=5, top_functions=5)
+    profiler = Profiler(config)
+
+    async def scenario():
+        async with profiler.session("query", "/query", "header") as first:
+            async with profiler.session("query", "/query", "header") as second:
+                await track(asyncio.sleep(0))
+        return first, second
+
+    first, second = asyncio.run(scenario())
+    assert second is None
+    assert first.status == "completed"
+    assert first.path is not None and os.path.exists(first.path)
+    assert profiler.get(first.id) is first
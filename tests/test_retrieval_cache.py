@@ -0,0 +1,74 @@
+"""Search result caching and its invalidation on corpus changes."""
+import asyncio
+
+from langchain.schema import Document
+
+from app.config import Config, RetrieverConfig
+from app.data.corpus import CorpusVersion
+from app.data.retrieval_cache import RetrievalCache
+
+
+def make_cache(database, **kwargs) -> RetrievalCache:
+    options = {"cache_max_entries": 100, "cache_ttl_seconds": 60,
+               "cache_similarity_threshold": 0.95}
+    options.update(kwargs)
+    corpus = CorpusVersion(database.execute, database.fetch_all)
+    return RetrievalCache(RetrieverConfig(**options), corpus)
+
+
+def results(*texts):
+    return [(Document(page_content=text), 0.9) for text in texts]
+
+
+def test_exact_and_paraphrased_queries_hit(database):
+    cache = make_cache(database)
+    cache.update("What is RAG?", [1.0, 0.0], 2, results("a", "b"))
+    assert cache.lookup("  what is  rag? ", [0.0, 1.0], 2) == results("a", "b")
+    assert cache.lookup("explain rag", [0.99, 0.05], 1) == results("a")
+    assert cache.lookup("deployments", [0.0, 1.0], 2) is None
+    # Fewer chunks than asked for is a miss
+    assert cache.lookup("What is RAG?", [1.0, 0.0], 3) is None
+
+
+def test_corpus_change_drops_every_entry(database):
+    cache = make_cache(database)
+    cache.update("q", [1.0, 0.0], 2, results("a", "b"))
+    assert cache.lookup("q", [1.0, 0.0], 2) is not None
+    cache.corpus.bump()
+    assert cache.lookup("q", [1.0, 0.0], 2) is None
+    assert cache.lookup("paraphrase", [1.0, 0.0], 2) is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_results_searched_before_a_corpus_change_are_not_stored(database):
+    cache = make_cache(database)
+    version = cache.corpus.current()
+    cache.corpus.bump()
+    cache.update("q", [1.0, 0.0], 2, results("stale"), corpus_version=version)
+    assert cache.lookup("q", [1.0, 0.0], 2) is None
+    cache.update("q", [1.0, 0.0], 2, results("fresh"), corpus_version=version + 1)
+    assert cache.lookup("q", [1.0, 0.0], 2) == results("fresh")
+
+
+def test_backend_does_not_cache_a_search_overtaken_by_ingestion(make_backend):
+    config = Config(retriever=RetrieverConfig(cache_similarity_threshold=0))
+    backend = make_backend(config=config)
+    corpus = backend.data_processor.resources.corpus
+    backend.retrieval_cache = RetrievalCache(config.retriever, corpus)
+    processor = backend.data_processor
+    search = processor.asearch_with_scores_by_vector
+    searches = 0
+
+    async def search_during_ingestion(embedding, k=4):
+        nonlocal searches
+        searches += 1
+        found = await search(embedding, k=k)
+        if searches == 1:
+            corpus.bump()
+        return found
+
+    processor.asearch_with_scores_by_vector = search_during_ingestion
+    for _ in range(3):
+        asyncio.run(backend._retrieve("what is rag"))
+    # The first search raced an ingestion; the second is cached and reused
+    assert searches == 2
@@ -0,0 +1,89 @@
+"""Cache warming: query selection and reuse of logged answers."""
+import asyncio
+import time
+
+from app.chatbot.warming import CacheWarmer, WarmingRun
+from app.config import InteractionLogConfig, WarmingConfig
+from app.monitoring.interactions import InteractionWriter
+
+
+def log_interactions(database, rows) -> None:
+    """Write ``(query, response, cache_type, prompt_version)`` rows the way the app does."""
+    writer = InteractionWriter(InteractionLogConfig(), database.execute)
+
+    async def scenario():
+        for query, response, cache_type, prompt_version in rows:
+            await writer.record(query, response, 0.5, cache_type, prompt_version=prompt_version)
+        await writer.close()
+
+    asyncio.run(scenario())
+
+
+def make_warmer(database, corpus, **kwargs) -> CacheWarmer:
+    database.execute(
+        "CREATE TABLE IF NOT EXISTS interactions (query TEXT, response TEXT, "
+        "process_time REAL, cache_type TEXT, timestamp REAL, prompt_version TEXT)"
+    )
+    options = {"min_requests": 1, "generations_per_second": 1000, "generation_concurrency": 4}
+    options.update(kwargs)
+    return CacheWarmer(WarmingConfig(**options), database.fetch_all, corpus)
+
+
+def warm(warmer: CacheWarmer, chatbot) -> WarmingRun:
+    return asyncio.run(warmer.warm(chatbot, WarmingRun(strategy="frequent", top_n=10)))
+
+
+def test_frequent_queries_come_first(make_backend, database):
+    corpus = make_backend().data_processor.resources.corpus
+    warmer = make_warmer(database, corpus, min_requests=2)
+    log_interactions(database, [
+        ("rare", "a", "none", "v1"),
+        ("popular", "a", "none", "v1"),
+        ("popular", "a", "standard", "v1"),
+        ("popular", "a", "standard", "v1"),
+        ("common", "a", "none", "v1"),
+        ("common", "a", "standard", "v1"),
+    ])
+    assert warmer.select_queries("frequent", 10) == ["popular", "common"]
+    assert warmer.select_queries("frequent", 1) == ["popular"]
+
+
+def test_logged_answers_need_the_current_prompt_version_and_corpus(make_backend, database):
+    corpus = make_backend().data_processor.resources.corpus
+    warmer = make_warmer(database, corpus)
+    log_interactions(database, [
+        ("what is rag", "old answer", "none", "v1"),
+        ("what is rag", "new answer", "none", "v2"),
+        ("cache lifetime", "other prompt", "none", "v1"),
+        ("deployments", "unversioned", "none", None),
+    ])
+    queries = ["what is rag", "cache lifetime", "deployments"]
+    assert warmer.logged_answers(queries, "v2") == {"what is rag": "new answer"}
+    assert warmer.logged_answers(queries, "v1") == {
+        "what is rag": "old answer", "cache lifetime": "other prompt"
+    }
+
+    time.sleep(0.01)
+    corpus.bump()
+    assert warmer.logged_answers(queries, "v2") == {}
+
+
+def test_warming_regenerates_answers_logged_under_another_prompt(make_backend, database):
+    chatbot = make_backend()
+    warmer = make_warmer(database, chatbot.data_processor.resources.corpus)
+    current = chatbot.prompt_version
+    log_interactions(database, [
+        ("what is rag", "still valid", "none", current),
+        ("cache lifetime", "from the old prompt", "none", "old-version"),
+    ])
+    run = warm(warmer, chatbot)
+    assert (run.queries_selected, run.logged, run.generated) == (2, 1, 1)
+    assert chatbot.llm.calls == 1
+    assert chatbot.standard_cache.lookup("what is rag", current) == "still valid"
+    answer = chatbot.standard_cache.lookup("cache lifetime", current)
+    assert answer and answer != "from the old prompt"
+
+    # After a prompt change nothing logged so far is reused
+    chatbot.update_prompt("Context: {context}\nQuestion: {question}\nAnswer briefly: ")
+    run = warm(warmer, chatbot)
+    assert (run.logged, run.generated) == (0, 2)